@@ -5,20 +5,37 @@ also offers the possibility to chain multiple agents together or pipe in input f
 postprocessors can be used to format the response from the model.
 """
 
+import copy
+import os
+import queue
 import random
 import re
-from typing import Any, Callable, Type, TypeVar, cast
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Iterable, Iterator, Optional, Type, TypeVar, cast
 import functools
+from pathlib import Path
 
 from torch import seed
+from agentsystem.agents.postprocessor.streaming import RegexStreamMatcher, StreamingPostprocessor
 from agentsystem.agents.preprocessor.preprocessor import (
     CallablePreprocessor,
     Preprocessor,
+    SimpleTemplatePreprocessor,
 )
 from agentsystem.agents.tools.tool import Tool
+from agentsystem.agents.tools.tool_cache import ToolCache
+from agentsystem.agents.tools.tool_selector import ToolSelector
+from agentsystem.agents.voting import MajorityVoter, Vote
+from agentsystem.models.grammar.constraints import (
+    Constraint,
+    UnsupportedConstraint,
+    parse_constrained,
+    regex_constraint,
+)
 from agentsystem.models.Response import Response
 
-from agentsystem.models.Model import ConsoleInputModel, Model
+from agentsystem.models.Model import BatchResult, ConsoleInputModel, Model
 
 
 class Agent(Tool):
@@ -62,12 +79,58 @@ class Agent(Tool):
             (system, prompt, prefix), empty = self.preprocessor(
                 system_message, prompt_message, prefix_message
             )
+            if isinstance(self.postprocessor, StreamingPostprocessor):
+                stream = self.postprocessor.start()
+                self.model.stream_run(system, prompt, prefix, stream.feed, **self.extra_args)()
+                return stream.finish()
             response = self.model.run(system, prompt, prefix, **self.extra_args)
-            args, kwargs = self.postprocessor(response())
-            return args, kwargs
+            return self.postprocessor(response())
 
         return Response(execution)
 
+    def run_batch(self, inputs, max_concurrency: int = 8, **batch_args) -> list[BatchResult]:
+        """Runs the agent over many inputs with the model's batch path, e.g. concurrent requests for HTTP backends.
+
+        Errors of the preprocessor, the model or the postprocessor only fail the item they occur in.
+
+        Args:
+            inputs (Iterable[str | tuple[str, str, str] | dict]): Prompt messages, (system, prompt, prefix)
+                triples or dicts with system_message, prompt_message and prefix_message keys.
+            max_concurrency (int): Maximum number of items the model runs at once. Defaults to 8.
+            **batch_args: Passed to the model's run_batch, e.g. offline=True for OpenAIModel.
+
+        Returns:
+            list[BatchResult]: The postprocessed result of every input, in order.
+        """
+        results: list[BatchResult] = []
+        pending = []
+        for item in inputs:
+            if isinstance(item, str):
+                item = ("", item, "")
+            elif isinstance(item, dict):
+                item = tuple(item.get(key, "") for key in ("system_message", "prompt_message", "prefix_message"))
+            try:
+                (system, prompt, prefix), _ = self.preprocessor(*item)
+                pending.append((len(results), (system, prompt, prefix)))
+                results.append(BatchResult())
+            except Exception as e:
+                results.append(BatchResult(error=e))
+
+        outputs = self.model.run_batch(
+            [messages for _, messages in pending],
+            max_concurrency=max_concurrency,
+            **{**self.extra_args, **batch_args},
+        )
+        for (index, _), output in zip(pending, outputs):
+            if not output.ok:
+                results[index] = output
+                continue
+            try:
+                results[index] = BatchResult(value=self.postprocessor(output.value))
+            except Exception as e:
+                results[index] = BatchResult(error=e)
+        return results
+
 
 class ChatAgent(Agent):
     """Differs from Agent in that it works with a list of messages instead of system, prompt and prefix messages."""
@@ -99,19 +162,57 @@ class ChatAgent(Agent):
 
 class ParsedAgent(Agent):
     """
-    docstring
+    Parses the response with re.findall(regex_pattern). On backends that support it the pattern is
+    compiled into a grammar or JSON schema the model is constrained to, so the response always parses.
     """
 
-    def __init__(self, regex_pattern, **parameter_list):
+    def __init__(
+        self,
+        regex_pattern,
+        constrain: bool = True,
+        max_items: Optional[int] = None,
+        on_item: Optional[Callable[[Any], Any]] = None,
+        **parameter_list,
+    ):
+        """Creates a ParsedAgent.
+
+        Args:
+            regex_pattern (str): The pattern whose findall result is the output of the agent.
+            constrain (bool): Constrain generation to the pattern if the model supports it. Defaults to True.
+            max_items (Optional[int]): Parse while streaming and stop the model after this many matches.
+            on_item (Optional[Callable[[Any], Any]]): Parse while streaming and pass every match on as soon as it is complete.
+            **parameter_list: The arguments of Agent.
+        """
         super().__init__(**parameter_list)
         self.regex_pattern = regex_pattern
-        self.postprocessor = lambda x: re.compile(regex_pattern).findall(x)
+        self.constraint = self._constraint(regex_pattern) if constrain else None
+        if self.constraint is not None:
+            self.extra_args.update(self.model.constraint_args(self.constraint))
+        streaming = max_items is not None or on_item is not None
+        if streaming and (self.constraint is None or self.constraint.format == "gbnf"):
+            self.postprocessor = RegexStreamMatcher(regex_pattern, max_items=max_items, on_item=on_item)
+        else:
+            self.postprocessor = functools.partial(parse_constrained, re.compile(regex_pattern), self.constraint)
+
+    def _constraint(self, regex_pattern) -> Optional[Constraint]:
+        """The constraint in the first format the model supports, None to fall back to parsing free text."""
+        for constraint_format in getattr(self.model, "constraint_formats", ()):
+            try:
+                return regex_constraint(regex_pattern, constraint_format)
+            except UnsupportedConstraint:
+                continue
+        return None
 
 
 A = TypeVar("A")
 
 
 class MultiShotAgent[A: Agent](Agent, metaclass=type):
+    """
+    Runs an agent with a fresh seed per run. sample launches several seeded runs concurrently and
+    votes on their parsed outputs, cancelling the outstanding runs once the vote is decided.
+    """
+
     seed_generator = iter(lambda: random.randint(1, 99999), None)
 
     def __new__(
@@ -122,16 +223,84 @@ class MultiShotAgent[A: Agent](Agent, metaclass=type):
         **kwargs: Model | Preprocessor | Callable[[str], Any] | Any,
     ) -> "MultiShotAgent":
         dynamic_multi_agent = type(
-            f"MultiShot{agent.__name__}", (agent,), {"run": cls.run}
+            f"MultiShot{agent.__name__}",
+            (agent,),
+            {"run": cls.run, "sample": cls.sample, "_seeded": cls._seeded},
         )
         inst = cast(MultiShotAgent, dynamic_multi_agent(*args, **kwargs))
         inst.seed_generator = seed_generator
         return inst
 
+    def _seeded(self, seed: int) -> "MultiShotAgent":
+        """A shallow copy running with seed, so concurrent runs do not share extra_args."""
+        seeded = copy.copy(self)
+        seeded.extra_args = {**self.extra_args, "seed": seed}
+        return seeded
+
     def run(self, **kwargs):
-        seed = next(self.seed_generator)
-        self.extra_args["seed"] = seed
-        return super().run(**kwargs)
+        seeded = self._seeded(next(self.seed_generator))
+        # the class is created in __new__, so zero argument super() does not apply
+        return super(type(self), seeded).run(**kwargs)
+
+    def sample(
+        self,
+        n: int = 5,
+        voter: Optional[MajorityVoter] = None,
+        consensus: Optional[float] = None,
+        max_concurrency: Optional[int] = None,
+        **kwargs,
+    ) -> Vote:
+        """Runs n seeded samples concurrently and votes on their outputs.
+
+        Once the vote is decided, samples that have not started are cancelled and samples that are
+        still running are waited for without being counted, so the model is idle again when sample
+        returns. The model is not interrupted, as other agents may be generating on it. Failed samples
+        do not vote.
+
+        Args:
+            n (int): Number of samples. Defaults to 5.
+            voter (Optional[MajorityVoter]): Aggregates the outputs. Defaults to MajorityVoter, use LogprobVoter
+                to weight the samples by their logprobs (the backend must be asked for them, e.g. logprobs=1).
+            consensus (Optional[float]): Stop once the leading output holds this share of n. Defaults to stopping
+                once the outstanding samples can no longer change the winner.
+            max_concurrency (Optional[int]): Samples running at once. Defaults to n, use 1 for models that
+                cannot run concurrently such as LlamaModel.
+            **kwargs: system_message, prompt_message and prefix_message, as for run.
+
+        Returns:
+            Vote: The winning output, its share of the vote and the outputs of all counted samples.
+        """
+        voter = voter or MajorityVoter()
+        seeds = [next(self.seed_generator) for _ in range(n)]
+        vote = Vote(answer=None, share=0.0)
+
+        def run_sample(seed):
+            output = super(type(self), self._seeded(seed)).run(**kwargs)()
+            last_logprob = getattr(self.model, "last_logprob", None)
+            return output, last_logprob() if last_logprob else None
+
+        executor = ThreadPoolExecutor(max_workers=max(1, min(max_concurrency or n, n)))
+        futures = [executor.submit(run_sample, seed) for seed in seeds]
+        try:
+            for done, future in enumerate(as_completed(futures), start=1):
+                try:
+                    output, logprob = future.result()
+                except Exception as e:
+                    vote.errors.append(e)
+                    continue
+                vote.samples.append(output)
+                voter.add(output, logprob)
+                if done < n and voter.decided(n - done, consensus, n):
+                    break
+        finally:
+            cancelled = [future.cancel() for future in futures]
+            # models such as LlamaModel must not be used by the caller while a discarded sample still generates
+            executor.shutdown(wait=True)
+        vote.cancelled = sum(cancelled)
+        vote.discarded = n - vote.cancelled - len(vote.samples) - len(vote.errors)
+        vote.answer, _, _ = voter.leader()
+        vote.share = voter.share()
+        return vote
 
 
 class AgentChain(Agent):
@@ -158,6 +327,87 @@ class AgentChain(Agent):
         return Response(lambda: self.postprocessor(out))
 
 
+_FAN_OUT_END = object()
+
+
+def fan_out(
+    items: Iterable,
+    worker: Agent,
+    max_concurrency: int = 4,
+    ordered: bool = True,
+    worker_input: Optional[Callable[[Any], dict]] = None,
+) -> Iterator[tuple[int, Any, BatchResult]]:
+    """Runs worker on every item concurrently, starting each item as soon as items yields it.
+
+    Args:
+        items (Iterable): The items, e.g. a parsed list. May be a generator that is still producing items.
+        worker (Agent): The agent run per item.
+        max_concurrency (int): Maximum number of items the worker runs on at once. Defaults to 4.
+        ordered (bool): Yield the results in the order of items, otherwise as they complete. Defaults to True.
+        worker_input (Optional[Callable[[Any], dict]]): Maps an item to the run arguments of the worker.
+            Defaults to the item as prompt_message.
+
+    Returns:
+        Iterator[tuple[int, Any, BatchResult]]: The index, the item and the worker result of every item.
+            An item the worker failed on has the error in its BatchResult, an error raised by items is re-raised.
+    """
+    worker_input = worker_input or (
+        lambda item: {
+            "system_message": "",
+            "prompt_message": item if isinstance(item, str) else str(item),
+            "prefix_message": "",
+        }
+    )
+    messages: queue.Queue = queue.Queue()
+    executor = ThreadPoolExecutor(max_workers=max(1, max_concurrency), thread_name_prefix="fan-out")
+
+    def run_item(index, item):
+        try:
+            result = BatchResult(value=worker.run(**worker_input(item))())
+        except Exception as e:
+            result = BatchResult(error=e)
+        messages.put((index, item, result))
+
+    def feed():
+        count = 0
+        try:
+            for item in items:
+                executor.submit(run_item, count, item)
+                count += 1
+        except Exception as e:
+            messages.put(e)
+        messages.put((_FAN_OUT_END, count))
+
+    threading.Thread(target=feed, name="fan-out-feed", daemon=True).start()
+    pending: dict[int, tuple] = {}
+    next_index = received = 0
+    total = None
+    try:
+        while total is None or received < total:
+            message = messages.get()
+            if isinstance(message, Exception):
+                raise message
+            if message[0] is _FAN_OUT_END:
+                total = message[1]
+                continue
+            received += 1
+            if not ordered:
+                yield message
+                continue
+            pending[message[0]] = message
+            while next_index in pending:
+                yield pending.pop(next_index)
+                next_index += 1
+    finally:
+        # a consumer that stops early does not wait for the items that have not started
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+FORMAT_EXPLANATION_CACHE_DIR = Path(
+    os.getenv("FORMAT_EXPLANATION_CACHE_DIR", Path.home() / ".cache" / "agentsystem" / "format_explanations")
+)
+
+
 class ParsedListAgentChain(Agent):
     r"""
     ParsedListAgentChain(
@@ -165,41 +415,143 @@ class ParsedListAgentChain(Agent):
         model=model,
         stream=True,
         **extra_args)
+
+    Has the model explain the format of regex_pattern, then runs a ParsedAgent with that explanation
+    as system message. Explanations are cached per pattern, model and explanation prompt, on disk in
+    FORMAT_EXPLANATION_CACHE_DIR, and can be generated ahead of time with prewarm.
     """
 
-    def __init__(self, regex_pattern, **parameter_list):
-        """
-        docstring
+    explanation_prompt = """A worker will be tasked to write some text and his response parsed with a regex pattern. Your task is to explain this to the worker.
+                    Explain to the worker the format his answer has to be in and give an example output-string that would result in a list with three elements for given regex pattern:"""
+    explanation_cache = ToolCache(max_entries=256, cache_dir=FORMAT_EXPLANATION_CACHE_DIR)
+    _explanation_locks: dict[str, threading.Lock] = {}
+    _explanation_locks_lock = threading.Lock()
+
+    def __init__(self, regex_pattern, explanation_cache: Optional[ToolCache] = None, **parameter_list):
+        """Creates a ParsedListAgentChain.
+
+        Args:
+            regex_pattern (str): The pattern whose findall result is the output of the chain.
+            explanation_cache (Optional[ToolCache]): Where explanations are cached. Defaults to the shared, persisted cache.
+            **parameter_list: The arguments of Agent.
         """
         self.regex_pattern = regex_pattern
+        if explanation_cache is not None:
+            self.explanation_cache = explanation_cache
         super().__init__(**parameter_list)
 
+    def _explanation_arguments(self) -> dict:
+        return {"pattern": self.regex_pattern, "model": self.model.identity(), "prompt": self.explanation_prompt}
+
+    def format_explanation(self) -> str:
+        """The model's explanation of the format of regex_pattern, generated once per pattern, model and prompt."""
+        arguments = self._explanation_arguments()
+        key = self.explanation_cache.key("format_explanation", arguments)
+        with self._explanation_locks_lock:
+            lock = self._explanation_locks.setdefault(key, threading.Lock())
+        # concurrent chains with the same pattern wait for one explanation instead of generating their own
+        with lock:
+            hit, explanation = self.explanation_cache.get("format_explanation", arguments)
+            if not hit:
+                explanation = Agent(
+                    model=self.model,
+                    preprocessor=SimpleTemplatePreprocessor(system_message_template=self.explanation_prompt),
+                    postprocessor=lambda response: getattr(response, "content", response),
+                    **self.extra_args,
+                ).run(
+                    system_message="",
+                    prompt_message=f"re.compile(r'{self.regex_pattern}').findall(worker_response)",
+                    prefix_message="",
+                )()
+                self.explanation_cache.put("format_explanation", arguments, explanation)
+        return explanation
+
+    @classmethod
+    def prewarm(cls, patterns, model: Model, max_concurrency: int = 1, **parameter_list) -> dict[str, str]:
+        """Generates the explanations of known patterns ahead of time, e.g. at startup.
+
+        Args:
+            patterns (Iterable[str]): The regex patterns.
+            model (Model): The model the chains will run with.
+            max_concurrency (int): Explanations generated at once. Defaults to 1, raise it for HTTP backends.
+            **parameter_list: Further arguments of the chains, e.g. explanation_cache.
+
+        Returns:
+            dict[str, str]: The explanation of every pattern.
+        """
+        chains = [cls(pattern, model=model, **parameter_list) for pattern in patterns]
+        with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as executor:
+            explanations = list(executor.map(lambda chain: chain.format_explanation(), chains))
+        return {chain.regex_pattern: explanation for chain, explanation in zip(chains, explanations)}
+
+    def fan_out(
+        self,
+        worker: Agent,
+        prompt_message: str = "",
+        max_concurrency: int = 4,
+        ordered: bool = True,
+        worker_input: Optional[Callable[[Any], dict]] = None,
+        system_message: str = "",
+        prefix_message: str = "",
+    ) -> Iterator[tuple[int, Any, BatchResult]]:
+        """Generates the list for prompt_message and runs worker on every item, see fan_out.
+
+        The list is parsed while it is streamed, so the first worker starts while the rest of the list is
+        still being generated. The worker should run on a model that serves concurrent requests, or on
+        another model than the chain: a single llama_cpp model cannot generate the list and items at once.
+
+        Args:
+            worker (Agent): The agent run per item.
+            prompt_message (str): The prompt of the list.
+            max_concurrency (int): Maximum number of items the worker runs on at once. Defaults to 4.
+            ordered (bool): Yield the results in list order, otherwise as they complete. Defaults to True.
+            worker_input (Optional[Callable[[Any], dict]]): Maps an item to the run arguments of the worker.
+
+        Returns:
+            Iterator[tuple[int, Any, BatchResult]]: The index, the item and the worker result of every item.
+        """
+        items: queue.Queue = queue.Queue()
+
+        def generate_list():
+            streamed = 0
+
+            def on_item(item):
+                nonlocal streamed
+                streamed += 1
+                items.put(item)
+
+            try:
+                parsed = ParsedAgent(self.regex_pattern, model=self.model, on_item=on_item).run(
+                    system_message=self.format_explanation(),
+                    prompt_message=prompt_message,
+                    prefix_message=prefix_message,
+                )()
+                # backends constrained to JSON are parsed after the completion instead of while streaming
+                for item in parsed[streamed:]:
+                    items.put(item)
+            except Exception as e:
+                items.put(e)
+            finally:
+                items.put(_FAN_OUT_END)
+
+        def list_items():
+            while (item := items.get()) is not _FAN_OUT_END:
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+
+        threading.Thread(target=generate_list, name="fan-out-list", daemon=True).start()
+        return fan_out(list_items(), worker, max_concurrency, ordered, worker_input)
+
     def execute(
         self,
         system_message: str = "",
         prompt_message: str = "",
         prefix_message: str = "",
     ):
-        """
-        docstring
-        """
-        prompt_agent = Agent(
-            model=self.model,
-            preprocessor=CallablePreprocessor(
-                lambda sys, prompt, prefix: (
-                    """A worker will be tasked to write some text and his response parsed with a regex pattern. Your task is to explain this to the worker.
-                    Explain to the worker the format his answer has to be in and give an example output-string that would result in a list with three elements for given regex pattern:""",
-                    prompt,
-                    prefix,
-                )
-            ),
-            **self.extra_args,
-        ).run(
-            prompt_message=f"re.compile(r'{self.regex_pattern}').findall(worker_response)"
-        )
-
+        """Runs a ParsedAgent on prompt_message with the cached format explanation as system message."""
         list_agent = ParsedAgent(self.regex_pattern, model=self.model).run(
-            system_message=prompt_agent(), prompt_message=prompt_message
+            system_message=self.format_explanation(), prompt_message=prompt_message, prefix_message=prefix_message
         )
         return list_agent
 
@@ -223,16 +575,21 @@ class StatefulAgent(Agent):
 
 
 class ToolAgent(Agent):
-    def __init__(self, *args, tools=None, **kwargs):
+    def __init__(self, *args, tools=None, tool_selector: Optional[ToolSelector] = None, **kwargs):
         super().__init__(*args, **kwargs)
         self.tools = tools or {}
+        self.tool_selector = tool_selector
 
     def register_tool(self, name, func):
         self.tools[name] = func
 
-    def _format_tool_definitions(self):
-        """Formats the tool definitions for inclusion in the system message."""
-        return "\n".join(f"{name}: {func.__doc__}" for name, func in self.tools.items())
+    def _format_tool_definitions(self, query: str = ""):
+        """Formats the tool definitions for inclusion in the system message, only the selected ones if a tool_selector is set."""
+        definitions = {name: f"{name}: {func.__doc__}" for name, func in self.tools.items()}
+        if self.tool_selector is not None:
+            selected = self.tool_selector.select(definitions, query)
+            definitions = {name: definitions[name] for name in selected}
+        return "\n".join(definitions.values())
 
     def execute(
         self,
@@ -241,7 +598,7 @@ class ToolAgent(Agent):
         prefix_message: str = "",
     ):
         # Inject tool definitions into system message
-        tool_definitions = self._format_tool_definitions()
+        tool_definitions = self._format_tool_definitions(prompt_message)
         enhanced_system = f"{system_message}\n\nAvailable tools:\n{tool_definitions}"
         return super().execute(enhanced_system, prompt_message, prefix_message)
 
@@ -0,0 +1,59 @@
+"""
+Compares the answer latency of IndexAgent's fast and react query modes on the same index.
+
+Usage:
+    python -m agentsystem.agents.index.benchmark_query_modes ["question" ...]
+"""
+
+import statistics
+import sys
+import time
+
+from llama_index.core.chat_engine.types import ChatMode
+from llama_index.core.memory import ChatMemoryBuffer
+
+from agentsystem.agents.index_agents import indexAgent
+
+DEFAULT_QUESTIONS = [
+    "Where is the Agent class defined?",
+    "What does ParsedAgent do with the model output?",
+    "How does LlamaModel stop a running generation?",
+    "Which arguments does Tool.get_openai_description use?",
+    "How are templates in document_prompt turned into functions?",
+]
+
+
+def fresh_memory():
+    return ChatMemoryBuffer.from_defaults(token_limit=1500)
+
+
+def answer_fast(question):
+    return indexAgent.SourceFast.chat(question, memory=fresh_memory())
+
+
+def answer_react(question):
+    engine = indexAgent.SourceIndex.as_chat_engine(chat_mode=ChatMode.REACT, memory=fresh_memory())
+    return engine.chat(question).response
+
+
+def measure(answer, questions):
+    seconds = []
+    for question in questions:
+        start = time.perf_counter()
+        answer(question)
+        seconds.append(time.perf_counter() - start)
+    return seconds
+
+
+def main(questions):
+    for mode, answer in {"fast": answer_fast, "react": answer_react}.items():
+        seconds = measure(answer, questions)
+        print(
+            f"{mode:>5}: median {statistics.median(seconds):.2f}s, "
+            f"mean {statistics.mean(seconds):.2f}s, max {max(seconds):.2f}s "
+            f"over {len(seconds)} questions"
+        )
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:] or DEFAULT_QUESTIONS)
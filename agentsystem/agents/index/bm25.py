@@ -0,0 +1,238 @@
+"""
+Local BM25 inverted index for code and its fusion with vector retrieval.
+
+Embedding retrieval is weak on exact identifiers (class names, error strings, config keys), BM25
+over code-aware tokens is strong on exactly those. Posting lists are kept as compact `array`s
+of document slots and term frequencies and scored with NumPy views of them, so a query only costs
+a few vector operations per query term.
+"""
+
+import json
+import math
+from array import array
+from pathlib import Path
+from typing import Iterable, List, Optional
+
+import numpy as np
+from llama_index.core.base.base_retriever import BaseRetriever
+from llama_index.core.schema import BaseNode, MetadataMode, NodeWithScore, QueryBundle
+from llama_index.core.storage.docstore.types import BaseDocumentStore
+
+from agentsystem.util import tokenize_code
+
+
+class BM25Index:
+    """
+    Incrementally updatable BM25 index over documents identified by string ids.
+
+    Removed documents are only marked as dead and dropped from the posting lists once they make up
+    a quarter of all slots, until then they still count towards document frequencies.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.doc_ids: list[str] = []
+        self.slots: dict[str, int] = {}
+        self.lengths = array("I")
+        self.alive = bytearray()
+        self.postings: dict[str, tuple[array, array]] = {}
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self.slots)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self.slots
+
+    def add(self, doc_id: str, text: str) -> None:
+        """Indexes text under doc_id, replacing a previous document with the same id."""
+        if doc_id in self.slots:
+            self.remove(doc_id)
+        slot = len(self.doc_ids)
+        tokens = tokenize_code(text)
+        frequencies: dict[str, int] = {}
+        for token in tokens:
+            frequencies[token] = frequencies.get(token, 0) + 1
+        for token, frequency in frequencies.items():
+            slots, tfs = self.postings.setdefault(token, (array("I"), array("I")))
+            slots.append(slot)
+            tfs.append(frequency)
+        self.doc_ids.append(doc_id)
+        self.slots[doc_id] = slot
+        self.lengths.append(len(tokens))
+        self.alive.append(1)
+        self._total_length += len(tokens)
+
+    def remove(self, doc_id: str) -> None:
+        slot = self.slots.pop(doc_id, None)
+        if slot is None:
+            return
+        self.alive[slot] = 0
+        self._total_length -= self.lengths[slot]
+        if len(self.doc_ids) - len(self.slots) > len(self.doc_ids) // 4:
+            self._compact()
+
+    def sync(self, documents: dict[str, str]) -> None:
+        """Updates the index to exactly the given {doc_id: text} documents, only indexing new ids."""
+        for doc_id in [doc_id for doc_id in self.slots if doc_id not in documents]:
+            self.remove(doc_id)
+        for doc_id, text in documents.items():
+            if doc_id not in self.slots:
+                self.add(doc_id, text)
+
+    def _compact(self) -> None:
+        """Renumbers the live documents and drops dead slots from the posting lists."""
+        remap = np.cumsum(np.frombuffer(self.alive, dtype=np.uint8), dtype=np.int64) - 1
+        alive = np.frombuffer(self.alive, dtype=np.uint8).astype(bool)
+        postings = {}
+        for token, (slots, tfs) in self.postings.items():
+            slots_view = np.frombuffer(slots, dtype=np.uint32)
+            keep = alive[slots_view]
+            if keep.any():
+                postings[token] = (
+                    array("I", remap[slots_view[keep]].astype(np.uint32).tobytes()),
+                    array("I", np.frombuffer(tfs, dtype=np.uint32)[keep].tobytes()),
+                )
+        self.postings = postings
+        self.doc_ids = [doc_id for doc_id, live in zip(self.doc_ids, self.alive) if live]
+        self.lengths = array("I", np.frombuffer(self.lengths, dtype=np.uint32)[alive].tobytes())
+        self.alive = bytearray(b"\x01" * len(self.doc_ids))
+        self.slots = {doc_id: slot for slot, doc_id in enumerate(self.doc_ids)}
+
+    def query(self, text: str, top_k: int = 10) -> list[tuple[str, float]]:
+        """Returns the top_k (doc_id, score) pairs for the query text, best first."""
+        if not self.slots:
+            return []
+        scores = np.zeros(len(self.doc_ids), dtype=np.float32)
+        lengths = np.frombuffer(self.lengths, dtype=np.uint32)
+        average_length = self._total_length / len(self.slots) or 1.0
+        for token in set(tokenize_code(text)):
+            if token not in self.postings:
+                continue
+            slots, tfs = self.postings[token]
+            slots_view = np.frombuffer(slots, dtype=np.uint32)
+            tfs_view = np.frombuffer(tfs, dtype=np.uint32).astype(np.float32)
+            document_frequency = len(slots)
+            idf = math.log(1 + (len(self.slots) - document_frequency + 0.5) / (document_frequency + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * lengths[slots_view] / average_length)
+            scores[slots_view] += idf * tfs_view * (self.k1 + 1) / (tfs_view + norm)
+        scores[np.frombuffer(self.alive, dtype=np.uint8) == 0] = 0
+        top_k = min(top_k, int(np.count_nonzero(scores)))
+        if top_k == 0:
+            return []
+        top = np.argpartition(-scores, top_k - 1)[:top_k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.doc_ids[slot], float(scores[slot])) for slot in top]
+
+    def persist(self, path) -> None:
+        """Writes the index as compressed sparse rows into one .npz file."""
+        self._compact()
+        tokens = list(self.postings)
+        offsets = np.cumsum([0] + [len(self.postings[t][0]) for t in tokens], dtype=np.int64)
+        empty = array("I")
+        np.savez(
+            path,
+            meta=np.array(json.dumps({"k1": self.k1, "b": self.b})),
+            doc_ids=np.array(self.doc_ids, dtype=str),
+            lengths=np.frombuffer(self.lengths, dtype=np.uint32),
+            tokens=np.array(tokens, dtype=str),
+            offsets=offsets,
+            slots=np.frombuffer(b"".join(self.postings[t][0].tobytes() for t in tokens) or empty, dtype=np.uint32),
+            tfs=np.frombuffer(b"".join(self.postings[t][1].tobytes() for t in tokens) or empty, dtype=np.uint32),
+        )
+
+    @classmethod
+    def load(cls, path) -> "BM25Index":
+        """Loads an index written by persist, or returns an empty index if path does not exist."""
+        path = Path(path)
+        if not path.exists():
+            return cls()
+        data = np.load(path)
+        index = cls(**json.loads(str(data["meta"])))
+        index.doc_ids = data["doc_ids"].tolist()
+        index.slots = {doc_id: slot for slot, doc_id in enumerate(index.doc_ids)}
+        index.lengths = array("I", data["lengths"].astype(np.uint32).tobytes())
+        index.alive = bytearray(b"\x01" * len(index.doc_ids))
+        index._total_length = int(data["lengths"].sum())
+        slots, tfs, offsets = data["slots"], data["tfs"], data["offsets"]
+        index.postings = {
+            token: (
+                array("I", slots[offsets[i] : offsets[i + 1]].tobytes()),
+                array("I", tfs[offsets[i] : offsets[i + 1]].tobytes()),
+            )
+            for i, token in enumerate(data["tokens"].tolist())
+        }
+        return index
+
+
+def node_texts(nodes: Iterable[BaseNode]) -> dict[str, str]:
+    """The {node_id: text} documents to index for the given nodes, including their embedded metadata."""
+    return {node.node_id: node.get_content(metadata_mode=MetadataMode.EMBED) for node in nodes}
+
+
+class BM25Retriever(BaseRetriever):
+    """Retrieves nodes from a docstore by BM25 score."""
+
+    def __init__(self, index: BM25Index, docstore: BaseDocumentStore, similarity_top_k: int = 8):
+        super().__init__()
+        self.index = index
+        self.docstore = docstore
+        self.similarity_top_k = similarity_top_k
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        hits = self.index.query(query_bundle.query_str, self.similarity_top_k)
+        return [
+            NodeWithScore(node=self.docstore.get_node(doc_id), score=score)
+            for doc_id, score in hits
+        ]
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Fuses vector and BM25 retrieval.
+
+    The scores of both retrievers are min-max normalized per query and combined as
+    alpha * vector + (1 - alpha) * bm25, a node found by only one retriever gets 0 from the other.
+    """
+
+    def __init__(
+        self,
+        vector_retriever: BaseRetriever,
+        bm25_retriever: BM25Retriever,
+        alpha: float = 0.5,
+        similarity_top_k: Optional[int] = None,
+    ):
+        super().__init__()
+        self.vector_retriever = vector_retriever
+        self.bm25_retriever = bm25_retriever
+        self.alpha = alpha
+        self.similarity_top_k = similarity_top_k or bm25_retriever.similarity_top_k
+
+    @staticmethod
+    def _normalized(results: List[NodeWithScore]) -> dict[str, float]:
+        if not results:
+            return {}
+        scores = [result.score or 0.0 for result in results]
+        low, high = min(scores), max(scores)
+        return {
+            result.node.node_id: 1.0 if high == low else (score - low) / (high - low)
+            for result, score in zip(results, scores)
+        }
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        vector_results = self.vector_retriever.retrieve(query_bundle)
+        bm25_results = self.bm25_retriever.retrieve(query_bundle)
+        vector_scores = self._normalized(vector_results)
+        bm25_scores = self._normalized(bm25_results)
+        nodes = {result.node.node_id: result.node for result in vector_results + bm25_results}
+        fused = [
+            NodeWithScore(
+                node=node,
+                score=self.alpha * vector_scores.get(node_id, 0.0)
+                + (1 - self.alpha) * bm25_scores.get(node_id, 0.0),
+            )
+            for node_id, node in nodes.items()
+        ]
+        fused.sort(key=lambda result: result.score, reverse=True)
+        return fused[: self.similarity_top_k]
@@ -0,0 +1,167 @@
+"""
+Node parser that chunks Python sources along their definitions.
+
+Definitions are found with agentsystem.util.ClassExtractor. Every top-level definition is its own
+segment. A class that fits into max_chars is one chunk, larger classes are split into their methods
+plus the class header, and only single definitions that are still too large are split by lines.
+Adjacent chunks smaller than min_chars are merged.
+"""
+
+from typing import Any, List, Sequence
+
+from llama_index.core.bridge.pydantic import Field
+from llama_index.core.node_parser import NodeParser, SentenceSplitter
+from llama_index.core.node_parser.node_utils import build_nodes_from_splits
+from llama_index.core.schema import BaseNode
+from llama_index.core.utils import get_tqdm_iterable
+
+from agentsystem.util import Definition, extract_source_ast
+
+MODULE_SYMBOL = "<module>"
+
+
+class PythonCodeNodeParser(NodeParser):
+    """
+    Splits Python documents into one node per class, method or function.
+
+    Every node gets `symbols` (comma separated qualified names), `start_line` and `end_line` metadata.
+    Documents that are not valid Python are split with the fallback splitter.
+    """
+
+    max_chars: int = Field(default=3000, description="Maximum characters per chunk.")
+    min_chars: int = Field(default=300, description="Chunks below this size are merged with their neighbours.")
+    fallback_splitter: NodeParser = Field(default_factory=SentenceSplitter)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "PythonCodeNodeParser"
+
+    def _parse_nodes(
+        self,
+        nodes: Sequence[BaseNode],
+        show_progress: bool = False,
+        **kwargs: Any,
+    ) -> List[BaseNode]:
+        all_nodes: List[BaseNode] = []
+        for node in get_tqdm_iterable(nodes, show_progress, "Parsing code nodes"):
+            text = node.get_content()
+            try:
+                chunks = self.split_source(text)
+            except (SyntaxError, ValueError):
+                # ast.parse raises ValueError for sources containing NUL bytes
+                all_nodes.extend(self.fallback_splitter([node]))
+                continue
+            lines = text.splitlines(keepends=True)
+            splits = ["".join(lines[start - 1 : end]) for start, end, _ in chunks]
+            for split_node, (start, end, symbols) in zip(
+                build_nodes_from_splits(splits, node, id_func=self.id_func), chunks
+            ):
+                split_node.metadata.update(
+                    {"symbols": ", ".join(symbols), "start_line": start, "end_line": end}
+                )
+                split_node.excluded_embed_metadata_keys = [
+                    *split_node.excluded_embed_metadata_keys,
+                    "start_line",
+                    "end_line",
+                ]
+                all_nodes.append(split_node)
+        return all_nodes
+
+    def split_source(self, source: str) -> list[tuple[int, int, list[str]]]:
+        """Splits Python source into chunks.
+
+        Args:
+            source (str): The Python source code.
+
+        Raises:
+            SyntaxError: If source is not valid Python.
+            ValueError: If source contains NUL bytes.
+
+        Returns:
+            list[tuple[int, int, list[str]]]: The 1-based first and last line and the qualified names of every chunk.
+        """
+        extractor, _ = extract_source_ast(source)
+        lines = source.splitlines(keepends=True)
+        segments = self._split_span(
+            lines, 1, len(lines), MODULE_SYMBOL, "module", extractor.definitions
+        )
+        return self._merge(lines, segments)
+
+    def _size(self, lines, start, end) -> int:
+        return sum(len(line) for line in lines[start - 1 : end])
+
+    def _split_span(
+        self, lines, start, end, symbol, kind, definitions: list[Definition]
+    ) -> list[tuple[int, int, str]]:
+        """Splits the lines of one definition (or the module) into segments of at most max_chars.
+
+        The module is always split at its top-level definitions, so that every definition keeps its
+        qualified name, _merge combines the small ones again.
+        """
+        if kind != "module" and self._size(lines, start, end) <= self.max_chars:
+            return [(start, end, symbol)]
+        if kind not in ("module", "class"):
+            return self._split_lines(lines, start, end, symbol)
+
+        prefix = "" if kind == "module" else f"{symbol}."
+        children = [
+            d
+            for d in definitions
+            if d.kind != "attribute"
+            and d.qualified_name.startswith(prefix)
+            and "." not in d.qualified_name[len(prefix) :]
+        ]
+        segments = []
+        cursor = start
+        for child in children:
+            if child.start_line > cursor:
+                segments += self._split_lines(lines, cursor, child.start_line - 1, symbol)
+            segments += self._split_span(
+                lines, child.start_line, child.end_line, child.qualified_name, child.kind, definitions
+            )
+            cursor = child.end_line + 1
+        if cursor <= end:
+            segments += self._split_lines(lines, cursor, end, symbol)
+        return segments
+
+    def _split_lines(self, lines, start, end, symbol) -> list[tuple[int, int, str]]:
+        """Splits a span that has no definitions to split at by whole lines, dropping blank spans."""
+        segments = []
+        window_start, size = start, 0
+        for line_number in range(start, end + 1):
+            line_size = len(lines[line_number - 1])
+            if size and size + line_size > self.max_chars:
+                segments.append((window_start, line_number - 1, symbol))
+                window_start, size = line_number, 0
+            size += line_size
+        segments.append((window_start, end, symbol))
+        return [
+            (s, e, name)
+            for s, e, name in segments
+            if "".join(lines[s - 1 : e]).strip()
+        ]
+
+    def _merge(self, lines, segments) -> list[tuple[int, int, list[str]]]:
+        """Appends segments to the previous chunk while it is below min_chars and the result fits into max_chars.
+
+        A last chunk below min_chars is merged into the one before it if the result fits.
+        """
+        chunks: list[tuple[int, int, list[str]]] = []
+        for start, end, symbol in segments:
+            if chunks:
+                last_start, last_end, symbols = chunks[-1]
+                if (
+                    self._size(lines, last_start, last_end) < self.min_chars
+                    and self._size(lines, last_start, end) <= self.max_chars
+                ):
+                    chunks[-1] = (last_start, end, symbols + [s for s in [symbol] if s not in symbols])
+                    continue
+            chunks.append((start, end, [symbol]))
+        if len(chunks) > 1:
+            (first_start, _, first_symbols), (start, end, symbols) = chunks[-2:]
+            if (
+                self._size(lines, start, end) < self.min_chars
+                and self._size(lines, first_start, end) <= self.max_chars
+            ):
+                chunks[-2:] = [(first_start, end, first_symbols + [s for s in symbols if s not in first_symbols])]
+        return chunks
@@ -0,0 +1,231 @@
+"""
+Content-addressed cache for text embeddings.
+
+Embeddings are keyed by (embedding model, hash of the chunk text) and stored per model as an
+append-only float32 matrix that is memory-mapped for reading, plus a parallel file of fixed-width
+text hashes. The files are guarded by a lock file, so several IndexAgents and processes can share
+one cache directory and only ever embed a given chunk once.
+"""
+
+import hashlib
+import json
+import re
+import threading
+from pathlib import Path
+from typing import Any, List, Optional, Sequence
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding, Embedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+
+from agentsystem.util import file_lock
+
+KEY_SIZE = 16
+
+
+def text_key(text: str) -> bytes:
+    """Returns the fixed-width hash a chunk text is stored under."""
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=KEY_SIZE).digest()
+
+
+class EmbeddingCache:
+    """
+    On-disk embedding cache for a single embedding model.
+
+    Attributes:
+        directory (Path): The directory holding `vectors.f32`, `keys.bin` and `meta.json` for the model.
+        dimensions (Optional[int]): The embedding width, known once the first embedding has been stored.
+    """
+
+    _instances: dict = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, root, model_name: str):
+        """Opens (or creates) the cache of the given model below root.
+
+        Args:
+            root (Path): The cache directory shared by all models.
+            model_name (str): The name of the embedding model, part of the cache key.
+        """
+        slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name)[:64]
+        digest = hashlib.blake2b(model_name.encode("utf-8"), digest_size=4).hexdigest()
+        self.directory = Path(root) / f"{slug}-{digest}"
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.model_name = model_name
+        self.dimensions: Optional[int] = None
+        self._vectors_path = self.directory / "vectors.f32"
+        self._keys_path = self.directory / "keys.bin"
+        self._meta_path = self.directory / "meta.json"
+        self._lock_path = self.directory / "lock"
+        self._rows: dict[bytes, int] = {}
+        self._vectors: Optional[np.memmap] = None
+        self._lock = threading.Lock()
+        self._refresh()
+
+    @classmethod
+    def open(cls, root, model_name: str) -> "EmbeddingCache":
+        """Returns the cache for (root, model_name), shared by every caller in this process."""
+        key = (Path(root).absolute(), model_name)
+        with cls._instances_lock:
+            if key not in cls._instances:
+                cls._instances[key] = cls(root, model_name)
+            return cls._instances[key]
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def _refresh(self) -> None:
+        """Picks up rows that other instances or processes appended since the last refresh."""
+        if self.dimensions is None and self._meta_path.exists():
+            self.dimensions = json.loads(self._meta_path.read_text())["dimensions"]
+        if self.dimensions is None or not self._keys_path.exists():
+            return
+        # a writer appends vectors before keys, the keys decide which rows exist
+        count = min(
+            self._keys_path.stat().st_size // KEY_SIZE,
+            self._row_count(self._vectors_path.stat().st_size if self._vectors_path.exists() else 0),
+        )
+        known = len(self._rows)
+        if count == known:
+            return
+        with open(self._keys_path, "rb") as f:
+            f.seek(known * KEY_SIZE)
+            new_keys = f.read((count - known) * KEY_SIZE)
+        for row in range(count - known):
+            key = new_keys[row * KEY_SIZE : (row + 1) * KEY_SIZE]
+            self._rows.setdefault(key, known + row)
+        self._vectors = np.memmap(
+            self._vectors_path, dtype=np.float32, mode="r", shape=(count, self.dimensions)
+        )
+
+    def _row_count(self, vectors_size: int) -> int:
+        return vectors_size // (4 * self.dimensions)
+
+    def _repair(self) -> None:
+        """Truncates keys.bin and vectors.f32 to the rows both hold completely. Needs the file lock.
+
+        A writer that failed between appending its vectors and its keys leaves extra vectors, which would
+        shift the rows of every later key.
+        """
+        keys_size = self._keys_path.stat().st_size if self._keys_path.exists() else 0
+        vectors_size = self._vectors_path.stat().st_size if self._vectors_path.exists() else 0
+        count = min(keys_size // KEY_SIZE, self._row_count(vectors_size))
+        if keys_size != count * KEY_SIZE:
+            with open(self._keys_path, "r+b") as f:
+                f.truncate(count * KEY_SIZE)
+        if vectors_size != count * 4 * self.dimensions:
+            with open(self._vectors_path, "r+b") as f:
+                f.truncate(count * 4 * self.dimensions)
+
+    def get_many(self, texts: Sequence[str]) -> List[Optional[Embedding]]:
+        """Looks up the embeddings of the given texts.
+
+        Args:
+            texts (Sequence[str]): The chunk texts to look up.
+
+        Returns:
+            List[Optional[Embedding]]: The cached embedding per text, None for misses.
+        """
+        with self._lock:
+            self._refresh()
+            rows = [self._rows.get(text_key(text)) for text in texts]
+            vectors = self._vectors
+        return [None if row is None else vectors[row].tolist() for row in rows]
+
+    def put_many(self, texts: Sequence[str], embeddings: Sequence[Embedding]) -> None:
+        """Stores the embeddings of the given texts, skipping texts that are already cached.
+
+        Args:
+            texts (Sequence[str]): The chunk texts.
+            embeddings (Sequence[Embedding]): One embedding per text.
+        """
+        if not texts:
+            return
+        with self._lock, file_lock(self._lock_path):
+            self._refresh()
+            if self.dimensions is None:
+                self.dimensions = len(embeddings[0])
+                self._meta_path.write_text(
+                    json.dumps({"model_name": self.model_name, "dimensions": self.dimensions})
+                )
+            self._repair()
+            new_keys, new_vectors = [], []
+            seen = set()
+            for text, embedding in zip(texts, embeddings):
+                key = text_key(text)
+                if key in self._rows or key in seen:
+                    continue
+                seen.add(key)
+                new_keys.append(key)
+                new_vectors.append(embedding)
+            if not new_keys:
+                return
+            matrix = np.asarray(new_vectors, dtype=np.float32).reshape(-1, self.dimensions)
+            # Vectors are appended before their keys, so a reader never sees a key without its row.
+            with open(self._vectors_path, "ab") as f:
+                f.write(matrix.tobytes())
+            with open(self._keys_path, "ab") as f:
+                f.write(b"".join(new_keys))
+            self._refresh()
+
+
+class CachedEmbedding(BaseEmbedding):
+    """
+    Wraps an embedding model so text embeddings are served from an EmbeddingCache and only
+    misses are sent to the wrapped model, batched by its own embed_batch_size.
+
+    Query embeddings are passed through uncached.
+    """
+
+    _embed_model: BaseEmbedding = PrivateAttr()
+    _cache: EmbeddingCache = PrivateAttr()
+
+    def __init__(
+        self,
+        embed_model: BaseEmbedding,
+        cache_dir,
+        lookup_batch_size: int = 512,
+        **kwargs: Any,
+    ):
+        """Creates a cached view of embed_model.
+
+        Args:
+            embed_model (BaseEmbedding): The embedding model to call on cache misses.
+            cache_dir (Path): The cache directory, may be shared with other processes.
+            lookup_batch_size (int): How many chunks are looked up at once. Misses of one lookup are sent
+                to the wrapped model together. Defaults to 512.
+        """
+        super().__init__(
+            model_name=embed_model.model_name,
+            embed_batch_size=lookup_batch_size,
+            **kwargs,
+        )
+        self._embed_model = embed_model
+        self._cache = EmbeddingCache.open(cache_dir, embed_model.model_name)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbedding"
+
+    @property
+    def cache(self) -> EmbeddingCache:
+        return self._cache
+
+    def _get_query_embedding(self, query: str) -> Embedding:
+        return self._embed_model.get_query_embedding(query)
+
+    async def _aget_query_embedding(self, query: str) -> Embedding:
+        return await self._embed_model.aget_query_embedding(query)
+
+    def _get_text_embedding(self, text: str) -> Embedding:
+        return self._get_text_embeddings([text])[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        embeddings = self._cache.get_many(texts)
+        misses = list(dict.fromkeys(t for t, e in zip(texts, embeddings) if e is None))
+        if misses:
+            computed = self._embed_model.get_text_embedding_batch(misses)
+            self._cache.put_many(misses, computed)
+            by_text = dict(zip(misses, computed))
+            embeddings = [by_text[t] if e is None else e for t, e in zip(texts, embeddings)]
+        return embeddings
@@ -0,0 +1,117 @@
+"""
+Single-call retrieve-then-answer query path for IndexAgent.
+
+Instead of a ReAct loop with several LLM round trips per question, a question is answered with one
+retrieval, a context packed under a token budget and one streamed completion.
+"""
+
+from typing import Callable, List, Optional
+
+from llama_index.core import Settings
+from llama_index.core.base.base_retriever import BaseRetriever
+from llama_index.core.base.llms.types import ChatMessage, MessageRole
+from llama_index.core.llms import LLM
+from llama_index.core.memory import ChatMemoryBuffer
+from llama_index.core.schema import MetadataMode, NodeWithScore
+
+DEFAULT_SYSTEM_PROMPT = """You answer questions about a code base. Use the source excerpts below, they are the most relevant parts of the code base for the question. Reference code by file and line numbers. If the excerpts do not contain the answer, say so instead of guessing."""
+
+
+def format_node(node: NodeWithScore) -> str:
+    """Formats a retrieved node as a source excerpt with its location as header."""
+    metadata = node.node.metadata
+    location = metadata.get("file_path") or metadata.get("file_name") or node.node.node_id
+    if "start_line" in metadata:
+        location += f":{metadata['start_line']}-{metadata['end_line']}"
+    if metadata.get("symbols"):
+        location += f" ({metadata['symbols']})"
+    return f"### {location}\n{node.node.get_content(metadata_mode=MetadataMode.NONE)}\n"
+
+
+def pack_context(
+    nodes: List[NodeWithScore],
+    token_budget: int,
+    tokenizer: Optional[Callable[[str], list]] = None,
+) -> str:
+    """Packs the best scoring nodes into a context of at most token_budget tokens.
+
+    Nodes are taken in score order, a node that does not fit is skipped so that smaller, lower
+    scoring nodes can still use the remaining budget.
+
+    Args:
+        nodes (List[NodeWithScore]): The retrieved nodes.
+        token_budget (int): The maximum number of context tokens.
+        tokenizer (Callable[[str], list]): Returns the tokens of a string. Defaults to Settings.tokenizer.
+
+    Returns:
+        str: The formatted excerpts, in score order.
+    """
+    tokenizer = tokenizer or Settings.tokenizer
+    excerpts = []
+    for node in sorted(nodes, key=lambda n: n.score or 0.0, reverse=True):
+        excerpt = format_node(node)
+        tokens = len(tokenizer(excerpt))
+        if tokens <= token_budget:
+            excerpts.append(excerpt)
+            token_budget -= tokens
+    return "\n".join(excerpts)
+
+
+class FastQueryEngine:
+    """Answers a question with one retrieval and one streamed completion."""
+
+    def __init__(
+        self,
+        retriever: BaseRetriever,
+        llm: Optional[LLM] = None,
+        context_token_budget: int = 3000,
+        system_prompt: str = DEFAULT_SYSTEM_PROMPT,
+    ):
+        """Creates a query engine over the given retriever.
+
+        Args:
+            retriever (BaseRetriever): Retrieves the nodes for a question.
+            llm (LLM): The model answering the question. Defaults to Settings.llm.
+            context_token_budget (int): The maximum number of tokens of retrieved context. Defaults to 3000.
+            system_prompt (str): Instructions for the model, the context is appended to it.
+        """
+        self.retriever = retriever
+        self.llm = llm or Settings.llm
+        self.context_token_budget = context_token_budget
+        self.system_prompt = system_prompt
+
+    def chat(
+        self,
+        message: str,
+        memory: Optional[ChatMemoryBuffer] = None,
+        system_message: str = "",
+        on_token: Optional[Callable[[str], None]] = None,
+    ) -> str:
+        """Answers message, continuing the conversation kept in memory.
+
+        Args:
+            message (str): The question.
+            memory (ChatMemoryBuffer): The history of the session, the question and answer are added to it.
+            system_message (str): Additional instructions, put before the default system prompt.
+            on_token (Callable[[str], None]): Called with every streamed text delta.
+
+        Returns:
+            str: The answer.
+        """
+        context = pack_context(self.retriever.retrieve(message), self.context_token_budget)
+        system = "\n\n".join(part for part in (system_message, self.system_prompt) if part)
+        messages = [
+            ChatMessage(role=MessageRole.SYSTEM, content=f"{system}\n\n{context}"),
+            *(memory.get() if memory else []),
+            ChatMessage(role=MessageRole.USER, content=message),
+        ]
+        answer = ""
+        for chunk in self.llm.stream_chat(messages):
+            delta = chunk.delta or ""
+            answer += delta
+            if on_token:
+                on_token(delta)
+        if memory:
+            memory.put(ChatMessage(role=MessageRole.USER, content=message))
+            memory.put(ChatMessage(role=MessageRole.ASSISTANT, content=answer))
+        return answer
@@ -0,0 +1,165 @@
+"""
+Local CPU embeddings for llama_index, computed with llama_cpp in embedding mode over a GGUF model.
+
+Chunks are embedded in small batches that are spread over a pool of worker processes, each holding
+its own copy of the model, so indexing can run offline on build machines without network access.
+"""
+
+import hashlib
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, List, Optional
+
+from llama_index.core.base.embeddings.base import BaseEmbedding, Embedding
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+
+logger = logging.getLogger(__name__)
+
+# The model of the current worker process, loaded once by _init_worker
+_worker_model = None
+
+
+def _load_model(model_path: str, n_threads: int, model_kwargs: dict):
+    from llama_cpp import Llama
+
+    return Llama(
+        model_path=model_path,
+        embedding=True,
+        n_threads=n_threads,
+        verbose=False,
+        **model_kwargs,
+    )
+
+
+def _init_worker(model_path: str, n_threads: int, model_kwargs: dict) -> None:
+    global _worker_model
+    _worker_model = _load_model(model_path, n_threads, model_kwargs)
+
+
+def _embed_in_worker(texts: List[str]) -> List[Embedding]:
+    return _worker_model.embed(texts, normalize=True)
+
+
+def model_identity(model_path, text_prefix: str = "") -> str:
+    """
+    The file name of the model with a digest of its resolved path, size, modification time and the text
+    prefix, so that embedding caches tell apart models with the same file name, e.g. two quantizations.
+    """
+    path = Path(model_path).resolve()
+    try:
+        stat = path.stat()
+        version = f"{stat.st_size}:{stat.st_mtime_ns}"
+    except OSError:
+        version = ""
+    digest = hashlib.blake2b(f"{path}\0{version}\0{text_prefix}".encode("utf-8"), digest_size=6).hexdigest()
+    return f"{path.name}-{digest}"
+
+
+class LlamaCppEmbedding(BaseEmbedding):
+    """
+    Embedding model that runs a GGUF embedding model locally through llama_cpp.
+
+    With n_processes > 1 the model is loaded once per worker process and the chunks of a batch are
+    embedded in parallel, worker_batch_size chunks per task. Throughput of every batch is logged and
+    accumulated in `throughput`.
+    """
+
+    model_path: str = Field(description="Path of the GGUF embedding model.")
+    n_processes: int = Field(default=1, ge=1, description="Number of worker processes.")
+    worker_batch_size: int = Field(default=16, ge=1, description="Chunks embedded per worker task.")
+    query_prefix: str = Field(default="", description="Instruction prepended to queries.")
+    text_prefix: str = Field(default="", description="Instruction prepended to chunks.")
+    model_kwargs: dict = Field(default_factory=dict, description="Extra arguments for llama_cpp.Llama.")
+
+    _model: Any = PrivateAttr(default=None)
+    _pool: Optional[ProcessPoolExecutor] = PrivateAttr(default=None)
+    _embedded: int = PrivateAttr(default=0)
+    _seconds: float = PrivateAttr(default=0.0)
+
+    def __init__(self, model_path, embed_batch_size: int = 256, **kwargs: Any):
+        """Creates a local embedding model, the GGUF file is loaded on first use.
+
+        Args:
+            model_path (Path): Path of the GGUF embedding model.
+            embed_batch_size (int): Chunks handed over by llama_index at once and spread over the workers. Defaults to 256.
+            **kwargs: n_processes, worker_batch_size, query_prefix, text_prefix and model_kwargs, see the fields.
+
+        Raises:
+            ValueError: If n_processes or worker_batch_size is less than 1.
+        """
+        kwargs.setdefault("model_name", model_identity(model_path, kwargs.get("text_prefix", "")))
+        kwargs.setdefault("model_kwargs", {"n_ctx": 2048, "n_batch": 2048})
+        super().__init__(model_path=str(model_path), embed_batch_size=embed_batch_size, **kwargs)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "LlamaCppEmbedding"
+
+    @property
+    def throughput(self) -> float:
+        """Embedded chunks per second over all batches so far."""
+        return self._embedded / self._seconds if self._seconds else 0.0
+
+    def _threads_per_process(self) -> int:
+        return max(1, (os.cpu_count() or 1) // self.n_processes)
+
+    def _embed(self, texts: List[str]) -> List[Embedding]:
+        if self.n_processes <= 1:
+            if self._model is None:
+                self._model = _load_model(
+                    self.model_path, self._threads_per_process(), self.model_kwargs
+                )
+            return [
+                embedding
+                for start in range(0, len(texts), self.worker_batch_size)
+                for embedding in self._model.embed(
+                    texts[start : start + self.worker_batch_size], normalize=True
+                )
+            ]
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.n_processes,
+                initializer=_init_worker,
+                initargs=(self.model_path, self._threads_per_process(), self.model_kwargs),
+            )
+        batches = [
+            texts[start : start + self.worker_batch_size]
+            for start in range(0, len(texts), self.worker_batch_size)
+        ]
+        return [
+            embedding
+            for batch in self._pool.map(_embed_in_worker, batches)
+            for embedding in batch
+        ]
+
+    def _get_query_embedding(self, query: str) -> Embedding:
+        return self._embed([self.query_prefix + query])[0]
+
+    async def _aget_query_embedding(self, query: str) -> Embedding:
+        return self._get_query_embedding(query)
+
+    def _get_text_embedding(self, text: str) -> Embedding:
+        return self._get_text_embeddings([text])[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        start = time.perf_counter()
+        embeddings = self._embed([self.text_prefix + text for text in texts])
+        seconds = time.perf_counter() - start
+        self._embedded += len(texts)
+        self._seconds += seconds
+        logger.info(
+            "Embedded %d chunks in %.2fs (%.1f chunks/s)",
+            len(texts),
+            seconds,
+            len(texts) / seconds if seconds else float("inf"),
+        )
+        return embeddings
+
+    def close(self) -> None:
+        """Shuts down the worker processes."""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
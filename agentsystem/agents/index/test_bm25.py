@@ -0,0 +1,80 @@
+import time
+
+from llama_index.core.schema import NodeWithScore, QueryBundle, TextNode
+
+from agentsystem.agents.index.bm25 import BM25Index, HybridRetriever, tokenize_code
+
+
+def test_tokenize_code_splits_identifiers():
+    assert tokenize_code("class ClassExtractor(max_len=2)") == [
+        "class",
+        "classextractor",
+        "class",
+        "extractor",
+        "max_len",
+        "max",
+        "len",
+        "2",
+    ]
+
+
+def test_query_ranks_exact_identifier_first():
+    index = BM25Index()
+    index.add("a", "def load_documents(self): return SimpleDirectoryReader()")
+    index.add("b", "class ClassExtractor(ast.NodeVisitor): pass")
+    index.add("c", "the class extractor walks a module")
+
+    hits = index.query("ClassExtractor")
+
+    assert [doc_id for doc_id, _ in hits] == ["b", "c"]
+
+
+def test_remove_and_sync_update_incrementally():
+    index = BM25Index()
+    index.sync({"a": "alpha", "b": "beta", "c": "gamma"})
+    index.sync({"b": "beta", "c": "gamma", "d": "alpha beta"})
+
+    assert "a" not in index
+    assert [doc_id for doc_id, _ in index.query("alpha")] == ["d"]
+
+
+def test_persist_roundtrip(tmp_path):
+    index = BM25Index()
+    index.sync({"a": "alpha beta", "b": "beta", "c": "gamma"})
+    index.remove("c")
+    index.persist(tmp_path / "bm25.npz")
+
+    loaded = BM25Index.load(tmp_path / "bm25.npz")
+
+    assert len(loaded) == 2
+    assert loaded.query("beta") == index.query("beta")
+
+
+def test_query_is_fast_on_mid_sized_corpus():
+    index = BM25Index()
+    for i in range(5000):
+        index.add(str(i), f"def handler_{i}(request): return process_{i % 97}(request.payload)")
+
+    start = time.perf_counter()
+    for _ in range(100):
+        index.query("process_42 payload")
+    assert (time.perf_counter() - start) / 100 < 0.005
+
+
+class StaticRetriever:
+    def __init__(self, results):
+        self.results = results
+
+    def retrieve(self, query_bundle):
+        return self.results
+
+
+def test_hybrid_retriever_fuses_normalized_scores():
+    a, b, c = (TextNode(id_=name, text=name) for name in "abc")
+    vector = StaticRetriever([NodeWithScore(node=a, score=0.9), NodeWithScore(node=b, score=0.5)])
+    bm25 = StaticRetriever([NodeWithScore(node=c, score=12.0), NodeWithScore(node=b, score=4.0)])
+    bm25.similarity_top_k = 3
+
+    results = HybridRetriever(vector, bm25, alpha=0.5).retrieve(QueryBundle("q"))
+
+    assert [(r.node.node_id, r.score) for r in results] == [("a", 0.5), ("c", 0.5), ("b", 0.0)]
@@ -0,0 +1,121 @@
+import textwrap
+
+from llama_index.core import Document
+
+from agentsystem.agents.index.code_parser import PythonCodeNodeParser
+
+SOURCE = textwrap.dedent(
+    '''\
+    import os
+
+
+    class Small:
+        """A small class."""
+
+        def method(self):
+            return 1
+
+
+    class Large:
+        """A class that is too large for one chunk."""
+
+        limit = 10
+
+        def first(self):
+            value = "%s"
+            return value
+
+        @property
+        def second(self):
+            value = "%s"
+            return value
+
+
+    def helper():
+        return os.getcwd()
+    '''
+    % ("x" * 200, "y" * 200)
+)
+
+
+def test_large_class_is_split_into_methods():
+    parser = PythonCodeNodeParser(max_chars=300, min_chars=0)
+
+    chunks = parser.split_source(SOURCE)
+
+    assert [symbols for _, _, symbols in chunks] == [
+        ["<module>"],
+        ["Small"],
+        ["Large"],
+        ["Large.first"],
+        ["Large.second"],
+        ["helper"],
+    ]
+    start, end, _ = chunks[4]
+    assert SOURCE.splitlines()[start - 1].strip() == "@property"
+    assert SOURCE.splitlines()[end - 1].strip() == "return value"
+
+
+def test_small_chunks_are_merged():
+    parser = PythonCodeNodeParser(max_chars=300, min_chars=100)
+
+    chunks = parser.split_source(SOURCE)
+
+    assert [symbols for _, _, symbols in chunks] == [
+        ["<module>", "Small", "Large"],
+        ["Large.first"],
+        ["Large.second"],
+        ["helper"],
+    ]
+
+
+
+def test_small_modules_are_split_at_their_definitions():
+    source = "import os\n\n\nclass Config:\n    def load(self):\n        return os.environ\n" + "".join(
+        f"\n\ndef function_{i}(value):\n    return value + {i}\n" for i in range(22)
+    )
+    parser = PythonCodeNodeParser()
+    assert len(source) < parser.max_chars
+
+    chunks = parser.split_source(source)
+
+    assert len(chunks) > 1
+    assert all(parser.min_chars <= parser._size(source.splitlines(True), s, e) for s, e, _ in chunks)
+    symbols = [symbol for _, _, chunk_symbols in chunks for symbol in chunk_symbols]
+    assert symbols == ["<module>", "Config", *(f"function_{i}" for i in range(22))]
+
+
+def test_oversized_function_is_split_by_lines():
+    source = "def long():\n" + "".join(f"    x{i} = {i}\n" for i in range(50))
+    parser = PythonCodeNodeParser(max_chars=200, min_chars=0)
+
+    chunks = parser.split_source(source)
+
+    assert len(chunks) > 1
+    assert all(symbols == ["long"] for _, _, symbols in chunks)
+    assert chunks[0][0] == 1 and chunks[-1][1] == 51
+
+
+def test_nodes_carry_symbol_metadata():
+    parser = PythonCodeNodeParser(max_chars=300, min_chars=0)
+
+    nodes = parser.get_nodes_from_documents([Document(text=SOURCE)])
+
+    assert nodes[1].metadata == {"symbols": "Small", "start_line": 4, "end_line": 8}
+    assert nodes[1].get_content().startswith("class Small:")
+
+
+def test_invalid_python_uses_fallback_splitter():
+    parser = PythonCodeNodeParser()
+
+    nodes = parser.get_nodes_from_documents([Document(text="def broken(:\n")])
+
+    assert len(nodes) == 1 and "symbols" not in nodes[0].metadata
+
+
+def test_sources_with_nul_bytes_use_fallback_splitter():
+    parser = PythonCodeNodeParser()
+
+    nodes = parser.get_nodes_from_documents([Document(text="x = 1\0\n")])
+
+    assert len(nodes) == 1 and "symbols" not in nodes[0].metadata
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+from llama_index.core.embeddings import MockEmbedding
+
+from agentsystem.agents.index.embedding_cache import CachedEmbedding, EmbeddingCache
+
+
+class CountingEmbedding(MockEmbedding):
+    calls: list = []
+
+    def _get_text_embeddings(self, texts):
+        self.calls.append(list(texts))
+        return [[float(len(text)), 1.0, 0.0] for text in texts]
+
+
+@pytest.fixture
+def embed_model():
+    model = CountingEmbedding(embed_dim=3, model_name="counting")
+    model.calls = []
+    return model
+
+
+def test_cache_roundtrip(tmp_path):
+    cache = EmbeddingCache(tmp_path, "model")
+    cache.put_many(["a", "bb"], [[1.0, 2.0], [3.0, 4.0]])
+
+    assert cache.get_many(["bb", "c", "a"]) == [[3.0, 4.0], None, [1.0, 2.0]]
+
+
+def test_cache_is_shared_between_instances(tmp_path):
+    writer = EmbeddingCache(tmp_path, "model")
+    reader = EmbeddingCache(tmp_path, "model")
+    writer.put_many(["a"], [[1.0, 2.0]])
+    writer.put_many(["a", "b"], [[9.0, 9.0], [5.0, 6.0]])
+
+    assert reader.get_many(["a", "b"]) == [[1.0, 2.0], [5.0, 6.0]]
+    assert len(reader) == 2
+
+
+
+def test_cache_recovers_from_a_partial_write(tmp_path):
+    cache = EmbeddingCache(tmp_path, "model")
+    cache.put_many(["a"], [[1.0, 2.0]])
+    # a writer died after appending its vectors but before appending its keys
+    with open(cache._vectors_path, "ab") as f:
+        f.write(np.asarray([9.0, 9.0], dtype=np.float32).tobytes() + b"\0\0")
+
+    other = EmbeddingCache(tmp_path, "model")
+    other.put_many(["b", "b"], [[3.0, 4.0], [3.0, 4.0]])
+
+    assert other.get_many(["a", "b"]) == [[1.0, 2.0], [3.0, 4.0]]
+    assert cache.get_many(["b"]) == [[3.0, 4.0]]
+    assert cache._vectors_path.stat().st_size == 2 * 2 * 4
+
+
+def test_cache_is_keyed_by_model(tmp_path):
+    EmbeddingCache(tmp_path, "model-a").put_many(["a"], [[1.0]])
+
+    assert EmbeddingCache(tmp_path, "model-b").get_many(["a"]) == [None]
+
+
+def test_cached_embedding_only_embeds_misses(tmp_path, embed_model):
+    cached = CachedEmbedding(embed_model, cache_dir=tmp_path)
+    first = cached.get_text_embedding_batch(["x", "yy", "x"])
+    second = cached.get_text_embedding_batch(["yy", "zzz"])
+
+    assert first == [[1.0, 1.0, 0.0], [2.0, 1.0, 0.0], [1.0, 1.0, 0.0]]
+    assert second == [[2.0, 1.0, 0.0], [3.0, 1.0, 0.0]]
+    assert embed_model.calls == [["x", "yy"], ["zzz"]]
@@ -0,0 +1,60 @@
+from types import SimpleNamespace
+
+from llama_index.core.memory import ChatMemoryBuffer
+from llama_index.core.schema import NodeWithScore, TextNode
+
+from agentsystem.agents.index.fast_query import FastQueryEngine, pack_context
+
+
+def scored(text, score, **metadata):
+    return NodeWithScore(node=TextNode(text=text, metadata=metadata), score=score)
+
+
+class FakeRetriever:
+    def __init__(self, nodes):
+        self.nodes = nodes
+        self.queries = []
+
+    def retrieve(self, query):
+        self.queries.append(query)
+        return self.nodes
+
+
+class FakeLLM:
+    def __init__(self, answer):
+        self.answer = answer
+        self.calls = []
+
+    def stream_chat(self, messages):
+        self.calls.append(messages)
+        for word in self.answer.split(" "):
+            yield SimpleNamespace(delta=word + " ")
+
+
+def test_pack_context_keeps_best_nodes_within_budget():
+    nodes = [
+        scored("low score", 0.1, file_path="c.py"),
+        scored("a long excerpt " * 10, 0.9, file_path="a.py"),
+        scored("best", 0.95, file_path="b.py", start_line=3, end_line=4, symbols="B.run"),
+    ]
+
+    context = pack_context(nodes, token_budget=10, tokenizer=str.split)
+
+    assert context == "### b.py:3-4 (B.run)\nbest\n\n### c.py\nlow score\n"
+
+
+def test_chat_makes_one_completion_and_keeps_session_memory():
+    retriever = FakeRetriever([scored("def run(): ...", 1.0, file_path="a.py")])
+    llm = FakeLLM("It runs.")
+    engine = FastQueryEngine(retriever, llm=llm)
+    memory = ChatMemoryBuffer.from_defaults(token_limit=1500)
+    tokens = []
+
+    answer = engine.chat("What does run do?", memory=memory, on_token=tokens.append)
+    engine.chat("And then?", memory=memory)
+
+    assert answer == "It runs. "
+    assert tokens == ["It ", "runs. "]
+    assert len(llm.calls) == 2
+    assert "def run(): ..." in llm.calls[0][0].content
+    assert [m.content for m in llm.calls[1][1:]] == ["What does run do?", "It runs. ", "And then?"]
@@ -0,0 +1,48 @@
+import pytest
+
+from agentsystem.agents.index.local_embedding import LlamaCppEmbedding
+
+
+class FakeLlama:
+    def __init__(self):
+        self.batches = []
+
+    def embed(self, texts, normalize=False):
+        self.batches.append(list(texts))
+        return [[float(len(text))] for text in texts]
+
+
+def test_embeds_in_worker_batches_and_tracks_throughput():
+    embedding = LlamaCppEmbedding("models/nomic-embed.gguf", worker_batch_size=2, text_prefix="doc: ")
+    embedding._model = FakeLlama()
+
+    result = embedding.get_text_embedding_batch(["a", "bb", "ccc"])
+
+    assert embedding.model_name.startswith("nomic-embed.gguf-")
+    assert result == [[6.0], [7.0], [8.0]]
+    assert embedding._model.batches == [["doc: a", "doc: bb"], ["doc: ccc"]]
+    assert embedding.throughput > 0
+
+
+def test_query_uses_query_prefix():
+    embedding = LlamaCppEmbedding("model.gguf", query_prefix="query: ")
+    embedding._model = FakeLlama()
+
+    assert embedding.get_query_embedding("x") == [8.0]
+
+
+def test_model_name_tells_apart_files_with_the_same_name(tmp_path):
+    (tmp_path / "q4").mkdir()
+    (tmp_path / "q8").mkdir()
+    (tmp_path / "q4" / "embed.gguf").write_bytes(b"q4")
+    (tmp_path / "q8" / "embed.gguf").write_bytes(b"q8 weights")
+
+    q4 = LlamaCppEmbedding(tmp_path / "q4" / "embed.gguf")
+    q8 = LlamaCppEmbedding(tmp_path / "q8" / "embed.gguf")
+    assert q4.model_name != q8.model_name
+    assert LlamaCppEmbedding(tmp_path / "q4" / "embed.gguf").model_name == q4.model_name
+
+
+def test_rejects_less_than_one_process():
+    with pytest.raises(ValueError):
+        LlamaCppEmbedding("model.gguf", n_processes=0)
@@ -0,0 +1,91 @@
+import json
+
+import numpy as np
+import pytest
+from llama_index.core.schema import NodeRelationship, RelatedNodeInfo, TextNode
+from llama_index.core.vector_stores.types import VectorStoreQuery
+
+from agentsystem.agents.index.vector_store import NumpyVectorStore
+
+
+def make_node(node_id, embedding, ref_doc_id="doc"):
+    return TextNode(
+        id_=node_id,
+        text=node_id,
+        embedding=list(embedding),
+        relationships={NodeRelationship.SOURCE: RelatedNodeInfo(node_id=ref_doc_id)},
+    )
+
+
+@pytest.fixture
+def store():
+    store = NumpyVectorStore()
+    store.add(
+        [
+            make_node("x", [1.0, 0.0, 0.0], "doc-a"),
+            make_node("y", [0.0, 1.0, 0.0], "doc-a"),
+            make_node("xy", [1.0, 1.0, 0.0], "doc-b"),
+        ]
+    )
+    return store
+
+
+def test_query_ranks_by_cosine_similarity(store):
+    result = store.query(VectorStoreQuery(query_embedding=[2.0, 0.1, 0.0], similarity_top_k=2))
+
+    assert result.ids == ["x", "xy"]
+    assert result.similarities[0] == pytest.approx(0.99875, abs=1e-4)
+
+
+def test_delete_removes_document_rows(store):
+    store.delete("doc-a")
+    result = store.query(VectorStoreQuery(query_embedding=[1.0, 0.0, 0.0], similarity_top_k=3))
+
+    assert result.ids == ["xy"]
+    assert store.count == 1
+
+
+def test_persist_and_load_memory_mapped(store, tmp_path):
+    persist_path = tmp_path / "default__vector_store.json"
+    store.persist(persist_path)
+    loaded = NumpyVectorStore.from_persist_dir(tmp_path)
+
+    assert isinstance(loaded._embeddings, np.memmap)
+    result = loaded.query(VectorStoreQuery(query_embedding=[0.0, 1.0, 0.0], similarity_top_k=1))
+    assert result.ids == ["y"]
+
+
+
+def test_simple_vector_store_is_migrated(tmp_path):
+    persist_path = tmp_path / "default__vector_store.json"
+    persist_path.write_text(
+        json.dumps(
+            {
+                "embedding_dict": {"x": [1.0, 0.0], "y": [0.0, 1.0]},
+                "text_id_to_ref_doc_id": {"x": "doc-a", "y": "doc-b"},
+                "metadata_dict": {},
+            }
+        )
+    )
+    store = NumpyVectorStore.from_persist_dir(tmp_path)
+    assert store.count == 2
+
+    store.persist(persist_path)
+    loaded = NumpyVectorStore.from_persist_dir(tmp_path)
+    result = loaded.query(VectorStoreQuery(query_embedding=[0.1, 1.0], similarity_top_k=1, doc_ids=["doc-b"]))
+    assert result.ids == ["y"]
+
+
+def test_ivf_matches_full_scan_on_clustered_data(tmp_path):
+    rng = np.random.default_rng(1)
+    centers = rng.normal(size=(4, 8))
+    vectors = np.repeat(centers, 50, axis=0) + rng.normal(scale=0.01, size=(200, 8))
+    exact = NumpyVectorStore()
+    clustered = NumpyVectorStore(ivf_threshold=100, ivf_probes=4)
+    for store in (exact, clustered):
+        store.add([make_node(str(i), v) for i, v in enumerate(vectors)])
+    clustered.persist(tmp_path / "default__vector_store.json")
+
+    query = VectorStoreQuery(query_embedding=list(centers[2]), similarity_top_k=5)
+    assert clustered._ivf_order is not None
+    assert clustered.query(query).ids == exact.query(query).ids
@@ -0,0 +1,348 @@
+"""
+A local llama_index vector store backed by NumPy arrays.
+
+Embeddings are kept unit-normalized in one contiguous float32 or float16 matrix that is saved as
+`.npy` and memory-mapped on load, so opening an index costs the same regardless of its size and
+only the rows a query touches are paged in. Node ids and ref doc ids are stored as fixed-width
+`.npy` string arrays next to it. Large stores can additionally be partitioned into clusters (IVF),
+in which case a query only scores the rows of the clusters closest to it.
+
+The arrays and their metadata are written next to the llama_index persist path, whose own file is
+left to SimpleVectorStore. A SimpleVectorStore found there is migrated on load.
+"""
+
+import json
+import math
+import os
+from pathlib import Path
+from typing import Any, List, Optional, Sequence
+
+import numpy as np
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.schema import BaseNode
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    VectorStoreQuery,
+    VectorStoreQueryMode,
+    VectorStoreQueryResult,
+)
+
+DEFAULT_PERSIST_FNAME = "default__vector_store.json"
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def _save(path: Path, array: np.ndarray) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        np.save(f, array)
+    os.replace(tmp, path)
+
+
+def _load(path: Path) -> np.ndarray:
+    return np.load(path, mmap_mode="r")
+
+
+class NumpyVectorStore(BasePydanticVectorStore):
+    """
+    Vector store that keeps embeddings in a memory-mapped NumPy matrix and ranks them by cosine similarity.
+
+    Attributes:
+        dtype (str): Storage type of the embedding matrix, "float32" or "float16".
+        ivf_threshold (int): Row count from which the store is partitioned into clusters on persist.
+        ivf_probes (int): How many of the closest clusters a query scores.
+        block_size (int): How many rows are scored at once during a full scan.
+    """
+
+    stores_text: bool = False
+    dtype: str = "float32"
+    ivf_threshold: int = 50_000
+    ivf_probes: int = 8
+    block_size: int = 65_536
+
+    _embeddings: Optional[np.ndarray] = PrivateAttr(default=None)
+    _node_ids: Optional[np.ndarray] = PrivateAttr(default=None)
+    _ref_doc_ids: Optional[np.ndarray] = PrivateAttr(default=None)
+    _alive: Optional[np.ndarray] = PrivateAttr(default=None)
+    _pending: list = PrivateAttr(default_factory=list)
+    _centroids: Optional[np.ndarray] = PrivateAttr(default=None)
+    _ivf_order: Optional[np.ndarray] = PrivateAttr(default=None)
+    _ivf_offsets: Optional[np.ndarray] = PrivateAttr(default=None)
+    _ivf_trained_on: int = PrivateAttr(default=0)
+    _dirty: bool = PrivateAttr(default=False)
+    _persist_path: Optional[Path] = PrivateAttr(default=None)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "NumpyVectorStore"
+
+    @property
+    def client(self) -> None:
+        return None
+
+    @property
+    def count(self) -> int:
+        """The number of stored, not deleted rows."""
+        self._materialize()
+        if self._embeddings is None:
+            return 0
+        return int(self._alive.sum()) if self._alive is not None else len(self._embeddings)
+
+    @classmethod
+    def from_persist_dir(
+        cls, persist_dir, namespace: str = "default", **kwargs: Any
+    ) -> "NumpyVectorStore":
+        """Loads the store persisted by StorageContext.persist into persist_dir, or returns an empty one."""
+        return cls.from_persist_path(
+            Path(persist_dir) / DEFAULT_PERSIST_FNAME.replace("default", namespace, 1), **kwargs
+        )
+
+    @classmethod
+    def from_persist_path(cls, persist_path, **kwargs: Any) -> "NumpyVectorStore":
+        """Memory-maps the arrays persisted at persist_path, or returns an empty store if there are none."""
+        persist_path = Path(persist_path)
+        files = cls._files(persist_path)
+        if not files["meta"].exists():
+            store = cls(**kwargs)
+            store._persist_path = persist_path
+            if persist_path.exists():
+                store._migrate_simple_vector_store(persist_path)
+            return store
+        meta = json.loads(files["meta"].read_text())
+        store = cls(**{"dtype": meta["dtype"], **kwargs})
+        store._persist_path = persist_path
+        if not meta["count"]:
+            return store
+        store._embeddings = _load(files["embeddings"])
+        store._node_ids = _load(files["node_ids"])
+        store._ref_doc_ids = _load(files["ref_doc_ids"])
+        if meta.get("ivf_trained_on"):
+            store._centroids = _load(files["centroids"])
+            store._ivf_order = _load(files["ivf_order"])
+            store._ivf_offsets = _load(files["ivf_offsets"])
+            store._ivf_trained_on = meta["ivf_trained_on"]
+        return store
+
+    @staticmethod
+    def _files(persist_path: Path) -> dict[str, Path]:
+        stem = persist_path.with_suffix("")
+        names = ["embeddings", "node_ids", "ref_doc_ids", "centroids", "ivf_order", "ivf_offsets"]
+        files = {name: stem.with_name(f"{stem.name}.{name}.npy") for name in names}
+        files["meta"] = stem.with_name(f"{stem.name}.numpy_meta.json")
+        return files
+
+    def _migrate_simple_vector_store(self, persist_path: Path) -> None:
+        """Queues the embeddings of the SimpleVectorStore persisted at persist_path, they are written as arrays on persist."""
+        try:
+            data = json.loads(persist_path.read_text())
+        except (OSError, ValueError):
+            return
+        embeddings = data.get("embedding_dict") if isinstance(data, dict) else None
+        if not embeddings:
+            return
+        ref_doc_ids = data.get("text_id_to_ref_doc_id") or {}
+        for node_id, embedding in embeddings.items():
+            self._pending.append((node_id, ref_doc_ids.get(node_id) or "", embedding))
+
+    def add(self, nodes: Sequence[BaseNode], **add_kwargs: Any) -> List[str]:
+        """Queues the embeddings of the given nodes, they are written into the matrix on the next query or persist."""
+        for node in nodes:
+            self._pending.append((node.node_id, node.ref_doc_id or "", node.get_embedding()))
+        return [node.node_id for node in nodes]
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        """Marks every row of the given document as deleted, rows are dropped on the next persist."""
+        self._materialize()
+        if self._ref_doc_ids is None:
+            return
+        self._mark_deleted(np.asarray(self._ref_doc_ids) == ref_doc_id)
+
+    def delete_nodes(
+        self, node_ids: Optional[List[str]] = None, filters=None, **delete_kwargs: Any
+    ) -> None:
+        if filters is not None:
+            raise NotImplementedError("Metadata filters are not supported by NumpyVectorStore")
+        self._materialize()
+        if self._node_ids is None or not node_ids:
+            return
+        self._mark_deleted(np.isin(self._node_ids, node_ids))
+
+    def clear(self) -> None:
+        self._embeddings = self._node_ids = self._ref_doc_ids = self._alive = None
+        self._centroids = self._ivf_order = self._ivf_offsets = None
+        self._ivf_trained_on = 0
+        self._pending = []
+        self._dirty = True
+
+    def _mark_deleted(self, rows: np.ndarray) -> None:
+        if not rows.any():
+            return
+        if self._alive is None:
+            self._alive = np.ones(len(self._embeddings), dtype=bool)
+        self._alive[rows] = False
+        self._dirty = True
+
+    def _materialize(self) -> None:
+        """Appends the queued nodes to the matrix."""
+        if not self._pending:
+            return
+        node_ids, ref_doc_ids, embeddings = zip(*self._pending)
+        self._pending = []
+        vectors = _normalize(np.asarray(embeddings, dtype=np.float32)).astype(self.dtype)
+        if self._embeddings is None:
+            self._embeddings = vectors
+            self._node_ids = np.asarray(node_ids)
+            self._ref_doc_ids = np.asarray(ref_doc_ids)
+        else:
+            self._embeddings = np.concatenate([self._embeddings, vectors])
+            self._node_ids = np.concatenate([self._node_ids, node_ids])
+            self._ref_doc_ids = np.concatenate([self._ref_doc_ids, ref_doc_ids])
+            if self._alive is not None:
+                self._alive = np.concatenate([self._alive, np.ones(len(vectors), dtype=bool)])
+        self._dirty = True
+
+    def _compact(self) -> None:
+        """Drops deleted rows. Row numbers change, so the clusters are reassigned."""
+        if self._alive is None:
+            return
+        alive = self._alive
+        self._embeddings = np.ascontiguousarray(self._embeddings[alive])
+        self._node_ids = np.asarray(self._node_ids)[alive]
+        self._ref_doc_ids = np.asarray(self._ref_doc_ids)[alive]
+        self._alive = None
+        self._ivf_order = self._ivf_offsets = None
+
+    def _scores(self, query: np.ndarray, rows: Optional[np.ndarray]) -> np.ndarray:
+        """Cosine similarity of the query to the given rows, or to all rows block by block."""
+        if rows is not None:
+            return self._embeddings[rows].astype(np.float32) @ query
+        scores = np.empty(len(self._embeddings), dtype=np.float32)
+        for start in range(0, len(scores), self.block_size):
+            block = self._embeddings[start : start + self.block_size]
+            scores[start : start + len(block)] = block.astype(np.float32) @ query
+        return scores
+
+    def build_ivf(self, n_lists: Optional[int] = None, iterations: int = 10) -> None:
+        """Partitions the rows into n_lists clusters with spherical k-means.
+
+        Args:
+            n_lists (Optional[int]): The number of clusters. Defaults to the square root of the row count.
+            iterations (int): The number of k-means iterations. Defaults to 10.
+        """
+        self._materialize()
+        self._compact()
+        count = len(self._embeddings)
+        n_lists = min(n_lists or int(math.sqrt(count)), count)
+        rng = np.random.default_rng(0)
+        sample_rows = np.sort(rng.choice(count, size=min(count, 256 * n_lists), replace=False))
+        sample = self._embeddings[sample_rows].astype(np.float32)
+        centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)]
+        for _ in range(iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            empty = np.bincount(assignment, minlength=n_lists) == 0
+            sums[empty] = centroids[empty]
+            centroids = _normalize(sums)
+        self._centroids = centroids
+        self._ivf_trained_on = count
+        self._assign_ivf()
+
+    def _assign_ivf(self) -> None:
+        """Sorts all rows by their closest centroid, the rows of cluster i are order[offsets[i]:offsets[i + 1]]."""
+        assignment = np.empty(len(self._embeddings), dtype=np.int32)
+        for start in range(0, len(assignment), self.block_size):
+            block = self._embeddings[start : start + self.block_size].astype(np.float32)
+            assignment[start : start + len(block)] = np.argmax(block @ self._centroids.T, axis=1)
+        self._ivf_order = np.argsort(assignment, kind="stable")
+        self._ivf_offsets = np.concatenate(
+            [[0], np.cumsum(np.bincount(assignment, minlength=len(self._centroids)))]
+        )
+        self._dirty = True
+
+    def _candidate_rows(self, query: np.ndarray) -> Optional[np.ndarray]:
+        """Rows of the clusters closest to the query plus rows added after clustering, None for a full scan."""
+        if self._ivf_order is None:
+            return None
+        probes = min(self.ivf_probes, len(self._centroids))
+        closest = np.argpartition(-(self._centroids @ query), probes - 1)[:probes]
+        offsets = self._ivf_offsets
+        rows = [self._ivf_order[offsets[i] : offsets[i + 1]] for i in closest]
+        rows.append(np.arange(len(self._ivf_order), len(self._embeddings)))
+        return np.sort(np.concatenate(rows))
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        """Returns the ids and cosine similarities of the query.similarity_top_k closest nodes."""
+        if query.filters is not None:
+            raise NotImplementedError("Metadata filters are not supported by NumpyVectorStore")
+        if query.mode != VectorStoreQueryMode.DEFAULT:
+            raise NotImplementedError(f"Query mode {query.mode} is not supported by NumpyVectorStore")
+        self._materialize()
+        if self._embeddings is None or query.query_embedding is None:
+            return VectorStoreQueryResult(nodes=[], similarities=[], ids=[])
+
+        embedding = _normalize(np.asarray(query.query_embedding, dtype=np.float32))
+        rows = self._candidate_rows(embedding)
+        scores = self._scores(embedding, rows)
+        selected = slice(None) if rows is None else rows
+        valid = np.ones(len(scores), dtype=bool)
+        if self._alive is not None:
+            valid &= self._alive[selected]
+        if query.doc_ids is not None:
+            valid &= np.isin(self._ref_doc_ids[selected], query.doc_ids)
+        if query.node_ids is not None:
+            valid &= np.isin(self._node_ids[selected], query.node_ids)
+        scores = np.where(valid, scores, -np.inf)
+
+        top_k = min(query.similarity_top_k, int(valid.sum()))
+        if top_k == 0:
+            return VectorStoreQueryResult(nodes=[], similarities=[], ids=[])
+        top = np.argpartition(-scores, top_k - 1)[:top_k]
+        top = top[np.argsort(-scores[top])]
+        result_rows = top if rows is None else rows[top]
+        return VectorStoreQueryResult(
+            nodes=[],
+            similarities=scores[top].tolist(),
+            ids=[str(node_id) for node_id in self._node_ids[result_rows]],
+        )
+
+    def persist(self, persist_path: str = DEFAULT_PERSIST_FNAME, fs=None) -> None:
+        """Writes the arrays next to persist_path and re-opens them memory-mapped.
+
+        Clusters are (re)built here once the store has ivf_threshold rows.
+        """
+        persist_path = Path(persist_path)
+        self._materialize()
+        self._compact()
+        count = 0 if self._embeddings is None else len(self._embeddings)
+        if count >= self.ivf_threshold:
+            if self._centroids is None or count > 2 * self._ivf_trained_on:
+                self.build_ivf()
+            elif self._ivf_order is None or len(self._ivf_order) != count:
+                self._assign_ivf()
+        if not self._dirty and persist_path == self._persist_path:
+            return
+
+        persist_path.parent.mkdir(parents=True, exist_ok=True)
+        files = self._files(persist_path)
+        meta = {"dtype": self.dtype, "count": count, "ivf_trained_on": 0}
+        if count:
+            _save(files["embeddings"], self._embeddings)
+            _save(files["node_ids"], np.asarray(self._node_ids))
+            _save(files["ref_doc_ids"], np.asarray(self._ref_doc_ids))
+            if self._ivf_order is not None:
+                _save(files["centroids"], self._centroids)
+                _save(files["ivf_order"], self._ivf_order)
+                _save(files["ivf_offsets"], self._ivf_offsets)
+                meta["ivf_trained_on"] = self._ivf_trained_on
+        files["meta"].write_text(json.dumps(meta))
+
+        self._dirty = False
+        self._persist_path = persist_path
+        if count:
+            self._embeddings = _load(files["embeddings"])
+            self._node_ids = _load(files["node_ids"])
+            self._ref_doc_ids = _load(files["ref_doc_ids"])
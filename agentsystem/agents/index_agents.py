@@ -17,6 +17,12 @@ from llama_index.core.chat_engine.types import ChatMode
 from regex import P
 
 from agentsystem.agents.agents import Agent
+from agentsystem.agents.index.bm25 import BM25Index, BM25Retriever, HybridRetriever, node_texts
+from agentsystem.agents.index.code_parser import PythonCodeNodeParser
+from agentsystem.agents.index.embedding_cache import CachedEmbedding
+from agentsystem.agents.index.fast_query import FastQueryEngine
+from agentsystem.agents.index.local_embedding import LlamaCppEmbedding
+from agentsystem.agents.index.vector_store import NumpyVectorStore
 from agentsystem.models.Response import Response
 from dotenv import load_dotenv
 import os
@@ -34,6 +40,21 @@ if not data_directory:
     raise ValueError("DATA_DIRECTORY environment variable is not set")
 DATA_DIRECTORY = Path(data_directory)
 PERSIST_DIR = Path(os.getenv("PERSIST_DIR")).absolute()
+# Shared by every persist directory and process, so identical chunks are embedded only once
+EMBEDDING_CACHE_DIR = Path(
+    os.getenv("EMBEDDING_CACHE_DIR", Path.home() / ".cache" / "agentsystem" / "embeddings")
+).absolute()
+# float16 halves the size of the memory-mapped embedding matrix at a small precision cost
+VECTOR_STORE_DTYPE = os.getenv("VECTOR_STORE_DTYPE", "float32")
+# "azure" or "llama_cpp", the latter embeds locally with the GGUF model at EMBEDDING_MODEL_PATH
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "azure")
+EMBEDDING_MODEL_PATH = os.getenv("EMBEDDING_MODEL_PATH")
+EMBEDDING_PROCESSES = int(os.getenv("EMBEDDING_PROCESSES", "1"))
+# "fast" answers with one retrieval and one completion, "react" runs the ReAct chat engine
+QUERY_MODE = os.getenv("INDEX_QUERY_MODE", "fast")
+CONTEXT_TOKEN_BUDGET = int(os.getenv("INDEX_CONTEXT_TOKENS", "3000"))
+# Weight of the vector scores in the hybrid retrieval of fast mode, 1 disables BM25
+HYBRID_ALPHA = float(os.getenv("INDEX_HYBRID_ALPHA", "0.5"))
 API_KEY = os.getenv("AZURE_INFERENCE_CREDENTIAL")
 AZURE_INFERENCE_ENDPOINT = os.getenv("AZURE_INFERENCE_ENDPOINT")
 os.environ["OPEN_AI_KEY"] = API_KEY if API_KEY else ""
@@ -41,7 +62,6 @@ os.environ["OPEN_AI_KEY"] = API_KEY if API_KEY else ""
 
 from llama_index.core.memory import ChatMemoryBuffer
 
-memory = ChatMemoryBuffer.from_defaults(token_limit=1500)
 
 class IndexAgent(Agent):
 
@@ -60,26 +80,44 @@ class IndexAgent(Agent):
 
     # LLM and Embedding Model setup
     def setup_models(self):
-        if API_KEY is None:
+        if API_KEY is None and EMBEDDING_BACKEND != "llama_cpp":
             raise ValueError("API_KEY environment variable is not set")
 
         try:
-            Settings.llm = AzureAICompletionsModel(
-                endpoint=f"{AZURE_INFERENCE_ENDPOINT}/openai/deployments/gpt-4o",
-                credential=API_KEY,
-                client_kwargs={"headers": {"api-key": API_KEY}},
-                model_name="gpt-4o",
-            )
-            Settings.embed_model = AzureAIEmbeddingsModel(
-                endpoint=f"{AZURE_INFERENCE_ENDPOINT}/openai/deployments/text-embedding-3-large",
-                credential=API_KEY,
-                model_name="text-embedding-3-large",
-                api_version="2023-05-15",
+            if API_KEY is None:
+                # local embeddings build the index offline, answering questions still needs the completion model
+                logging.getLogger("llama_index_logger").warning(
+                    "AZURE_INFERENCE_CREDENTIAL is not set, questions are answered by a mock LLM"
+                )
+                Settings.llm = None
+            else:
+                Settings.llm = AzureAICompletionsModel(
+                    endpoint=f"{AZURE_INFERENCE_ENDPOINT}/openai/deployments/gpt-4o",
+                    credential=API_KEY,
+                    client_kwargs={"headers": {"api-key": API_KEY}},
+                    model_name="gpt-4o",
+                )
+            Settings.embed_model = CachedEmbedding(
+                self.setup_embed_model(), cache_dir=EMBEDDING_CACHE_DIR
             )
         except Exception as e:
             self.logger.error(f"Error setting up models: {e}")
             raise
 
+    def setup_embed_model(self):
+        if EMBEDDING_BACKEND == "llama_cpp":
+            if not EMBEDDING_MODEL_PATH:
+                raise ValueError("EMBEDDING_MODEL_PATH environment variable is not set")
+            return LlamaCppEmbedding(
+                model_path=EMBEDDING_MODEL_PATH, n_processes=EMBEDDING_PROCESSES
+            )
+        return AzureAIEmbeddingsModel(
+            endpoint=f"{AZURE_INFERENCE_ENDPOINT}/openai/deployments/text-embedding-3-large",
+            credential=API_KEY,
+            model_name="text-embedding-3-large",
+            api_version="2023-05-15",
+        )
+
     def load_documents(self):
         return SimpleDirectoryReader(
             recursive=True, required_exts=[".py"], input_dir=DATA_DIRECTORY
@@ -88,41 +126,98 @@ class IndexAgent(Agent):
     def setup_index(self):
 
         storage_context = StorageContext.from_defaults(
-            persist_dir=PERSIST_DIR.as_posix()
+            persist_dir=PERSIST_DIR.as_posix(),
+            vector_store=NumpyVectorStore.from_persist_dir(
+                PERSIST_DIR, dtype=VECTOR_STORE_DTYPE
+            ),
         )
         index = VectorStoreIndex.from_documents(
-            self.documents, storage_context=storage_context, show_progress=True
+            self.documents,
+            storage_context=storage_context,
+            transformations=[PythonCodeNodeParser()],
+            show_progress=True,
         )
 
-        index.storage_context.persist()
+        index.storage_context.persist(persist_dir=PERSIST_DIR.as_posix())
         return index
 
+    def setup_keyword_index(self):
+        bm25_path = PERSIST_DIR / "bm25_index.npz"
+        keyword_index = BM25Index.load(bm25_path)
+        docstore = self.SourceIndex.docstore
+        keyword_index.sync(
+            node_texts(docstore.get_nodes(list(self.SourceIndex.index_struct.nodes_dict.values())))
+        )
+        keyword_index.persist(bm25_path)
+        return keyword_index
+
     # Initialize the base Agent class with model set to None because the IndexAgent
     # uses a custom query engine and does not require a separate model.
-    def __init__(self, **kwargs):
+    def __init__(
+        self,
+        mode: str = QUERY_MODE,
+        similarity_top_k: int = 8,
+        context_token_budget: int = CONTEXT_TOKEN_BUDGET,
+        **kwargs,
+    ):
+        """Creates an IndexAgent over the python files in DATA_DIRECTORY.
+
+        Args:
+            mode (str): "fast" for one retrieval and one streamed completion per question, "react" for the ReAct chat engine.
+            similarity_top_k (int): Number of chunks retrieved per question in fast mode.
+            context_token_budget (int): Maximum tokens of retrieved context per question in fast mode.
+        """
         super().__init__(model=None, **kwargs)
+        self.mode = mode
         self.setup_models()
         self.logger = self.setup_logging()
         set_global_handler("simple", logger=self.logger)
         self.documents = self.load_documents()
         self.SourceIndex = self.setup_index()
         self.SourceQuery = self.SourceIndex.as_query_engine()
-        self.SourceChat = self.SourceIndex.as_chat_engine(chat_mode=ChatMode.REACT, memory=memory)
+        self.KeywordIndex = self.setup_keyword_index()
+        self.SourceFast = FastQueryEngine(
+            HybridRetriever(
+                self.SourceIndex.as_retriever(similarity_top_k=similarity_top_k),
+                BM25Retriever(self.KeywordIndex, self.SourceIndex.docstore, similarity_top_k),
+                alpha=HYBRID_ALPHA,
+            ),
+            context_token_budget=context_token_budget,
+        )
+        self.sessions: dict[str, ChatMemoryBuffer] = {}
+        self._react_engines = {}
+
+    def memory(self, session_id: str) -> ChatMemoryBuffer:
+        """Returns the chat history of the given session."""
+        if session_id not in self.sessions:
+            self.sessions[session_id] = ChatMemoryBuffer.from_defaults(token_limit=1500)
+        return self.sessions[session_id]
+
+    def chat(self, prompt_message: str, session_id: str = "default", system_message: str = "") -> str:
+        if self.mode == "react":
+            if session_id not in self._react_engines:
+                self._react_engines[session_id] = self.SourceIndex.as_chat_engine(
+                    chat_mode=ChatMode.REACT, memory=self.memory(session_id)
+                )
+            response = self._react_engines[session_id].chat(prompt_message)
+            return response.response if response and response.response else "None"
+        return self.SourceFast.chat(
+            prompt_message, memory=self.memory(session_id), system_message=system_message
+        ) or "None"
 
     def execute(
         self,
         system_message: str = "",
         prompt_message: str = "",
         prefix_message: str = "",
+        session_id: str = "default",
     ):
         def execute_query():
             try:
-                response = self.SourceChat.chat(prompt_message)
-                return response.response if response and response.response else "None"
+                return self.chat(prompt_message, session_id, system_message)
             except Exception as e:
-                self.logger.error(f"Error querying SourceQuery: {e}")
-                response = "None"
-            # Use the SourceQuery to get a response
+                self.logger.error(f"Error querying the index: {e}")
+                return "None"
 
         return Response(lambda: execute_query())
 
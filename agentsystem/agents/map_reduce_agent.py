@@ -0,0 +1,156 @@
+"""
+Answers a prompt about a document that does not fit into the model's context.
+
+The document is split by token budget on structural boundaries (statements of Python sources,
+paragraphs of other text), a worker agent answers the prompt for every chunk in parallel and the
+partial answers are combined by a reducer, level by level, until one answer is left. Chunks keep
+the line numbers of the whole document, so "@<line number>" references of the workers stay valid in
+the combined answer.
+"""
+
+from typing import Callable, Optional
+
+from agentsystem.agents.agents import Agent, fan_out
+from agentsystem.models.Model import Model
+from agentsystem.models.Response import Response
+from agentsystem.templates import document_prompt
+from agentsystem.util import TextChunk, split_by_token_budget
+
+REDUCE_SYSTEM = """You combine partial answers to the same prompt into one answer. Each partial answer was written for a part of a document, its header names the lines of that part. Merge overlapping points, keep everything relevant and do not add information that is not in the partial answers. Keep every "@<line number>" reference exactly as written, the line numbers refer to the whole document."""
+
+
+def _text(response) -> str:
+    return str(getattr(response, "content", response) or "")
+
+
+class MapReduceAgent(Agent):
+    """Maps a worker over the chunks of a document and reduces the partial answers hierarchically."""
+
+    def __init__(
+        self,
+        *,
+        model: Model,
+        chunk_tokens: int = 2000,
+        token_counter: Callable[[str], int] = lambda text: len(text) // 4,
+        max_concurrency: int = 4,
+        worker: Optional[Agent] = None,
+        reducer: Optional[Agent] = None,
+        **extra_args,
+    ):
+        """Creates a MapReduceAgent.
+
+        Args:
+            model (Model): The model of the default worker and reducer.
+            chunk_tokens (int): Token budget of a chunk of the document and of the input of one reduce step. Defaults to 2000.
+            token_counter (Callable[[str], int]): Counts tokens. Defaults to a 4 characters per token estimate.
+            max_concurrency (int): Chunks or reduce steps run at once. Defaults to 4, use 1 for LlamaModel.
+            worker (Optional[Agent]): Answers the prompt for one chunk, its response is used as text.
+                Defaults to an Agent on model with the document_prompt template.
+            reducer (Optional[Agent]): Combines partial answers. Defaults to an Agent on model.
+            **extra_args: Additional arguments passed to the model by the default worker and reducer.
+        """
+        super().__init__(model=model, **extra_args)
+        self.chunk_tokens = chunk_tokens
+        self.token_counter = token_counter
+        self.max_concurrency = max_concurrency
+        self.worker = worker or Agent(model=model, postprocessor=_text, **extra_args)
+        self.reducer = reducer or Agent(model=model, postprocessor=_text, **extra_args)
+
+    def split(self, document: str) -> list[TextChunk]:
+        return split_by_token_budget(document, self.chunk_tokens, self.token_counter)
+
+    def map(self, chunks: list[TextChunk], prompt_message: str, system_message: str = "") -> list[str]:
+        """The worker's answer for every chunk, in order."""
+        total_lines = chunks[-1].end_line if chunks else 0
+
+        def worker_input(chunk: TextChunk) -> dict:
+            user_prompt = (
+                f"The content is lines {chunk.start_line}-{chunk.end_line} of a document with {total_lines} lines, "
+                f"answer for these lines only.\n{prompt_message}"
+            )
+            return {
+                "system_message": system_message or document_prompt.default_sys(),
+                "prompt_message": document_prompt.default_prompt(file_content=chunk.numbered(), user_prompt=user_prompt),
+                "prefix_message": "",
+            }
+
+        return self._run_all(self.worker, chunks, worker_input)
+
+    def reduce(self, partials: list[tuple[TextChunk, str]], prompt_message: str) -> str:
+        """Combines the (chunk, answer) partial answers in groups that fit chunk_tokens until one answer is left."""
+        level = [(f"[lines {chunk.start_line}-{chunk.end_line}]", answer) for chunk, answer in partials if answer.strip()]
+        if not level:
+            return ""
+        while len(level) > 1:
+            groups = self._groups(level)
+            if len(groups) == len(level):
+                # every partial answer alone exceeds the budget, combine pairs so that the reduction ends
+                groups = [level[i : i + 2] for i in range(0, len(level), 2)]
+
+            def reducer_input(group) -> dict:
+                partial_answers = "\n\n".join(f"{header}\n{answer}" for header, answer in group)
+                return {
+                    "system_message": REDUCE_SYSTEM,
+                    "prompt_message": f"{partial_answers}\n\nPrompt: {prompt_message}",
+                    "prefix_message": "",
+                }
+
+            single = {index for index, group in enumerate(groups) if len(group) == 1}
+            reduced = self._run_all(self.reducer, [group for group in groups if len(group) > 1], reducer_input)
+            reduced_answers = iter(reduced)
+            level = [
+                group[0] if index in single else (self._header(group), next(reduced_answers))
+                for index, group in enumerate(groups)
+            ]
+        return level[0][1]
+
+    @staticmethod
+    def _header(group) -> str:
+        first, last = group[0][0], group[-1][0]
+        return f"{first.split('-')[0]}-{last.split('-')[1]}"
+
+    def _groups(self, level: list[tuple[str, str]]) -> list[list[tuple[str, str]]]:
+        groups: list[list[tuple[str, str]]] = []
+        tokens = 0
+        for header, answer in level:
+            answer_tokens = self.token_counter(f"{header}\n{answer}")
+            if groups and tokens + answer_tokens <= self.chunk_tokens:
+                groups[-1].append((header, answer))
+                tokens += answer_tokens
+            else:
+                groups.append([(header, answer)])
+                tokens = answer_tokens
+        return groups
+
+    def _run_all(self, agent: Agent, items: list, agent_input: Callable) -> list[str]:
+        answers = []
+        for _, _, result in fan_out(items, agent, self.max_concurrency, worker_input=agent_input):
+            if not result.ok:
+                raise result.error
+            answers.append(_text(result.value))
+        return answers
+
+    def execute(
+        self,
+        system_message: str = "",
+        prompt_message: str = "",
+        prefix_message: str = "",
+        document: str = "",
+    ) -> Response:
+        """Answers prompt_message about document.
+
+        Args:
+            system_message (str): System message of the workers. Defaults to document_prompt.default_sys.
+            prompt_message (str): The prompt about the document.
+            prefix_message (str): Not used, the answer is combined from several runs.
+            document (str): The document, e.g. a file or the result of get_matched_files_content.
+        """
+
+        def execution():
+            chunks = self.split(document)
+            answers = self.map(chunks, prompt_message, system_message)
+            if len(chunks) == 1:
+                return answers[0]
+            return self.reduce(list(zip(chunks, answers)), prompt_message)
+
+        return Response(execution)
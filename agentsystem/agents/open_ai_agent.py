@@ -1,20 +1,26 @@
 import json
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Any
-from openai import AzureOpenAI
+from typing import Any, Optional
+from openai import NOT_GIVEN, AzureOpenAI
 from agentsystem.agents.agents import Agent
-from agentsystem.agents.tools.tool import Tool
-from agentsystem.models.Model import Model
+from agentsystem.agents.tools.tool import Tool, ToolArgumentError
+from agentsystem.agents.tools.tool_selector import ToolSelector, tool_text
+from agentsystem.models.Model import BatchResult, Model
 from openai.types.chat.chat_completion_tool_choice_option_param import (
     ChatCompletionToolChoiceOptionParam,
 )
 from agentsystem.models.Response import Response
 
+API_VERSION = os.getenv("AZURE_INFERENCE_API_VERSION", "2024-05-01-preview")
+# the first Azure OpenAI API version with json_schema response formats (structured outputs)
+STRUCTURED_OUTPUTS_API_VERSION = "2024-08-01-preview"
 
-class OpenAIModel(Model):
 
-    def __init__(self, model=None, *args, **kwargs):
+class OpenAIModel(Model):
+    def __init__(self, model=None, *args, api_version: str = API_VERSION, **kwargs):
         super().__init__(model=self, *args, **kwargs)
         self.client = None
         self.deployment_name = None
@@ -22,8 +28,10 @@ class OpenAIModel(Model):
         self.client = AzureOpenAI(
             azure_endpoint=os.getenv("AZURE_INFERENCE_ENDPOINT"),
             api_key=os.getenv("AZURE_INFERENCE_CREDENTIAL"),
-            api_version="2024-05-01-preview",
+            api_version=api_version,
         )
+        # older API versions reject response_format json_schema, ParsedAgent then parses free text
+        self.constraint_formats = ("json_schema",) if api_version >= STRUCTURED_OUTPUTS_API_VERSION else ()
 
         # Define the deployment you want to use for your chat completions API calls
         self.deployment_name = os.getenv("DEPLOYMENT")
@@ -31,6 +39,17 @@ class OpenAIModel(Model):
     def format(self, system_message, prompt_message, prefix_message) -> str:
         return ""
 
+    def identity(self) -> str:
+        return f"{type(self).__name__}:{self.deployment_name}"
+
+    def constraint_args(self, constraint) -> dict:
+        return {
+            "response_format": {
+                "type": "json_schema",
+                "json_schema": {"name": "parsed_output", "schema": constraint.schema, "strict": True},
+            }
+        }
+
     def _run(
         self,
         prompt: str = "",
@@ -54,18 +73,116 @@ class OpenAIModel(Model):
         )
 
         if response.choices and response.choices[0].message:
+            logprobs = getattr(response.choices[0], "logprobs", None)
+            self._record_logprobs([token.logprob for token in logprobs.content] if logprobs and logprobs.content else None)
             return response.choices[0].message
         return "<Error: No response from the model>"
 
+    @staticmethod
+    def _messages(system_message, prompt_message, prefix_message) -> list[dict]:
+        messages = [
+            {"role": "system", "content": system_message},
+            {"role": "user", "content": prompt_message},
+            {"role": "assistant", "content": prefix_message},
+        ]
+        return [message for message in messages if message["content"]]
+
+    def run_batch(
+        self,
+        messages,
+        max_concurrency: int = 8,
+        offline: bool = False,
+        poll_seconds: float = 30.0,
+        **extra_args,
+    ) -> list[BatchResult]:
+        """Runs chat completions for many (system, prompt, prefix) message triples.
+
+        Args:
+            messages (List[tuple[str, str, str]]): The system, prompt and prefix message of every item.
+            max_concurrency (int): Maximum number of concurrent requests. Defaults to 8.
+            offline (bool): Submit the items as one job to the batch endpoint instead, which is cheaper
+                but can take up to a day. Defaults to False.
+            poll_seconds (float): Seconds between status checks of an offline job.
+
+        Returns:
+            list[BatchResult]: The response message of every item, in the order of messages.
+        """
+        conversations = [self._messages(*triple) for triple in messages]
+        if offline:
+            return self._run_offline_batch(conversations, poll_seconds, **extra_args)
+
+        def run_one(conversation):
+            try:
+                value = self._run(
+                    messages=conversation, tools=NOT_GIVEN, tool_choice=NOT_GIVEN, **extra_args
+                )
+                return BatchResult(value=value)
+            except Exception as e:
+                return BatchResult(error=e)
+
+        with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(conversations)))) as executor:
+            return list(executor.map(run_one, conversations))
+
+    def _run_offline_batch(self, conversations, poll_seconds: float, **extra_args) -> list[BatchResult]:
+        """Runs the conversations as a job of the batch endpoint and waits for its output."""
+        lines = [
+            json.dumps(
+                {
+                    "custom_id": str(i),
+                    "method": "POST",
+                    "url": "/chat/completions",
+                    "body": {"model": self.deployment_name, "messages": conversation, **extra_args},
+                }
+            )
+            for i, conversation in enumerate(conversations)
+        ]
+        batch_file = self.client.files.create(
+            file=("batch.jsonl", "\n".join(lines).encode()), purpose="batch"
+        )
+        batch = self.client.batches.create(
+            input_file_id=batch_file.id, endpoint="/chat/completions", completion_window="24h"
+        )
+        while batch.status not in ("completed", "failed", "expired", "cancelled"):
+            time.sleep(poll_seconds)
+            batch = self.client.batches.retrieve(batch.id)
+
+        results = [
+            BatchResult(error=RuntimeError(f"Batch {batch.id} {batch.status} without a result for this item"))
+            for _ in conversations
+        ]
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if not file_id:
+                continue
+            for line in self.client.files.content(file_id).text.splitlines():
+                if not line.strip():
+                    continue
+                item = json.loads(line)
+                index = int(item["custom_id"])
+                response = item.get("response") or {}
+                if item.get("error") or response.get("status_code", 200) != 200:
+                    error = item.get("error") or response.get("body", {}).get("error")
+                    results[index] = BatchResult(error=RuntimeError(f"Batch item failed: {error}"))
+                else:
+                    results[index] = BatchResult(value=response["body"]["choices"][0]["message"])
+        return results
+
 
 class OpenAIToolChat(Agent):
     messages: list[dict] = []
 
-    def __init__(self, model, *args, **kwargs):
+    def __init__(self, model, *args, tool_selector: Optional[ToolSelector] = None, **kwargs):
+        """Creates a tool calling chat.
+
+        Args:
+            model (Model): The model, usually an OpenAIModel.
+            tool_selector (Optional[ToolSelector]): If given, only the tools it selects for the current
+                turn are sent to the model instead of all tools.
+        """
         super().__init__(model=model, *args, **kwargs)
         self.tools: list[Tool] = []
         self.messages: list[dict] = []
         self._tool_map = {}  # Map tool names to tool instances
+        self.tool_selector = tool_selector
 
     def add_tool(self, tool: Tool):
         """Add a tool to the agent and update the tool map."""
@@ -118,7 +235,7 @@ class OpenAIToolChat(Agent):
 
                 # Parse and execute the tool
                 try:
-                    args = json.loads(tool_call.function.arguments)
+                    args = tool.validate_arguments(json.loads(tool_call.function.arguments))
                     result = tool.execute(**args)()
 
                     # Add tool response to conversation
@@ -130,6 +247,16 @@ class OpenAIToolChat(Agent):
                             "content": str(result),
                         }
                     )
+                except (ToolArgumentError, json.JSONDecodeError) as e:
+                    # Let the model correct its arguments
+                    self.messages.append(
+                        {
+                            "tool_call_id": tool_call.id,
+                            "role": "tool",
+                            "name": tool_call.function.name,
+                            "content": f"Invalid arguments: {str(e)}",
+                        }
+                    )
                 except Exception as e:
                     # Handle tool execution errors
                     self.messages.append(
@@ -163,4 +290,26 @@ class OpenAIToolChat(Agent):
         return final_response_content
 
     def list_open_ai_descriptions(self):
-        return [tool.get_openai_description() for tool in self.tools]
+        descriptions = [tool.get_openai_description() for tool in self.tools]
+        if self.tool_selector is None:
+            return descriptions
+        by_name = {d["function"]["name"]: d for d in descriptions}
+        selected = self.tool_selector.select(
+            {name: tool_text(d) for name, d in by_name.items()},
+            self._selection_query(),
+            [m["name"] for m in self.messages if isinstance(m, dict) and m.get("role") == "tool"],
+        )
+        return [by_name[name] for name in selected]
+
+    def _selection_query(self, last_messages: int = 3) -> str:
+        """The text tools are selected by: the latest messages, including the last user message."""
+
+        def field(message, key):
+            return message.get(key) if isinstance(message, dict) else getattr(message, key, None)
+
+        recent = self.messages[-last_messages:]
+        if not any(field(m, "role") == "user" for m in recent):
+            user = next((m for m in reversed(self.messages) if field(m, "role") == "user"), None)
+            if user is not None:
+                recent = [user, *recent]
+        return "\n".join(field(m, "content") or "" for m in recent)
@@ -0,0 +1,226 @@
+"""
+Postprocessors that parse a completion while it is being generated.
+
+A streaming postprocessor consumes the completion chunk by chunk, emits every parsed item as soon as
+it is complete (to on_item, e.g. to start a downstream agent on the first item) and tells the model
+to stop generating once the required output is complete, so trailing chatter is never generated.
+Called with a whole text, they behave like a regular postprocessor.
+"""
+
+import copy
+import json
+import re
+from typing import Any, Callable, Iterable, Optional
+
+
+class StreamingPostprocessor:
+    """The base class of streaming postprocessors. Subclasses implement `_feed` and `_finish`."""
+
+    items: list
+    done: bool
+
+    def __init__(self, max_items: Optional[int] = None, on_item: Optional[Callable[[Any], Any]] = None):
+        """Creates a streaming postprocessor.
+
+        Args:
+            max_items (Optional[int]): Stop generating after this many items. Defaults to no limit.
+            on_item (Optional[Callable[[Any], Any]]): Called with every item as soon as it is complete.
+        """
+        self.max_items = max_items
+        self.on_item = on_item
+        self.reset()
+
+    def reset(self) -> None:
+        self.items = []
+        self.done = False
+
+    def start(self) -> "StreamingPostprocessor":
+        """A fresh copy for one completion, so that concurrent runs of an agent do not share state."""
+        session = copy.copy(self)
+        session.reset()
+        return session
+
+    def feed(self, chunk: str) -> bool:
+        """Consumes the next chunk of the completion.
+
+        Returns:
+            bool: Whether the output is complete and the model can stop generating.
+        """
+        if not self.done:
+            for item in self._feed(chunk):
+                self._emit(item)
+                if self.done:
+                    break
+        return self.done
+
+    def finish(self) -> list:
+        """Parses what is left once the completion ended and returns all items."""
+        if not self.done:
+            for item in self._finish():
+                self._emit(item)
+                if self.done:
+                    break
+        return self.items
+
+    def __call__(self, text: str) -> list:
+        session = self.start()
+        session.feed(text)
+        return session.finish()
+
+    def _emit(self, item) -> None:
+        self.items.append(item)
+        if self.on_item:
+            self.on_item(item)
+        if self.max_items is not None and len(self.items) >= self.max_items:
+            self.done = True
+
+    def _feed(self, chunk: str) -> Iterable:
+        raise NotImplementedError
+
+    def _finish(self) -> Iterable:
+        return ()
+
+
+class RegexStreamMatcher(StreamingPostprocessor):
+    """
+    Incremental re.findall. A match is emitted once the text up to its end is followed by a boundary
+    (a newline by default), so that a match that could still grow is not cut off. Empty matches are skipped.
+    """
+
+    def __init__(self, pattern, boundary: str = "\n", **kwargs):
+        """Creates a matcher.
+
+        Args:
+            pattern (str | re.Pattern): The pattern, items are what findall would return for it.
+            boundary (str): Text after which preceding matches are final. Defaults to a newline.
+            **kwargs: max_items and on_item, see StreamingPostprocessor.
+        """
+        self.regex = re.compile(pattern)
+        self.boundary = boundary
+        super().__init__(**kwargs)
+
+    def reset(self) -> None:
+        super().reset()
+        self._buffer = ""
+        self._position = 0
+
+    def _item(self, match: re.Match):
+        groups = match.groups()
+        return match.group() if not groups else groups[0] if len(groups) == 1 else groups
+
+    def _matches(self, limit: int):
+        for match in self.regex.finditer(self._buffer, self._position):
+            if match.end() > limit:
+                return
+            self._position = match.end()
+            if match.end() > match.start():
+                yield self._item(match)
+
+    def _feed(self, chunk: str):
+        self._buffer += chunk
+        boundary = self._buffer.rfind(self.boundary, self._position)
+        if boundary != -1:
+            yield from self._matches(boundary + len(self.boundary))
+
+    def _finish(self):
+        return self._matches(len(self._buffer))
+
+
+class ListItemExtractor(StreamingPostprocessor):
+    """Extracts the items of a numbered or bulleted list, line by line, and stops once the list ended."""
+
+    ITEM = re.compile(r"^\s*(?:\d+[.)]|[-*•])\s+(.*?)\s*$")
+    # an incomplete line that does not match this can no longer become an item
+    ITEM_START = re.compile(r"\s*(?:\d+(?:[.)](?:\s.*)?)?|[-*•](?:\s.*)?)?", re.DOTALL)
+
+    def __init__(self, stop_at_end: bool = True, **kwargs):
+        """Creates an extractor.
+
+        Args:
+            stop_at_end (bool): Stop generating at the first non-empty line that follows the list. Defaults to True.
+            **kwargs: max_items and on_item, see StreamingPostprocessor.
+        """
+        self.stop_at_end = stop_at_end
+        super().__init__(**kwargs)
+
+    def reset(self) -> None:
+        super().reset()
+        self._line = ""
+        self._started = False
+
+    def _line_items(self, line: str):
+        match = self.ITEM.match(line)
+        if match:
+            self._started = True
+            yield match.group(1)
+        elif self._started and line.strip() and self.stop_at_end:
+            self.done = True
+
+    def _feed(self, chunk: str):
+        *lines, self._line = (self._line + chunk).split("\n")
+        for line in lines:
+            yield from self._line_items(line)
+            if self.done:
+                return
+        if self._started and self.stop_at_end and not self.ITEM_START.fullmatch(self._line):
+            self.done = True
+
+    def _finish(self):
+        return self._line_items(self._line)
+
+
+class JsonStreamParser(StreamingPostprocessor):
+    """
+    Parses the first JSON value of the completion, skipping text before it. The elements of a top
+    level array are emitted one by one as they complete, a top level object is emitted once closed.
+    Generation stops as soon as the value is closed.
+    """
+
+    def reset(self) -> None:
+        super().reset()
+        self._container = None
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._element: list[str] = []
+
+    def _complete_element(self):
+        text = "".join(self._element).strip()
+        self._element = []
+        if text:
+            yield json.loads(text)
+
+    def _feed(self, chunk: str):
+        for char in chunk:
+            if self._container is None:
+                if char in "[{":
+                    self._container = char
+                    self._depth = 1
+                    if char == "{":
+                        self._element.append(char)
+                continue
+            if self._in_string:
+                self._element.append(char)
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+            if char == '"':
+                self._in_string = True
+            elif char in "[{":
+                self._depth += 1
+            elif char in "]}":
+                self._depth -= 1
+                if self._depth == 0:
+                    if self._container == "{":
+                        self._element.append(char)
+                    yield from self._complete_element()
+                    self.done = True
+                    return
+            elif char == "," and self._depth == 1 and self._container == "[":
+                yield from self._complete_element()
+                continue
+            self._element.append(char)
@@ -1,9 +1,16 @@
+import json
+import re
+import threading
+import time
+
 import pytest
 from unittest.mock import MagicMock, patch
-from agents import Agent, AgentChain
+from agents import Agent, AgentChain, MultiShotAgent, ParsedAgent, ParsedListAgentChain, fan_out
 from agentsystem.agents.preprocessor.preprocessor import CallablePreprocessor
+from agentsystem.agents.map_reduce_agent import MapReduceAgent
 from agentsystem.agents.tools.tool import Tool
-from agentsystem.models.Model import ConsoleInputModel
+from agentsystem.agents.tools.tool_cache import ToolCache
+from agentsystem.models.Model import ConsoleInputModel, Model
 
 
 @pytest.fixture
@@ -106,6 +113,271 @@ def configure_agent_execution(agent):
     )
 
 
+class EchoModel(Model):
+    def format(self, system_message, prompt_message, prefix_message):
+        return f"{system_message}|{prompt_message}|{prefix_message}"
+
+    def _run(self, prompt, **extra_args):
+        if "fail" in prompt:
+            raise RuntimeError(prompt)
+        return prompt.upper()
+
+
+def test_agent_run_batch_keeps_order_and_isolates_errors():
+    agent = Agent(model=EchoModel(None), postprocessor=lambda response: response + "!")
+
+    results = agent.run_batch(
+        ["a", ("sys", "fail", ""), {"prompt_message": "b", "prefix_message": "p"}],
+        max_concurrency=2,
+    )
+
+    assert [result.value for result in results] == ["|A|!", None, "|B|P!"]
+    assert isinstance(results[1].error, RuntimeError)
+
+
+
+def test_agent_run_batch_arguments_override_agent_arguments():
+    class TemperatureModel(EchoModel):
+        def _run(self, prompt, temperature=None, **extra_args):
+            return str(temperature)
+
+    agent = Agent(model=TemperatureModel(None), postprocessor=lambda response: response, temperature=0.7)
+
+    assert [result.value for result in agent.run_batch(["a"], temperature=0.0)] == ["0.0"]
+    assert [result.value for result in agent.run_batch(["a"])] == ["0.7"]
+
+
+def test_agent_run_batch_isolates_preprocessor_errors():
+    def preprocess(system, prompt, prefix):
+        if prompt == "bad":
+            raise ValueError(prompt)
+        return (system, prompt, prefix), {}
+
+    agent = Agent(model=EchoModel(None), preprocessor=CallablePreprocessor(preprocess))
+
+    results = agent.run_batch(["bad", "good"])
+
+    assert [result.ok for result in results] == [False, True]
+    assert results[1].value == (("|GOOD|",), {})
+
+
+
+class SeedModel(EchoModel):
+    """Answers with the seed's parity, slowly for odd seeds."""
+
+    interrupted = False
+    running: set = set()
+
+    def interrupt(self):
+        self.interrupted = True
+
+    def _run(self, prompt, seed=0, **extra_args):
+        if seed == 3:
+            raise RuntimeError("sample failed")
+        self.running.add(seed)
+        try:
+            time.sleep(0.2 if seed % 2 else 0.01)
+        finally:
+            self.running.discard(seed)
+        return "even" if seed % 2 == 0 else "odd"
+
+
+def test_multi_shot_agent_sample_stops_at_consensus():
+    agent = MultiShotAgent(Agent, iter([2, 4, 6, 1, 5]), model=SeedModel(None), temperature=0.7)
+
+    vote = agent.sample(n=5, prompt_message="parity?", system_message="", prefix_message="")
+
+    assert vote.answer == (("even",), {})
+    assert vote.samples == [(("even",), {})] * 3
+    assert vote.share == 1.0
+    assert vote.stopped_early
+    assert (vote.cancelled, vote.discarded) == (0, 2)
+    # the discarded samples finished before sample returned, so the model can be used right away
+    assert not agent.model.running
+    # the model may be shared with other agents, only the vote's own samples are stopped
+    assert not agent.model.interrupted
+    assert agent.extra_args == {"temperature": 0.7}
+
+
+
+def test_multi_shot_agent_sample_cancels_samples_that_did_not_start():
+    agent = MultiShotAgent(Agent, iter([2, 4, 6, 1, 5]), model=SeedModel(None))
+
+    vote = agent.sample(n=5, max_concurrency=1, prompt_message="", system_message="", prefix_message="")
+
+    assert len(vote.samples) == 3
+    # the worker may already have started the next sample when the vote is decided
+    assert vote.cancelled >= 1
+    assert vote.cancelled + vote.discarded == 2
+
+
+def test_multi_shot_agent_sample_skips_failed_samples():
+    agent = MultiShotAgent(Agent, iter([3, 1, 5]), model=SeedModel(None))
+
+    vote = agent.sample(n=3, max_concurrency=1, prompt_message="", system_message="", prefix_message="")
+
+    assert vote.answer == (("odd",), {})
+    assert len(vote.errors) == 1
+    assert len(vote.samples) == 2
+
+
+class SchemaModel(EchoModel):
+    constraint_formats = ("json_schema",)
+
+    def constraint_args(self, constraint):
+        return {"format": constraint.schema}
+
+    def _run(self, prompt, format=None, **extra_args):
+        return json.dumps({"matches": ["x=1", "y=2"]}) if format else "x=1 and some chatter"
+
+
+def test_parsed_agent_constrains_supporting_models():
+    agent = ParsedAgent(r"(\w)=(\d)", model=SchemaModel(None))
+
+    response = agent.model.run("", "", "", **agent.extra_args)()
+    result = agent.postprocessor(response)
+
+    assert agent.extra_args["format"]["properties"]["matches"]["items"]["pattern"] == r"(\w)=(\d)"
+    assert result == [("x", "1"), ("y", "2")]
+
+
+def test_parsed_agent_falls_back_to_parsing_free_text():
+    agent = ParsedAgent(r"(\w)=(\d)", model=EchoModel(None))
+
+    assert agent.constraint is None
+    assert agent.postprocessor("x=1 and y=2") == [("x", "1"), ("y", "2")]
+
+
+class ChunkModel(EchoModel):
+    """Streams a list followed by chatter, counting the chunks it generated."""
+
+    chunks = ["1. a\n", "2. b\n", "3. c\n", "Anything else?"]
+
+    def _run_streaming(self, prompt, on_chunk, **extra_args):
+        self.generated = 0
+        for chunk in self.chunks:
+            self.generated += 1
+            if on_chunk(chunk):
+                break
+        return "".join(self.chunks[: self.generated])
+
+
+def test_parsed_agent_stops_streaming_once_max_items_are_parsed():
+    seen = []
+    agent = ParsedAgent(r"\d\. (.*)\n", model=ChunkModel(None), max_items=2, on_item=seen.append)
+
+    result = agent.run(system_message="", prompt_message="", prefix_message="")()
+
+    assert result == seen == ["a", "b"]
+    assert agent.model.generated == 2
+
+
+class CountingModel(EchoModel):
+    def __init__(self, model=None):
+        super().__init__(model)
+        self.prompts = []
+
+    def _run(self, prompt, **extra_args):
+        self.prompts.append(prompt)
+        return "1. a\n2. b\n" if "findall(worker_response)" not in prompt else "Write a numbered list"
+
+
+def test_parsed_list_agent_chain_explains_a_pattern_once(tmp_path):
+    model = CountingModel("counting")
+    cache = ToolCache(cache_dir=tmp_path)
+    pattern = r"\d\. (.*)\n"
+
+    first = ParsedListAgentChain(pattern, model=model, explanation_cache=cache).run(prompt_message="fruits")()
+    second = ParsedListAgentChain(pattern, model=model, explanation_cache=cache).run(prompt_message="colors")()
+
+    assert first == second == ["a", "b"]
+    assert sum("findall(worker_response)" in prompt for prompt in model.prompts) == 1
+    assert model.prompts[1].startswith("Write a numbered list|fruits")
+
+
+def test_parsed_list_agent_chain_prewarm_persists_explanations(tmp_path):
+    model = CountingModel("counting")
+
+    explanations = ParsedListAgentChain.prewarm([r"(\w+)", r"(\d+)"], model, explanation_cache=ToolCache(cache_dir=tmp_path))
+    chain = ParsedListAgentChain(r"(\d+)", model=CountingModel("counting"), explanation_cache=ToolCache(cache_dir=tmp_path))
+
+    assert explanations == {r"(\w+)": "Write a numbered list", r"(\d+)": "Write a numbered list"}
+    assert chain.format_explanation() == "Write a numbered list"
+    assert chain.model.prompts == []
+
+
+def test_fan_out_keeps_order_and_isolates_errors():
+    worker = Agent(model=EchoModel(None), postprocessor=lambda response: response)
+
+    results = list(fan_out(["b", "fail", "a"], worker, max_concurrency=3))
+
+    assert [(index, item) for index, item, _ in results] == [(0, "b"), (1, "fail"), (2, "a")]
+    assert [result.value for _, _, result in results] == ["|B|", None, "|A|"]
+    assert isinstance(results[1][2].error, RuntimeError)
+
+
+class SlowListModel(EchoModel):
+    """Streams a list, the second item only after a worker started on the first one."""
+
+    def __init__(self, worker_started):
+        super().__init__(None)
+        self.worker_started = worker_started
+        self.overlapped = False
+
+    def _run(self, prompt, **extra_args):
+        return "Write one item per line"
+
+    def _run_streaming(self, prompt, on_chunk, **extra_args):
+        on_chunk("1. first\n")
+        self.overlapped = self.worker_started.wait(timeout=5)
+        on_chunk("2. second\n")
+        return "1. first\n2. second\n"
+
+
+def test_parsed_list_agent_chain_fan_out_starts_workers_while_the_list_streams():
+    worker_started = threading.Event()
+
+    class WorkerModel(EchoModel):
+        def _run(self, prompt, **extra_args):
+            worker_started.set()
+            return prompt.strip("|")
+
+    chain = ParsedListAgentChain(
+        r"\d\. (.*)\n", model=SlowListModel(worker_started), explanation_cache=ToolCache()
+    )
+    worker = Agent(model=WorkerModel(None), postprocessor=lambda response: response)
+
+    results = list(chain.fan_out(worker, "two items", ordered=False))
+
+    assert chain.model.overlapped
+    assert sorted(result.value for _, _, result in results) == ["first", "second"]
+
+
+class AnchorModel(EchoModel):
+    """Workers reference the first line of their chunk, reducers keep all references of their input."""
+
+    def __init__(self):
+        super().__init__(None)
+        self.reduce_calls = 0
+
+    def _run(self, prompt, **extra_args):
+        if "partial answers" in prompt:
+            self.reduce_calls += 1
+            return "\n".join(line for line in prompt.splitlines() if line.startswith("@"))
+        first_line = re.search(r"^(\d+): (\w+)", prompt, re.MULTILINE)
+        return f"@{first_line.group(1)}: {first_line.group(2)}"
+
+
+def test_map_reduce_agent_keeps_line_anchors_of_all_chunks():
+    model = AnchorModel()
+    document = "\n\n".join(f"paragraph{i} " + "word " * 10 for i in range(6))
+    agent = MapReduceAgent(model=model, chunk_tokens=30, token_counter=lambda text: len(text.split()) * 2)
+
+    answer = agent.run(prompt_message="Summarize", document=document)()
+
+    assert answer.splitlines() == [f"@{2 * i + 1}: paragraph{i}" for i in range(6)]
+    assert model.reduce_calls > 1
+
 from agentsystem.agents.agents import UserConsoleAgent
 
 
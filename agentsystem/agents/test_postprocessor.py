@@ -0,0 +1,65 @@
+import re
+
+from agentsystem.agents.postprocessor.streaming import (
+    JsonStreamParser,
+    ListItemExtractor,
+    RegexStreamMatcher,
+)
+
+
+def feed_all(postprocessor, chunks):
+    """Feeds chunks until the postprocessor is done, returns the items and the number of chunks consumed."""
+    for consumed, chunk in enumerate(chunks, start=1):
+        if postprocessor.feed(chunk):
+            break
+    return postprocessor.finish(), consumed
+
+
+def test_regex_stream_matcher_emits_matches_once_their_line_is_complete():
+    seen = []
+    matcher = RegexStreamMatcher(r"(\w+)=(\d+)", on_item=seen.append).start()
+
+    matcher.feed("a=1 b=")
+    assert seen == []
+    matcher.feed("2\nc=3")
+    assert seen == [("a", "1"), ("b", "2")]
+    assert matcher.finish() == [("a", "1"), ("b", "2"), ("c", "3")]
+
+
+def test_regex_stream_matcher_equals_findall_on_whole_text():
+    text = "1. apples\n2. pears.\nthat is all\n"
+    pattern = r"\d\. (.*?)[\. ]?\n"
+
+    assert RegexStreamMatcher(pattern)(text) == re.findall(pattern, text)
+
+
+def test_regex_stream_matcher_stops_after_max_items():
+    chunks = ["1. a\n", "2. b\n", "3. c\n", "Hope this helps!\n"]
+
+    items, consumed = feed_all(RegexStreamMatcher(r"\d\. (.*)\n", max_items=2), chunks)
+
+    assert items == ["a", "b"]
+    assert consumed == 2
+
+
+def test_list_item_extractor_stops_when_the_list_ends():
+    chunks = ["Sure:\n- fir", "st\n", "* second\n\n", "3) third\n", "Let me know", " if you need more"]
+
+    items, consumed = feed_all(ListItemExtractor(), chunks)
+
+    assert items == ["first", "second", "third"]
+    assert consumed == 5
+
+
+def test_json_stream_parser_emits_array_elements_and_stops_at_the_end():
+    seen = []
+    chunks = ['Here: [{"a": "x,]"}', ', 2, [3', ", 4]]", " trailing chatter"]
+
+    items, consumed = feed_all(JsonStreamParser(on_item=seen.append), chunks)
+
+    assert items == seen == [{"a": "x,]"}, 2, [3, 4]]
+    assert consumed == 3
+
+
+def test_json_stream_parser_parses_objects():
+    assert JsonStreamParser()('```json\n{"answer": "{\\"x\\"}"}\n```') == [{"answer": '{"x"}'}]
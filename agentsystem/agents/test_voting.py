@@ -0,0 +1,40 @@
+import math
+
+from agentsystem.agents.voting import LogprobVoter, MajorityVoter, hashable
+
+
+def test_majority_voter_groups_equal_parsed_outputs():
+    voter = MajorityVoter()
+    voter.add((["4"], {}))
+    voter.add((["5"], {}))
+    voter.add((["4"], {}))
+
+    answer, lead, runner_up = voter.leader()
+
+    assert answer == (["4"], {})
+    assert (lead, runner_up) == (2, 1)
+    assert voter.share() == 2 / 3
+
+
+def test_majority_voter_is_decided_once_the_winner_cannot_change():
+    voter = MajorityVoter(key=str.strip)
+    voter.add("yes")
+    voter.add(" yes ")
+
+    assert not voter.decided(remaining=2)
+    assert voter.decided(remaining=1)
+    assert voter.decided(remaining=3, consensus=0.4, samples=5)
+
+
+def test_logprob_voter_prefers_confident_samples():
+    voter = LogprobVoter()
+    voter.add("a", logprob=-2.0)
+    voter.add("a", logprob=-2.0)
+    voter.add("b", logprob=-0.01)
+
+    assert voter.leader()[0] == "b"
+    assert math.isclose(voter.scores["a"], 2 * math.exp(-2.0))
+
+
+def test_hashable_handles_unhashable_outputs():
+    assert hashable({"b": [1], "a": {2}}) == hashable({"a": {2}, "b": [1]})
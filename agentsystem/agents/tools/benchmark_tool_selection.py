@@ -0,0 +1,81 @@
+"""
+Measures the prompt tokens saved by ToolSelector and how often it keeps the tool a query needs.
+
+The fixture holds OpenAI tool descriptions and queries with the tools that answer them. Tokens are
+those of the JSON tool descriptions sent with a request, counted with tiktoken if it is available.
+
+Usage:
+    python -m agentsystem.agents.tools.benchmark_tool_selection [top_k ...]
+"""
+
+import json
+import statistics
+import sys
+from pathlib import Path
+from typing import Callable, Optional
+
+from agentsystem.agents.tools.tool_selector import ToolSelector, tool_text
+
+FIXTURE = Path(__file__).parent / "fixtures" / "tool_selection.json"
+
+
+def default_token_counter() -> Callable[[str], int]:
+    try:
+        import tiktoken
+
+        encoding = tiktoken.get_encoding("cl100k_base")
+        return lambda text: len(encoding.encode(text))
+    except (ImportError, OSError):  # not installed, or the encoding cannot be downloaded
+        return lambda text: len(text) // 4
+
+
+def evaluate(
+    selector: ToolSelector,
+    fixture: Optional[dict] = None,
+    token_counter: Optional[Callable[[str], int]] = None,
+) -> dict[str, float]:
+    """Runs every fixture query through selector.
+
+    Args:
+        selector (ToolSelector): The selector to evaluate.
+        fixture (Optional[dict]): {"tools": [descriptions], "queries": [{"query", "expected"}]}. Defaults to FIXTURE.
+        token_counter (Optional[Callable[[str], int]]): Counts tokens. Defaults to tiktoken or len / 4.
+
+    Returns:
+        dict[str, float]: Tokens of all tools, mean tokens of the selected tools, the saved share and
+            the accuracy (share of queries for which at least one expected tool was selected).
+    """
+    fixture = fixture or json.loads(FIXTURE.read_text())
+    token_counter = token_counter or default_token_counter()
+    descriptions = {tool["function"]["name"]: tool for tool in fixture["tools"]}
+    texts = {name: tool_text(tool) for name, tool in descriptions.items()}
+    all_tokens = token_counter(json.dumps(list(descriptions.values())))
+
+    selected_tokens = []
+    correct = 0
+    for case in fixture["queries"]:
+        selected = selector.select(texts, case["query"])
+        selected_tokens.append(token_counter(json.dumps([descriptions[name] for name in selected])))
+        correct += any(name in selected for name in case["expected"])
+    mean_tokens = statistics.mean(selected_tokens)
+    return {
+        "tools": len(descriptions),
+        "all_tokens": all_tokens,
+        "selected_tokens": mean_tokens,
+        "savings": 1 - mean_tokens / all_tokens,
+        "accuracy": correct / len(fixture["queries"]),
+    }
+
+
+def main(top_ks):
+    for top_k in top_ks:
+        result = evaluate(ToolSelector(top_k=top_k, recent=0))
+        print(
+            f"top_k={top_k:>2}: {result['selected_tokens']:.0f} of {result['all_tokens']} tool tokens "
+            f"({result['savings']:.0%} saved), accuracy {result['accuracy']:.0%} "
+            f"over {result['tools']} tools"
+        )
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [3, 5, 8, 12])
@@ -0,0 +1,325 @@
+"""
+Trigram-indexed regular expression search over a source tree, exposed to agents as `search_code`.
+
+Every text file below the root is indexed by the set of lowercase character trigrams it contains.
+A query regex is reduced to the literal strings any match must contain, their trigram posting lists
+are intersected, and only the remaining candidate files are read and matched line by line.
+"""
+
+import json
+import os
+import re
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from fnmatch import fnmatch
+from pathlib import Path
+from typing import Optional, Union
+
+import numpy as np
+
+from agentsystem.agents.tools.tool import Tool
+from agentsystem.util import IGNORED_PARTS, _read_text_file
+
+try:
+    from re import _constants as sre_constants, _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_constants
+    import sre_parse
+
+# A query plan is a literal, or ("and" | "or", [plans])
+Plan = Union[str, tuple[str, list]]
+
+
+def trigrams(text: str) -> set[str]:
+    """The set of lowercase character trigrams of text."""
+    text = text.lower()
+    return {text[i : i + 3] for i in range(len(text) - 2)}
+
+
+def _sequence_plan(items) -> list[Plan]:
+    """The literals that a match of the parsed sequence items must contain."""
+    plans: list[Plan] = []
+    run = ""
+    for op, av in items:
+        if op == sre_constants.LITERAL:
+            run += chr(av)
+            continue
+        if run:
+            plans.append(run)
+            run = ""
+        if op == sre_constants.SUBPATTERN:
+            plans += _sequence_plan(av[-1])
+        elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT) and av[0] >= 1:
+            plans += _sequence_plan(av[2])
+        elif op == sre_constants.BRANCH:
+            alternatives = [_sequence_plan(branch) for branch in av[1]]
+            if all(alternatives):
+                plans.append(("or", [("and", alternative) for alternative in alternatives]))
+    if run:
+        plans.append(run)
+    return plans
+
+
+def query_plan(pattern: str, flags: int = 0) -> Plan:
+    """Reduces a regular expression to the literals every match must contain.
+
+    Example:
+        >>> query_plan("class (Tool|Agent)\\\\b")
+        ('and', ['class ', ('or', [('and', ['Tool']), ('and', ['Agent'])])])
+    """
+    parsed = sre_parse.parse(pattern, flags)
+    return ("and", _sequence_plan(list(parsed)))
+
+
+class TrigramIndex:
+    """
+    Trigram index over the text files below root.
+
+    Posting lists are `array`s of file slots. Changed files get a new slot and their old slot is
+    marked dead, dead slots are dropped from the posting lists once they make up a quarter of all slots.
+    """
+
+    def __init__(self, root, index_path=None, max_file_bytes: int = 1 << 20):
+        """Loads the index of root from index_path if it exists, call update() to bring it up to date.
+
+        Args:
+            root (Path): The directory to index.
+            index_path (Optional[Path]): Where the index is persisted as .npz. Defaults to not persisting it.
+            max_file_bytes (int): Larger files are not indexed. Defaults to 1 MiB.
+        """
+        self.root = Path(root).absolute()
+        self.index_path = Path(index_path) if index_path else None
+        self.max_file_bytes = max_file_bytes
+        self.paths: list[str] = []
+        self.stamps: list[list[int]] = []
+        self.slots: dict[str, int] = {}
+        self.alive = bytearray()
+        self.postings: dict[str, array] = {}
+        self.updated_at = 0.0
+        if self.index_path and self.index_path.exists():
+            self._load()
+
+    def __len__(self) -> int:
+        return len(self.slots)
+
+    def _walk(self) -> dict[str, list[int]]:
+        files = {}
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames[:] = [d for d in dirnames if d not in IGNORED_PARTS]
+            for filename in filenames:
+                path = Path(dirpath) / filename
+                stat = path.stat()
+                if stat.st_size <= self.max_file_bytes:
+                    files[path.relative_to(self.root).as_posix()] = [stat.st_mtime_ns, stat.st_size]
+        return files
+
+    def _read(self, relative_path: str) -> Optional[str]:
+        try:
+            return _read_text_file(self.root / relative_path, self.max_file_bytes)
+        except OSError:
+            return None
+
+    def _remove(self, relative_path: str) -> None:
+        slot = self.slots.pop(relative_path, None)
+        if slot is not None:
+            self.alive[slot] = 0
+
+    def _add(self, relative_path: str, stamp: list[int], text: Optional[str]) -> None:
+        slot = len(self.paths)
+        self.paths.append(relative_path)
+        self.stamps.append(stamp)
+        self.slots[relative_path] = slot
+        self.alive.append(1)
+        for trigram in trigrams(text or ""):
+            self.postings.setdefault(trigram, array("I")).append(slot)
+
+    def update(self, workers: int = 8) -> int:
+        """Re-indexes the files that were added, changed or removed since the last update and persists the index.
+
+        Args:
+            workers (int): Threads reading the changed files. Defaults to 8.
+
+        Returns:
+            int: The number of changed files.
+        """
+        current = self._walk()
+        changed = [
+            p for p, stamp in current.items() if p not in self.slots or self.stamps[self.slots[p]] != stamp
+        ]
+        removed = [p for p in self.slots if p not in current]
+        for relative_path in removed + changed:
+            self._remove(relative_path)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for relative_path, text in zip(changed, executor.map(self._read, changed)):
+                self._add(relative_path, current[relative_path], text)
+        if len(self.paths) - len(self.slots) > len(self.paths) // 4:
+            self._compact()
+        if (changed or removed) and self.index_path:
+            self.persist()
+        self.updated_at = time.time()
+        return len(changed) + len(removed)
+
+    def _compact(self) -> None:
+        """Renumbers the live files and drops dead slots from the posting lists."""
+        alive = np.frombuffer(self.alive, dtype=np.uint8).astype(bool)
+        remap = np.cumsum(alive, dtype=np.int64) - 1
+        postings = {}
+        for trigram, slots in self.postings.items():
+            slots_view = np.frombuffer(slots, dtype=np.uint32)
+            kept = slots_view[alive[slots_view]]
+            if len(kept):
+                postings[trigram] = array("I", remap[kept].astype(np.uint32).tobytes())
+        self.postings = postings
+        self.paths = [p for p, live in zip(self.paths, self.alive) if live]
+        self.stamps = [s for s, live in zip(self.stamps, self.alive) if live]
+        self.alive = bytearray(b"\x01" * len(self.paths))
+        self.slots = {p: slot for slot, p in enumerate(self.paths)}
+
+    def persist(self) -> None:
+        """Writes the index as compressed sparse rows into index_path."""
+        self._compact()
+        grams = list(self.postings)
+        offsets = np.cumsum([0] + [len(self.postings[g]) for g in grams], dtype=np.int64)
+        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.index_path.with_name(self.index_path.name + ".tmp.npz")
+        np.savez(
+            tmp,
+            meta=np.array(json.dumps({"root": self.root.as_posix(), "stamps": self.stamps})),
+            paths=np.array(self.paths, dtype=str),
+            trigrams=np.array(grams, dtype=str),
+            offsets=offsets,
+            slots=np.frombuffer(b"".join(self.postings[g].tobytes() for g in grams) or array("I"), dtype=np.uint32),
+        )
+        os.replace(tmp, self.index_path)
+
+    def _load(self) -> None:
+        data = np.load(self.index_path)
+        meta = json.loads(str(data["meta"]))
+        if meta["root"] != self.root.as_posix():
+            return
+        self.paths = data["paths"].tolist()
+        self.stamps = meta["stamps"]
+        self.slots = {p: slot for slot, p in enumerate(self.paths)}
+        self.alive = bytearray(b"\x01" * len(self.paths))
+        slots, offsets = data["slots"], data["offsets"]
+        self.postings = {
+            trigram: array("I", slots[offsets[i] : offsets[i + 1]].tobytes())
+            for i, trigram in enumerate(data["trigrams"].tolist())
+        }
+
+    def _candidates(self, plan: Plan) -> Optional[set[int]]:
+        """The slots of the files that can match plan, None if the plan does not restrict them."""
+        if isinstance(plan, str):
+            grams = trigrams(plan)
+            if not grams:
+                return None
+            result: Optional[set[int]] = None
+            for gram in sorted(grams, key=lambda g: len(self.postings.get(g, ()))):
+                slots = set(self.postings.get(gram, ()))
+                result = slots if result is None else result & slots
+                if not result:
+                    return set()
+            return result
+        op, plans = plan
+        sets = [self._candidates(p) for p in plans]
+        if op == "or":
+            if any(s is None for s in sets):
+                return None
+            return set().union(*sets)
+        restricted = [s for s in sets if s is not None]
+        if not restricted:
+            return None
+        return set.intersection(*restricted)
+
+    def candidates(self, pattern: str, flags: int = 0) -> list[str]:
+        """The paths of the files that may contain a match of pattern, in path order."""
+        slots = self._candidates(query_plan(pattern, flags))
+        if slots is None:
+            return sorted(self.slots)
+        return sorted(self.paths[slot] for slot in slots if self.alive[slot])
+
+    def search(
+        self,
+        pattern: str,
+        flags: int = 0,
+        path_glob: Optional[str] = None,
+        max_results: int = 50,
+    ) -> tuple[list[tuple[str, int, str]], bool]:
+        """Finds the lines matching pattern.
+
+        Args:
+            pattern (str): The regular expression, matched against every line.
+            flags (int): re flags for pattern.
+            path_glob (Optional[str]): Only search files whose relative path matches this glob, e.g. "**/*.py".
+            max_results (int): Stop after this many matching lines. Defaults to 50.
+
+        Returns:
+            tuple[list[tuple[str, int, str]], bool]: The (path, 1-based line number, line) matches and whether
+                the search stopped at max_results.
+        """
+        regex = re.compile(pattern, flags)
+        # the whole file pre-filter must let anchors match at every line, like the line by line search does
+        file_regex = re.compile(pattern, flags | re.MULTILINE)
+        paths = self.candidates(pattern, flags)
+        if path_glob:
+            paths = [p for p in paths if fnmatch(p, path_glob) or fnmatch(p, path_glob.removeprefix("**/"))]
+        matches = []
+        for relative_path in paths:
+            text = self._read(relative_path)
+            if not text or not file_regex.search(text):
+                continue
+            for number, line in enumerate(text.splitlines(), 1):
+                if regex.search(line):
+                    matches.append((relative_path, number, line))
+                    if len(matches) >= max_results:
+                        return matches, True
+        return matches, False
+
+
+def format_matches(
+    matches: list[tuple[str, int, str]], truncated: bool, max_chars: int = 4000, max_line_chars: int = 200
+) -> str:
+    """Formats matches as grep-like `path:line: text` lines of at most max_chars characters in total."""
+    lines = []
+    size = 0
+    for shown, (path, number, line) in enumerate(matches):
+        line = line.strip()
+        if len(line) > max_line_chars:
+            line = line[:max_line_chars] + "..."
+        entry = f"{path}:{number}: {line}"
+        if size + len(entry) > max_chars:
+            lines.append(f"... output truncated, {len(matches) - shown} more matches not shown")
+            return "\n".join(lines)
+        lines.append(entry)
+        size += len(entry) + 1
+    if truncated:
+        lines.append("... more matches exist, narrow the pattern or path_glob")
+    return "\n".join(lines)
+
+
+def code_search_tool(index: TrigramIndex, refresh_seconds: float = 5.0, max_chars: int = 4000) -> Tool:
+    """Creates the `search_code` Tool over index, which is updated before a search if it is older than refresh_seconds."""
+
+    def search_code(pattern: str, path_glob: str = "", ignore_case: bool = False, max_results: int = 50) -> str:
+        """Search the code base for a regular expression and return the matching lines with file and line number.
+
+        Args:
+            pattern (str): Python regular expression matched against single lines, e.g. "def execute\\(" or "class \\w+Agent"
+            path_glob (str): Only search files matching this glob, e.g. "**/*.py". Empty searches all files
+            ignore_case (bool): Match case-insensitively
+            max_results (int): Maximum number of matching lines
+        """
+        if time.time() - index.updated_at > refresh_seconds:
+            index.update()
+        try:
+            matches, truncated = index.search(
+                pattern, re.IGNORECASE if ignore_case else 0, path_glob or None, max_results
+            )
+        except re.error as e:
+            return f"Invalid regular expression '{pattern}': {e}"
+        if not matches:
+            return f"No matches for '{pattern}'"
+        return format_matches(matches, truncated, max_chars)
+
+    return Tool(search_code)
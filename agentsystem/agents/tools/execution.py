@@ -0,0 +1,179 @@
+"""
+Execution modes for Tools and the worker pools they share.
+
+A Tool runs its function either inline on the caller's thread, on a thread pool, on a warm process
+pool (for CPU heavy functions that would otherwise hold the GIL) or, for coroutine functions, on a
+background event loop. The pools and the event loop are created on first use and shared by every
+Tool and Agent in the process. Process mode calls with a timeout run on single-worker pools of their
+own instead, so that a hung call can be killed without breaking the calls of other tools.
+"""
+
+import asyncio
+import atexit
+import importlib
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Literal, Optional
+
+ExecutionMode = Literal["inline", "thread", "process", "async"]
+EXECUTION_MODES = ("inline", "thread", "process", "async")
+
+THREAD_POOL_SIZE = int(os.getenv("TOOL_THREAD_POOL_SIZE", min(32, (os.cpu_count() or 1) + 4)))
+PROCESS_POOL_SIZE = int(os.getenv("TOOL_PROCESS_POOL_SIZE", os.cpu_count() or 1))
+
+_lock = threading.Lock()
+_thread_pool: Optional[ThreadPoolExecutor] = None
+_process_pool: Optional[ProcessPoolExecutor] = None
+_event_loop: Optional[asyncio.AbstractEventLoop] = None
+# single-worker pools of process mode calls with a timeout, idle ones are reused by later calls
+_idle_isolated_pools: list[ProcessPoolExecutor] = []
+_running_isolated_pools: dict[Future, ProcessPoolExecutor] = {}
+
+
+class ToolTimeoutError(TimeoutError):
+    """Raised when a tool call does not finish within the tool's timeout."""
+
+
+def thread_pool() -> ThreadPoolExecutor:
+    """The thread pool shared by all tools running in thread mode."""
+    global _thread_pool
+    with _lock:
+        if _thread_pool is None:
+            _thread_pool = ThreadPoolExecutor(max_workers=THREAD_POOL_SIZE, thread_name_prefix="tool")
+        return _thread_pool
+
+
+def _mp_context():
+    # forking a process that already runs tool threads can deadlock the child
+    method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    return multiprocessing.get_context(method)
+
+
+def process_pool() -> ProcessPoolExecutor:
+    """The warm process pool shared by all tools running in process mode."""
+    global _process_pool
+    with _lock:
+        if _process_pool is None:
+            _process_pool = ProcessPoolExecutor(max_workers=PROCESS_POOL_SIZE, mp_context=_mp_context())
+        return _process_pool
+
+
+def submit_isolated(fn: Callable, *args) -> Future:
+    """Runs fn on a worker process no other call uses at the same time, see kill_isolated.
+
+    The worker is reused by later calls once the call returned, up to PROCESS_POOL_SIZE workers stay warm.
+    """
+    with _lock:
+        pool = _idle_isolated_pools.pop() if _idle_isolated_pools else None
+    if pool is None:
+        pool = ProcessPoolExecutor(max_workers=1, mp_context=_mp_context())
+    future = pool.submit(fn, *args)
+    with _lock:
+        _running_isolated_pools[future] = pool
+
+    def release(done: Future) -> None:
+        broken = not done.cancelled() and isinstance(done.exception(), BrokenProcessPool)
+        with _lock:
+            if _running_isolated_pools.pop(done, None) is not pool or broken:
+                # the worker was killed or crashed, the pool already shut down
+                return
+            if len(_idle_isolated_pools) < PROCESS_POOL_SIZE:
+                _idle_isolated_pools.append(pool)
+                return
+        # this runs on the pool's manager thread, which shutdown would wait for
+        threading.Thread(target=pool.shutdown, daemon=True).start()
+
+    future.add_done_callback(release)
+    return future
+
+
+def kill_isolated(future: Future) -> bool:
+    """Kills the worker running a call of submit_isolated, the call fails with BrokenProcessPool.
+
+    Returns:
+        bool: Whether future was a running isolated call.
+    """
+    with _lock:
+        pool = _running_isolated_pools.pop(future, None)
+    if pool is None:
+        return False
+    _terminate(pool)
+    return True
+
+
+def _terminate(pool: ProcessPoolExecutor) -> None:
+    # ProcessPoolExecutor has no public way to stop a running task
+    for process in list((getattr(pool, "_processes", None) or {}).values()):
+        process.terminate()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def event_loop() -> asyncio.AbstractEventLoop:
+    """The event loop, running on a daemon thread, shared by all tools running in async mode."""
+    global _event_loop
+    with _lock:
+        if _event_loop is None:
+            _event_loop = asyncio.new_event_loop()
+            threading.Thread(target=_event_loop.run_forever, name="tool-event-loop", daemon=True).start()
+        return _event_loop
+
+
+def restart_process_pool() -> None:
+    """Kills the workers of the shared process pool, the next process mode call starts a new pool.
+
+    Every call running on the pool fails with BrokenProcessPool, tools cancel single calls with kill_isolated.
+    """
+    global _process_pool
+    with _lock:
+        pool, _process_pool = _process_pool, None
+    if pool is not None:
+        _terminate(pool)
+
+
+@atexit.register
+def shutdown_pools() -> None:
+    """Shuts down the shared pools and the event loop."""
+    global _thread_pool, _process_pool, _event_loop
+    with _lock:
+        pools = (_thread_pool, _process_pool, *_idle_isolated_pools, *_running_isolated_pools.values())
+        loop = _event_loop
+        _thread_pool = _process_pool = _event_loop = None
+        _idle_isolated_pools.clear()
+        _running_isolated_pools.clear()
+    for pool in pools:
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+    if loop is not None:
+        loop.call_soon_threadsafe(loop.stop)
+
+
+def function_reference(func: Callable) -> tuple[str, str]:
+    """The (module, qualified name) under which a worker process can import func.
+
+    Raises:
+        ValueError: If func is not defined at module level.
+    """
+    module, qualname = getattr(func, "__module__", None), getattr(func, "__qualname__", "")
+    if not module or "<locals>" in qualname or "<lambda>" in qualname:
+        raise ValueError(f"{func!r} must be defined at module level to run in process mode")
+    return module, qualname
+
+
+def call_by_reference(reference: tuple[str, str], args: tuple, kwargs: dict) -> Any:
+    """Imports and calls a function in a worker process, unwrapping it if the name refers to a Tool."""
+    module, qualname = reference
+    target: Any = importlib.import_module(module)
+    for part in qualname.split("."):
+        target = getattr(target, part)
+    target = getattr(target, "func", None) or target
+    return target(*args, **kwargs)
+
+
+def run_coroutine(coroutine, timeout: Optional[float]) -> Future:
+    """Schedules coroutine on the shared event loop, cancelling it once timeout seconds have passed."""
+    if timeout is not None:
+        coroutine = asyncio.wait_for(coroutine, timeout)
+    return asyncio.run_coroutine_threadsafe(coroutine, event_loop())
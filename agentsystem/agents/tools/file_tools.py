@@ -0,0 +1,233 @@
+"""
+File tools that read ranges of a file instead of the whole file.
+
+Files are memory mapped and a sparse line index (the byte offset of every LINE_CHECKPOINT-th line)
+is built once per file version, so any line range of a large log is served by seeking to the nearest
+checkpoint. Results are capped and end with a continuation cursor that resumes at the exact byte
+offset, so an agent pages through a file without ever holding all of it in its context.
+"""
+
+import mmap
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from agentsystem.agents.tools.tool import Tool
+
+LINE_CHECKPOINT = 1024
+SCAN_CHUNK = 1 << 24
+
+
+@dataclass
+class LineIndex:
+    """Line count and sparse line start offsets of one version of a file."""
+
+    size: int
+    mtime_ns: int
+    line_count: int
+    checkpoints: np.ndarray
+
+    @classmethod
+    def build(cls, path: Path) -> "LineIndex":
+        stat = path.stat()
+        starts = [np.zeros(1, dtype=np.int64)]
+        newlines = 0
+        if stat.st_size:
+            with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                for chunk_start in range(0, stat.st_size, SCAN_CHUNK):
+                    chunk = np.frombuffer(mapped[chunk_start : chunk_start + SCAN_CHUNK], dtype=np.uint8)
+                    positions = np.flatnonzero(chunk == 10)
+                    # line k * LINE_CHECKPOINT + 1 starts after newline number k * LINE_CHECKPOINT
+                    first = -(newlines + 1) % LINE_CHECKPOINT
+                    starts.append(positions[first::LINE_CHECKPOINT].astype(np.int64) + chunk_start + 1)
+                    newlines += len(positions)
+        with_trailing_line = stat.st_size and not cls._ends_with_newline(path, stat.st_size)
+        return cls(
+            size=stat.st_size,
+            mtime_ns=stat.st_mtime_ns,
+            line_count=newlines + (1 if with_trailing_line else 0),
+            checkpoints=np.concatenate(starts),
+        )
+
+    @staticmethod
+    def _ends_with_newline(path: Path, size: int) -> bool:
+        with open(path, "rb") as f:
+            f.seek(size - 1)
+            return f.read(1) == b"\n"
+
+    def is_current(self, path: Path) -> bool:
+        stat = path.stat()
+        return stat.st_size == self.size and stat.st_mtime_ns == self.mtime_ns
+
+    def offset(self, mapped, line: int) -> int:
+        """The byte offset of the start of the 1-based line, seeking from the nearest checkpoint."""
+        checkpoint = (line - 1) // LINE_CHECKPOINT
+        offset = int(self.checkpoints[checkpoint])
+        for _ in range((line - 1) % LINE_CHECKPOINT):
+            offset = mapped.find(b"\n", offset) + 1
+        return offset
+
+
+_line_indexes: "OrderedDict[Path, LineIndex]" = OrderedDict()
+
+
+def line_index(path: Path, max_entries: int = 64) -> LineIndex:
+    """Returns the line index of path, rebuilding it if the file changed since it was built."""
+    path = Path(path).absolute()
+    index = _line_indexes.get(path)
+    if index is None or not index.is_current(path):
+        index = LineIndex.build(path)
+        _line_indexes[path] = index
+    _line_indexes.move_to_end(path)
+    while len(_line_indexes) > max_entries:
+        _line_indexes.popitem(last=False)
+    return index
+
+
+def _cursor(line: int, offset: int, index: LineIndex) -> str:
+    return f"{line}:{offset}:{index.mtime_ns}"
+
+
+def _parse_cursor(cursor: str, index: LineIndex) -> Optional[tuple[int, int]]:
+    """The (line, offset) of a cursor, None if it belongs to another version of the file."""
+    try:
+        line, offset, mtime_ns = (int(part) for part in cursor.split(":"))
+    except ValueError:
+        return None
+    if mtime_ns != index.mtime_ns or not 0 <= offset <= index.size:
+        return None
+    return line, offset
+
+
+def describe_file(path: Path) -> str:
+    """Size, line count and whether the file looks like text."""
+    index = line_index(path)
+    with open(path, "rb") as f:
+        binary = b"\0" in f.read(8192)
+    kind = "binary" if binary else "text"
+    return f"{path}: {index.size} bytes, {index.line_count} lines, {kind}"
+
+
+def read_line_range(
+    path: Path,
+    start_line: int = 1,
+    max_lines: int = 200,
+    max_chars: int = 8000,
+    cursor: str = "",
+) -> str:
+    """Reads lines of a file, numbered, as far as they fit into max_lines and max_chars.
+
+    Args:
+        path (Path): The file.
+        start_line (int): The 1-based first line. Ignored if a valid cursor is given.
+        max_lines (int): Maximum number of lines.
+        max_chars (int): Maximum number of characters of the result.
+        cursor (str): A cursor from a previous result to continue after.
+
+    Returns:
+        str: A header with the line range and file size, the numbered lines and, if the file
+            continues, the cursor to pass to continue reading.
+    """
+    path = Path(path)
+    index = line_index(path)
+    header = f"{path} ({index.size} bytes, {index.line_count} lines)"
+    if index.size == 0:
+        return f"{header}\n[empty file]"
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        position = _parse_cursor(cursor, index) if cursor else None
+        if position is None:
+            line = min(max(start_line, 1), index.line_count)
+            offset = index.offset(mapped, line)
+        else:
+            line, offset = position
+        first_line = line
+        lines = []
+        size = 0
+        while line <= index.line_count and len(lines) < max_lines and offset < index.size:
+            end = mapped.find(b"\n", offset)
+            end = index.size if end == -1 else end + 1
+            text = mapped[offset:end].decode("utf-8", errors="replace").rstrip("\r\n")
+            entry = f"{line}: {text}"
+            if lines and size + len(entry) + 1 > max_chars:
+                break
+            if len(entry) > max_chars:
+                entry = entry[:max_chars] + f"... [{len(entry) - max_chars} more characters]"
+            lines.append(entry)
+            size += len(entry) + 1
+            line, offset = line + 1, end
+    result = [f"{header} lines {first_line}-{line - 1}:", *lines]
+    if line <= index.line_count:
+        result.append(f"[{index.line_count - line + 1} more lines, continue with cursor {_cursor(line, offset, index)}]")
+    return "\n".join(result)
+
+
+def read_byte_range(path: Path, offset: int = 0, length: int = 4096, max_bytes: int = 8000) -> str:
+    """Reads at most min(length, max_bytes) bytes of a file starting at offset, decoded as UTF-8."""
+    path = Path(path)
+    size = path.stat().st_size
+    offset = min(max(offset, 0), size)
+    length = min(length, max_bytes, size - offset)
+    if length <= 0:
+        return f"{path} ({size} bytes): no bytes at offset {offset}"
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        data = mapped[offset : offset + length]
+    result = f"{path} bytes {offset}-{offset + length - 1} of {size}:\n{data.decode('utf-8', errors='replace')}"
+    if offset + length < size:
+        result += f"\n[{size - offset - length} more bytes, continue with offset {offset + length}]"
+    return result
+
+
+def file_tools(root=None, max_lines: int = 200, max_chars: int = 8000) -> list[Tool]:
+    """Creates the `file_info`, `read_lines` and `read_bytes` Tools.
+
+    Args:
+        root (Optional[Path]): If given, relative paths are resolved against root and paths outside of it are refused.
+        max_lines (int): Maximum lines per read_lines call. Defaults to 200.
+        max_chars (int): Maximum characters per call. Defaults to 8000.
+
+    Returns:
+        list[Tool]: The tools, to be added to an agent.
+    """
+    base = Path(root).resolve() if root else None
+
+    def resolve(path: str) -> Path:
+        if base is None:
+            return Path(path)
+        resolved = (base / path).resolve()
+        if not resolved.is_relative_to(base):
+            raise PermissionError(f"{path} is outside of {base}")
+        return resolved
+
+    def file_info(path: str) -> str:
+        """Show the size in bytes and the number of lines of a file, read this before reading a large file.
+
+        Args:
+            path (str): Path of the file
+        """
+        return describe_file(resolve(path))
+
+    def read_lines(path: str, start_line: int = 1, num_lines: int = max_lines, cursor: str = "") -> str:
+        """Read numbered lines of a file. Long results end with a cursor to continue reading.
+
+        Args:
+            path (str): Path of the file
+            start_line (int): First line to read, 1-based
+            num_lines (int): Number of lines to read
+            cursor (str): Cursor from a previous read_lines result to continue from, overrides start_line
+        """
+        return read_line_range(resolve(path), start_line, min(num_lines, max_lines), max_chars, cursor)
+
+    def read_bytes(path: str, offset: int = 0, length: int = 4096) -> str:
+        """Read a range of bytes of a file as text, for files without useful line breaks.
+
+        Args:
+            path (str): Path of the file
+            offset (int): Byte offset to start at
+            length (int): Number of bytes to read
+        """
+        return read_byte_range(resolve(path), offset, length, max_chars)
+
+    return [Tool(file_info), Tool(read_lines), Tool(read_bytes)]
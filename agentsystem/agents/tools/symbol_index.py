@@ -0,0 +1,202 @@
+"""
+Persistent index of the classes, functions, methods and attributes of a Python code base.
+
+Built from the module summaries of agentsystem.util (ClassExtractor definitions), stored as JSON and
+updated incrementally by re-summarizing only files whose mtime or size changed. Exposed to agents as
+the `lookup_symbol` tool, so finding a definition is one small tool result instead of a file dump.
+"""
+
+import bisect
+import json
+import os
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Optional
+
+from agentsystem.agents.tools.tool import Tool
+from agentsystem.util import IGNORED_PARTS, Definition, extract_summaries
+
+
+@dataclass
+class Symbol:
+    """A definition together with the module it belongs to."""
+
+    module: str
+    path: str
+    definition: Definition
+
+    @property
+    def full_name(self) -> str:
+        return f"{self.module}.{self.definition.qualified_name}" if self.module else self.definition.qualified_name
+
+
+def module_name(relative_path: Path) -> str:
+    """The dotted module name of a python file, relative to the index root."""
+    parts = list(relative_path.with_suffix("").parts)
+    if parts and parts[-1] == "__init__":
+        parts.pop()
+    return ".".join(parts)
+
+
+class SymbolIndex:
+    """
+    Symbol table of all .py files below root.
+
+    Symbols can be looked up in constant time by their full name (package.module.Class.method), their
+    name within the module (Class.method) or their bare name (method). Prefix search over full names
+    uses a sorted key list.
+    """
+
+    def __init__(self, root, index_path=None):
+        """Loads the index of root from index_path if it exists, call update() to bring it up to date.
+
+        Args:
+            root (Path): The directory to index.
+            index_path (Optional[Path]): Where the index is persisted. Defaults to not persisting it.
+        """
+        self.root = Path(root).absolute()
+        self.index_path = Path(index_path) if index_path else None
+        self.files: dict[str, dict] = {}
+        self._by_name: dict[str, list[Symbol]] = {}
+        self._sorted_names: Optional[list[str]] = None
+        self.updated_at = 0.0
+        if self.index_path and self.index_path.exists():
+            data = json.loads(self.index_path.read_text())
+            if data.get("root") == self.root.as_posix():
+                self.files = data["files"]
+        self._rebuild_lookup()
+
+    def _symbols(self, relative_path: str, entry: dict) -> list[Symbol]:
+        module = module_name(Path(relative_path))
+        return [Symbol(module, relative_path, Definition(**d)) for d in entry["definitions"]]
+
+    def _rebuild_lookup(self) -> None:
+        self._by_name = {}
+        for relative_path, entry in self.files.items():
+            for symbol in self._symbols(relative_path, entry):
+                names = {symbol.full_name, symbol.definition.qualified_name, symbol.definition.qualified_name.rsplit(".", 1)[-1]}
+                for name in names:
+                    self._by_name.setdefault(name, []).append(symbol)
+        self._sorted_names = None
+
+    def update(self) -> int:
+        """Re-indexes the files that were added, changed or removed since the last update and persists the index.
+
+        Returns:
+            int: The number of changed files.
+        """
+        current = {}
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames[:] = [d for d in dirnames if d not in IGNORED_PARTS]
+            for filename in filenames:
+                if filename.endswith(".py"):
+                    path = Path(dirpath) / filename
+                    stat = path.stat()
+                    current[path.relative_to(self.root).as_posix()] = [stat.st_mtime_ns, stat.st_size]
+
+        changed = [p for p, stamp in current.items() if self.files.get(p, {}).get("stamp") != stamp]
+        removed = [p for p in self.files if p not in current]
+        summaries = self._summarize([self.root / p for p in changed])
+        for relative_path in removed:
+            del self.files[relative_path]
+        for relative_path in changed:
+            summary = summaries[self.root / relative_path]
+            self.files[relative_path] = {
+                "stamp": current[relative_path],
+                "definitions": [asdict(d) for d in summary.definitions] if summary else [],
+            }
+        if changed or removed:
+            self._rebuild_lookup()
+            self.persist()
+        self.updated_at = time.time()
+        return len(changed) + len(removed)
+
+    @staticmethod
+    def _summarize(paths: list[Path]) -> dict:
+        """Summarizes paths in parallel, files that do not parse get None."""
+        try:
+            return extract_summaries(paths)
+        except (SyntaxError, ValueError, UnicodeDecodeError):
+            summaries = {}
+            for path in paths:
+                try:
+                    summaries[path] = extract_summaries([path])[path]
+                except (SyntaxError, ValueError, UnicodeDecodeError):
+                    summaries[path] = None
+            return summaries
+
+    def persist(self) -> None:
+        if not self.index_path:
+            return
+        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.index_path.with_name(self.index_path.name + ".tmp")
+        tmp.write_text(json.dumps({"root": self.root.as_posix(), "files": self.files}))
+        os.replace(tmp, self.index_path)
+
+    def lookup(self, name: str) -> list[Symbol]:
+        """Returns the symbols whose full, module-local or bare name is name."""
+        return list(self._by_name.get(name, []))
+
+    def search(self, prefix: str, limit: int = 50) -> list[str]:
+        """Returns up to limit names (full, module-local or bare) that start with prefix, in sorted order."""
+        if self._sorted_names is None:
+            self._sorted_names = sorted(self._by_name)
+        start = bisect.bisect_left(self._sorted_names, prefix)
+        names = []
+        for name in self._sorted_names[start:]:
+            if not name.startswith(prefix) or len(names) >= limit:
+                break
+            names.append(name)
+        return names
+
+    def describe(self, symbol: Symbol, max_lines: int = 30) -> str:
+        """Formats a symbol as its location, signature, docstring and at most max_lines lines of source."""
+        definition = symbol.definition
+        header = f"{symbol.full_name} ({definition.kind}) {symbol.path}:{definition.start_line}-{definition.end_line}"
+        parts = [header]
+        if definition.signature:
+            parts.append(definition.signature)
+        if definition.docstring:
+            parts.append(f'"""{definition.docstring}"""')
+        end_line = min(definition.end_line, definition.start_line + max_lines - 1)
+        try:
+            with open(self.root / symbol.path, encoding="utf-8", errors="replace") as f:
+                lines = [line for number, line in enumerate(f, 1) if definition.start_line <= number <= end_line]
+        except OSError:
+            lines = []
+        if lines:
+            source = "".join(lines).rstrip("\n")
+            if end_line < definition.end_line:
+                source += f"\n... [{definition.end_line - end_line} more lines]"
+            parts.append(f"```python\n{source}\n```")
+        return "\n".join(parts)
+
+
+def symbol_lookup_tool(index: SymbolIndex, refresh_seconds: float = 5.0) -> Tool:
+    """Creates the `lookup_symbol` Tool over index, which is updated before a lookup if it is older than refresh_seconds."""
+
+    def lookup_symbol(name: str, prefix: bool = False, limit: int = 5) -> str:
+        """Look up where a Python class, function, method or attribute is defined and show its signature, docstring and source.
+
+        Args:
+            name (str): Qualified name like package.module.Class.method, a module-local name like Class.method or a bare name
+            prefix (bool): If true, list the names starting with the given name instead of showing definitions
+            limit (int): Maximum number of results
+        """
+        if time.time() - index.updated_at > refresh_seconds:
+            index.update()
+        if prefix:
+            names = index.search(name, limit)
+            return "\n".join(names) if names else f"No symbols start with '{name}'"
+        symbols = index.lookup(name)
+        if not symbols:
+            suggestions = index.search(name, 5)
+            hint = f" Names with this prefix: {', '.join(suggestions)}" if suggestions else ""
+            return f"No symbol named '{name}'.{hint}"
+        text = "\n\n".join(index.describe(symbol) for symbol in symbols[:limit])
+        if len(symbols) > limit:
+            text += f"\n\n... {len(symbols) - limit} more definitions named '{name}'"
+        return text
+
+    return Tool(lookup_symbol)
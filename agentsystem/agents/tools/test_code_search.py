@@ -0,0 +1,82 @@
+import pytest
+
+from agentsystem.agents.tools.code_search import TrigramIndex, code_search_tool, format_matches, query_plan
+
+
+@pytest.fixture
+def project(tmp_path):
+    root = tmp_path / "src"
+    (root / "pkg").mkdir(parents=True)
+    (root / "pkg" / "agents.py").write_text("class ToolAgent(Agent):\n    def execute(self):\n        pass\n")
+    (root / "pkg" / "models.py").write_text("class LlamaModel(Model):\n    pass\n")
+    (root / "README.md").write_text("The ToolAgent runs tools.\n")
+    (root / "data.bin").write_bytes(b"\0ToolAgent")
+    return root
+
+
+def test_query_plan_extracts_required_literals():
+    assert query_plan(r"class (Tool|Llama)\w+") == ("and", ["class ", ("or", [("and", ["Tool"]), ("and", ["Llama"])])])
+    assert query_plan(r"def (exe)?cute") == ("and", ["def ", "cute"])
+
+
+def test_candidates_intersect_posting_lists(project):
+    index = TrigramIndex(project)
+    index.update()
+
+    assert index.candidates("ToolAgent") == ["README.md", "pkg/agents.py"]
+    assert index.candidates(r"class \w+\(Model\)") == ["pkg/models.py"]
+    assert index.candidates(r"toolagent|llamamodel", 0) == ["README.md", "pkg/agents.py", "pkg/models.py"]
+    assert index.candidates(r"\w+") == ["README.md", "data.bin", "pkg/agents.py", "pkg/models.py"]
+
+
+def test_search_reports_line_numbers(project):
+    index = TrigramIndex(project)
+    index.update()
+
+    assert index.search(r"def \w+") == ([("pkg/agents.py", 2, "    def execute(self):")], False)
+    assert index.search("class", path_glob="**/*.py", max_results=1) == (
+        [("pkg/agents.py", 1, "class ToolAgent(Agent):")],
+        True,
+    )
+
+
+
+def test_anchored_patterns_match_every_line(project):
+    index = TrigramIndex(project)
+    index.update()
+
+    assert index.search(r"^\s+def ") == ([("pkg/agents.py", 2, "    def execute(self):")], False)
+    assert index.search(r"pass$", path_glob="pkg/models.py") == ([("pkg/models.py", 2, "    pass")], False)
+
+
+def test_index_is_persisted_and_updated_incrementally(project, tmp_path):
+    index_path = tmp_path / "trigrams.npz"
+    assert TrigramIndex(project, index_path).update() == 4
+
+    reloaded = TrigramIndex(project, index_path)
+    assert reloaded.update() == 0
+    (project / "pkg" / "models.py").write_text("class OllamaModel(Model):\n    pass\n")
+    (project / "README.md").unlink()
+    assert reloaded.update() == 2
+    assert reloaded.candidates("LlamaModel") == ["pkg/models.py"]
+    assert reloaded.search("lamaModel")[0] == [("pkg/models.py", 1, "class OllamaModel(Model):")]
+    assert reloaded.candidates("ToolAgent") == ["pkg/agents.py"]
+
+
+def test_format_matches_caps_output():
+    matches = [("a.py", line, "x" * 50) for line in range(1, 11)]
+
+    text = format_matches(matches, truncated=False, max_chars=150)
+
+    assert text.splitlines()[-1] == "... output truncated, 8 more matches not shown"
+
+
+def test_search_code_tool(project):
+    tool = code_search_tool(TrigramIndex(project))
+
+    assert tool.get_openai_description()["function"]["name"] == "search_code"
+    assert tool.execute(pattern="toolagent", ignore_case=True)() == (
+        "README.md:1: The ToolAgent runs tools.\npkg/agents.py:1: class ToolAgent(Agent):"
+    )
+    assert tool.execute(pattern="Missing")() == "No matches for 'Missing'"
+    assert tool.execute(pattern="(")().startswith("Invalid regular expression")
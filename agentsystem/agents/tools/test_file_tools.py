@@ -0,0 +1,63 @@
+import mmap
+
+import pytest
+
+from agentsystem.agents.tools import file_tools
+from agentsystem.agents.tools.file_tools import line_index, read_byte_range, read_line_range
+
+
+@pytest.fixture
+def log(tmp_path, monkeypatch):
+    monkeypatch.setattr(file_tools, "LINE_CHECKPOINT", 4)
+    monkeypatch.setattr(file_tools, "SCAN_CHUNK", 16)
+    path = tmp_path / "app.log"
+    path.write_text("".join(f"line {n}\n" for n in range(1, 31)) + "tail")
+    return path
+
+
+def test_line_index_seeks_any_line(log):
+    index = line_index(log)
+
+    assert index.line_count == 31
+    lines = log.read_bytes().splitlines(keepends=True)
+    with open(log, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        for line in range(1, 32):
+            assert index.offset(mapped, line) == sum(len(text) for text in lines[: line - 1])
+
+
+def test_read_lines_paginates_with_cursor(log):
+    first = read_line_range(log, start_line=9, max_lines=3)
+
+    assert first.splitlines()[:4] == [f"{log} (235 bytes, 31 lines) lines 9-11:", "9: line 9", "10: line 10", "11: line 11"]
+    cursor = first.splitlines()[-1].split("cursor ")[1].rstrip("]")
+    second = read_line_range(log, max_lines=100, cursor=cursor)
+    assert second.splitlines()[1] == "12: line 12"
+    assert second.splitlines()[-1] == "31: tail"
+
+
+def test_read_lines_caps_characters(log):
+    result = read_line_range(log, max_lines=100, max_chars=40)
+
+    assert result.splitlines()[1:-1] == ["1: line 1", "2: line 2", "3: line 3", "4: line 4"]
+    assert result.splitlines()[-1].startswith("[27 more lines, continue with cursor 5:")
+
+
+def test_stale_cursor_falls_back_to_start_line(log):
+    cursor = read_line_range(log, max_lines=1).splitlines()[-1].split("cursor ")[1].rstrip("]")
+    log.write_text("changed\n" * 3)
+
+    assert read_line_range(log, start_line=2, cursor=cursor).splitlines()[1] == "2: changed"
+
+
+def test_read_bytes(log):
+    assert read_byte_range(log, offset=7, length=6).splitlines()[1] == "line 2"
+    assert read_byte_range(log, offset=7, length=6).endswith("continue with offset 13]")
+
+
+def test_tools_stay_inside_root(log):
+    info, read_lines, _ = file_tools.file_tools(root=log.parent, max_lines=2)
+
+    assert info.execute(path="app.log")() == f"{log}: 235 bytes, 31 lines, text"
+    assert read_lines.execute(path="app.log", num_lines=50)().count("\n") == 3
+    with pytest.raises(PermissionError):
+        info.execute(path="../outside.txt")()
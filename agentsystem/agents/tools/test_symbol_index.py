@@ -0,0 +1,77 @@
+import pytest
+
+from agentsystem.agents.tools.symbol_index import SymbolIndex, symbol_lookup_tool
+
+MODULE = '''
+TIMEOUT = 30
+
+
+class Greeter:
+    """Says hello."""
+
+    greeting: str = "hello"
+
+    def greet(self, name: str) -> str:
+        """Greets name."""
+        return f"{self.greeting} {name}"
+
+
+def helper():
+    pass
+'''
+
+
+@pytest.fixture
+def project(tmp_path):
+    package = tmp_path / "src" / "pkg"
+    package.mkdir(parents=True)
+    (package / "__init__.py").write_text("")
+    (package / "greeter.py").write_text(MODULE)
+    (package / "broken.py").write_text("def broken(:\n")
+    return tmp_path / "src"
+
+
+def test_lookup_by_full_local_and_bare_name(project):
+    index = SymbolIndex(project)
+    index.update()
+
+    assert [s.full_name for s in index.lookup("pkg.greeter.Greeter.greet")] == ["pkg.greeter.Greeter.greet"]
+    assert [s.full_name for s in index.lookup("Greeter.greet")] == ["pkg.greeter.Greeter.greet"]
+    assert [s.definition.kind for s in index.lookup("TIMEOUT")] == ["attribute"]
+    assert index.lookup("greet")[0].definition.signature == "def greet(self, name: str) -> str"
+
+
+def test_prefix_search(project):
+    index = SymbolIndex(project)
+    index.update()
+
+    assert index.search("pkg.greeter.Greeter") == [
+        "pkg.greeter.Greeter",
+        "pkg.greeter.Greeter.greet",
+        "pkg.greeter.Greeter.greeting",
+    ]
+
+
+def test_index_is_persisted_and_updated_incrementally(project, tmp_path):
+    index_path = tmp_path / "symbols.json"
+    assert SymbolIndex(project, index_path).update() == 3
+
+    reloaded = SymbolIndex(project, index_path)
+    assert reloaded.lookup("helper")
+    assert reloaded.update() == 0
+
+    (project / "pkg" / "greeter.py").write_text(MODULE.replace("def helper", "def other"))
+    assert reloaded.update() == 1
+    assert not reloaded.lookup("helper")
+    assert reloaded.lookup("other")
+
+
+def test_lookup_tool(project):
+    tool = symbol_lookup_tool(SymbolIndex(project))
+
+    result = tool.execute(name="Greeter.greet")()
+
+    assert tool.get_openai_description()["function"]["name"] == "lookup_symbol"
+    assert result.startswith("pkg.greeter.Greeter.greet (method) pkg/greeter.py:10-12")
+    assert '"""Greets name."""' in result
+    assert "No symbol named 'Greter'" in tool.execute(name="Greter")()
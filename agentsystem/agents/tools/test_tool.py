@@ -1,5 +1,5 @@
 import pytest
-from src.agentsystem.agents.tools.tool import Tool
+from agentsystem.agents.tools.tool import Tool
 
 def test_execute_simple_function():
     def simple_function():
@@ -128,3 +128,300 @@ def test_get_openai_description_no_function():
     tool = Tool()
     with pytest.raises(ValueError, match="No function provided to generate description from"):
         tool.get_openai_description()
+
+def test_get_openai_description_is_cached_until_redefined():
+    def cached_function(a: int):
+        """Cached function."""
+        pass
+
+    tool = Tool(cached_function)
+    description = tool.get_openai_description()
+    assert tool.get_openai_description() is description
+
+    def redefined_function(a: int, b: int):
+        """Redefined function."""
+        pass
+
+    tool.func = redefined_function
+    assert tool.get_openai_description()["function"]["parameters"]["required"] == ["a", "b"]
+
+
+def test_get_openai_description_typing():
+    from dataclasses import dataclass
+    from enum import Enum
+    from typing import Literal, Optional
+
+    class Color(Enum):
+        RED = "red"
+        BLUE = "blue"
+
+    @dataclass
+    class Point:
+        x: float
+        y: float = 0.0
+
+    def typed_function(
+        ids: list[int],
+        mode: Literal["fast", "slow"],
+        color: Color,
+        point: Point,
+        limit: Optional[int] = None,
+        weights: dict[str, float] = {},
+    ):
+        """Typed function.
+
+        Args:
+            ids (list[int]): The ids to look at,
+                continued on the next line
+            mode (str): How to run
+        """
+
+    properties = Tool(typed_function).get_openai_description()["function"]["parameters"]["properties"]
+
+    assert properties["ids"] == {
+        "type": "array",
+        "items": {"type": "integer"},
+        "description": "The ids to look at, continued on the next line",
+    }
+    assert properties["mode"] == {"type": "string", "enum": ["fast", "slow"], "description": "How to run"}
+    assert properties["color"]["enum"] == ["red", "blue"]
+    assert properties["point"]["properties"] == {"x": {"type": "number"}, "y": {"type": "number"}}
+    assert properties["point"]["required"] == ["x"]
+    assert properties["limit"]["type"] == ["integer", "null"]
+    assert properties["weights"]["additionalProperties"] == {"type": "number"}
+
+
+def test_validate_arguments():
+    from dataclasses import dataclass
+    from enum import Enum
+    from typing import Optional
+
+    from agentsystem.agents.tools.tool import ToolArgumentError
+
+    class Color(Enum):
+        RED = "red"
+
+    @dataclass
+    class Point:
+        x: float
+        y: float = 0.0
+
+    def typed_function(count: int, color: Color, point: Point, tags: Optional[set[str]] = None):
+        pass
+
+    tool = Tool(typed_function)
+
+    assert tool.validate_arguments({"count": 2.0, "color": "red", "point": {"x": 1}, "tags": ["a"]}) == {
+        "count": 2,
+        "color": Color.RED,
+        "point": Point(1.0),
+        "tags": {"a"},
+    }
+    with pytest.raises(ToolArgumentError, match="argument 'count': expected integer"):
+        tool.validate_arguments({"count": "2", "color": "red", "point": {"x": 1}})
+    with pytest.raises(ToolArgumentError, match="argument 'point.x': expected number"):
+        tool.validate_arguments({"count": 2, "color": "red", "point": {"x": "left"}})
+    with pytest.raises(ToolArgumentError, match="missing required argument"):
+        tool.validate_arguments({"count": 2})
+    with pytest.raises(ToolArgumentError, match="unknown argument"):
+        tool.validate_arguments({"count": 2, "color": "red", "point": {"x": 1}, "size": 3})
+
+
+def test_unannotated_parameters_accept_any_value():
+    from typing import Literal
+
+    def untyped_function(value, level: Literal[1, "high"] = 1, marker: Literal[b"x"] = b"x"):
+        pass
+
+    tool = Tool(untyped_function)
+    properties = tool.get_openai_description()["function"]["parameters"]["properties"]
+
+    assert properties["value"]["type"] == "string"
+    assert "type" not in properties["level"] and "type" not in properties["marker"]
+    for value in (3, [1, 2], {"a": 1}, "text"):
+        assert tool.validate_arguments({"value": value}) == {"value": value}
+
+
+def square(x: int) -> int:
+    """Module level so that it can run in a worker process."""
+    return x * x
+
+
+def test_execution_modes():
+    import asyncio
+
+    async def add(a: int, b: int) -> int:
+        await asyncio.sleep(0)
+        return a + b
+
+    assert Tool(square, mode="thread").execute(3)() == 9
+    assert Tool(square, mode="process").execute(4)() == 16
+    assert Tool(add).mode == "async"
+    assert Tool(add).execute(1, 2)() == 3
+    assert asyncio.run(Tool(square, mode="thread").acall(5)) == 25
+    with pytest.raises(ValueError, match="module level"):
+        Tool(lambda x: x, mode="process")
+    with pytest.raises(ValueError, match="timeout"):
+        Tool(square, timeout=1)
+
+
+def test_timeout_cancels_call():
+    import asyncio
+
+    from agentsystem.agents.tools.tool import ToolTimeoutError
+
+    cancelled = []
+
+    async def hang():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    with pytest.raises(ToolTimeoutError):
+        Tool(hang, timeout=0.05).execute()()
+    import time
+
+    time.sleep(0.05)
+    assert cancelled == [True]
+
+
+
+def slow_square(x: int, seconds: float) -> int:
+    import time
+
+    time.sleep(seconds)
+    return x * x
+
+
+def test_process_timeout_does_not_break_other_process_calls():
+    from agentsystem.agents.tools.tool import ToolTimeoutError
+
+    other = Tool(slow_square, mode="process").execute(3, 1.0)
+    with pytest.raises(ToolTimeoutError):
+        Tool(slow_square, mode="process", timeout=0.2).execute(2, 30)()
+
+    assert other() == 9
+    assert Tool(slow_square, mode="process", timeout=30).execute(4, 0)() == 16
+
+
+def test_max_concurrency_limits_running_calls():
+    import threading
+    import time
+
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    def work():
+        with lock:
+            running.append(1)
+            peak.append(len(running))
+        time.sleep(0.02)
+        with lock:
+            running.pop()
+
+    tool = Tool(work, mode="thread", max_concurrency=2)
+    futures = [tool.submit() for _ in range(6)]
+    for future in futures:
+        future.result()
+
+    assert max(peak) == 2
+
+
+def test_cached_tool_reuses_results_by_normalized_arguments():
+    from agentsystem.agents.tools.tool import as_tool
+
+    calls = []
+
+    @as_tool(cache=True)
+    def lookup(name: str, exact: bool = True):
+        calls.append(name)
+        return name.upper()
+
+    assert lookup.execute("a")() == "A"
+    assert lookup.execute(name="a", exact=True)() == "A"
+    assert lookup.execute("b")() == "B"
+    assert calls == ["a", "b"]
+    assert lookup.cache_stats() == {"hits": 1, "misses": 2, "hit_rate": 1 / 3}
+
+
+def test_cache_ttl_and_file_stamp(tmp_path, monkeypatch):
+    from agentsystem.agents.tools import tool_cache
+    from agentsystem.agents.tools.tool_cache import ToolCache, file_stamp
+
+    now = [1000.0]
+    monkeypatch.setattr(tool_cache.time, "time", lambda: now[0])
+    path = tmp_path / "notes.txt"
+    path.write_text("first")
+
+    def read(path: str) -> str:
+        return open(path).read()
+
+    tool = Tool(read, cache=ToolCache(ttl=60, stamp=file_stamp("path")))
+    assert tool.execute(str(path))() == "first"
+    path.write_text("second version")
+    assert tool.execute(str(path))() == "second version"
+    assert tool.execute(str(path))() == "second version"
+    now[0] += 61
+    assert tool.execute(str(path))() == "second version"
+    assert tool.cache_stats()["hits"] == 1
+
+
+def test_cache_persists_to_disk(tmp_path):
+    from agentsystem.agents.tools.tool_cache import ToolCache
+
+    calls = []
+
+    def double(x: int) -> int:
+        calls.append(x)
+        return 2 * x
+
+    assert Tool(double, cache=ToolCache(cache_dir=tmp_path)).execute(2)() == 4
+    fresh = Tool(double, cache=ToolCache(cache_dir=tmp_path))
+    assert fresh.execute(2)() == 4
+    assert calls == [2]
+    fresh.cache.invalidate()
+    assert fresh.execute(2)() == 4
+    assert calls == [2, 2]
+
+
+def test_cache_invalidates_one_tool_without_touching_others(tmp_path):
+    from agentsystem.agents.tools.tool_cache import ToolCache
+
+    calls = []
+
+    def double(x: int) -> int:
+        calls.append("double")
+        return 2 * x
+
+    def triple(x: int) -> int:
+        calls.append("triple")
+        return 3 * x
+
+    cache = ToolCache(cache_dir=tmp_path)
+    tools = [Tool(double, cache=cache), Tool(triple, cache=cache)]
+    assert [tool.execute(2)() for tool in tools] == [4, 6]
+    cache.invalidate(tools[0].cache_name)
+    fresh = Tool(triple, cache=ToolCache(cache_dir=tmp_path))
+
+    assert [tool.execute(2)() for tool in tools + [fresh]] == [4, 6, 6]
+    assert calls == ["double", "triple", "double"]
+
+
+def test_cache_tells_apart_functions_with_the_same_name(tmp_path):
+    from agentsystem.agents.tools.tool_cache import ToolCache
+
+    def make(factor):
+        def scale(x: int) -> int:
+            return factor * x
+
+        scale.__qualname__ = f"scale_by_{factor}"
+        return scale
+
+    double = Tool(make(2), cache=ToolCache(cache_dir=tmp_path))
+    triple = Tool(make(3), cache=ToolCache(cache_dir=tmp_path))
+
+    assert double.execute(5)() == 10
+    assert triple.execute(5)() == 15
@@ -0,0 +1,49 @@
+from agentsystem.agents.tools.benchmark_tool_selection import evaluate
+from agentsystem.agents.tools.tool_selector import HashingEmbedding, ToolSelector
+
+TOOLS = {
+    "get_weather": "get_weather\nGet the weather forecast and temperature for a city",
+    "send_email": "send_email\nSend an email message to a recipient",
+    "search_code": "search_code\nSearch the code base for a regular expression",
+    "read_file": "read_file\nRead and return the contents of a file",
+}
+
+
+class CountingEmbedding(HashingEmbedding):
+    def __init__(self):
+        super().__init__()
+        self.embedded = []
+
+    def get_text_embedding_batch(self, texts, **kwargs):
+        self.embedded += texts
+        return super().get_text_embedding_batch(texts)
+
+
+def test_select_keeps_recent_and_pinned_tools():
+    selector = ToolSelector(top_k=1, recent=1, always=["read_file"])
+
+    assert selector.select(TOOLS, "Will the temperature drop in Oslo?") == ["get_weather", "read_file"]
+    assert selector.select(TOOLS, "Email the forecast to Kim", used=["search_code", "get_weather"]) == [
+        "get_weather",
+        "send_email",
+        "read_file",
+    ]
+
+
+def test_descriptions_are_embedded_once():
+    embedding = CountingEmbedding()
+    selector = ToolSelector(embed_model=embedding, top_k=2)
+
+    selector.select(TOOLS, "weather")
+    selector.select(TOOLS, "email")
+    selector.select({**TOOLS, "send_email": "send_email\nSend a text message"}, "message")
+
+    assert len(embedding.embedded) == len(TOOLS) + 1
+
+
+def test_fixture_savings_and_accuracy():
+    result = evaluate(ToolSelector(top_k=8, recent=0), token_counter=lambda text: len(text) // 4)
+
+    assert result["tools"] == 52
+    assert result["savings"] > 0.8
+    assert result["accuracy"] > 0.9
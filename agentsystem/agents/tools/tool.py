@@ -1,14 +1,39 @@
+import asyncio
+import collections.abc
+import dataclasses
+import threading
+from concurrent.futures import Future
+from enum import Enum
 from functools import wraps
-from types import FunctionType
+from types import FunctionType, UnionType
 from typing import (
+    Annotated,
     Callable,
     Any,
     Dict,
+    Literal,
     Optional,
+    Union,
+    get_args,
+    get_origin,
     get_type_hints,
 )
 import inspect
-
+import re
+
+from agentsystem.agents.tools.execution import (
+    EXECUTION_MODES,
+    ExecutionMode,
+    ToolTimeoutError,
+    call_by_reference,
+    function_reference,
+    kill_isolated,
+    process_pool,
+    run_coroutine,
+    submit_isolated,
+    thread_pool,
+)
+from agentsystem.agents.tools.tool_cache import ToolCache, file_stamp
 from agentsystem.models.Response import Response
 
 example_description_open_ai = {
@@ -30,6 +55,221 @@ example_description_open_ai = {
 }
 
 
+class ToolArgumentError(ValueError):
+    """Raised when the arguments of a tool call do not match the tool's signature."""
+
+
+_JSON_TYPES = {str: "string", int: "integer", float: "number", bool: "boolean", type(None): "null"}
+_ARGS_HEADER = re.compile(r"^\s*(Args|Arguments|Parameters)\s*:\s*$")
+_ARG_LINE = re.compile(r"^\s*\*{0,2}(\w+)\s*(\([^)]*\))?\s*:\s*(.*)$")
+
+
+def _parse_param_docs(doc: str) -> Dict[str, str]:
+    """Parses the descriptions of the Args section of a Google style docstring, including continuation lines."""
+    lines = inspect.cleandoc(doc).splitlines()
+    docs: Dict[str, str] = {}
+    start = next((i + 1 for i, line in enumerate(lines) if _ARGS_HEADER.match(line)), None)
+    if start is None:
+        return docs
+    indent = None
+    current = None
+    for line in lines[start:]:
+        if not line.strip():
+            continue
+        line_indent = len(line) - len(line.lstrip())
+        if indent is None:
+            indent = line_indent
+        if line_indent < indent:
+            break
+        match = _ARG_LINE.match(line)
+        if line_indent == indent and match:
+            current = match.group(1)
+            docs[current] = match.group(3).strip()
+        elif current:
+            docs[current] = f"{docs[current]} {line.strip()}".strip()
+    return docs
+
+
+def _json_schema(python_type: Any, seen: frozenset = frozenset()) -> Dict[str, Any]:
+    """Converts a type annotation to a JSON schema."""
+    if python_type is Any:
+        return {}
+    if python_type in _JSON_TYPES:
+        return {"type": _JSON_TYPES[python_type]}
+    origin, args = get_origin(python_type), get_args(python_type)
+    if origin is Literal:
+        values = list(args)
+        types = {_JSON_TYPES.get(type(v)) for v in values}
+        # values of mixed or non-JSON types are described by the enum alone
+        return {"type": types.pop(), "enum": values} if len(types) == 1 and None not in types else {"enum": values}
+    if origin in (Union, UnionType):
+        options = [_json_schema(arg, seen) for arg in args]
+        if all(set(option) == {"type"} and isinstance(option["type"], str) for option in options):
+            return {"type": [option["type"] for option in options]}
+        return {"anyOf": options}
+    if origin is Annotated:
+        return _json_schema(args[0], seen)
+    if inspect.isclass(python_type) and issubclass(python_type, Enum):
+        return _json_schema(Literal[tuple(member.value for member in python_type)], seen)
+    if inspect.isclass(python_type) and dataclasses.is_dataclass(python_type):
+        if python_type in seen:
+            return {"type": "object"}
+        hints = get_type_hints(python_type)
+        fields = dataclasses.fields(python_type)
+        return {
+            "type": "object",
+            "properties": {f.name: _json_schema(hints.get(f.name, Any), seen | {python_type}) for f in fields},
+            "required": [
+                f.name
+                for f in fields
+                if f.default is dataclasses.MISSING and f.default_factory is dataclasses.MISSING
+            ],
+        }
+    if inspect.isclass(python_type) and hasattr(python_type, "model_json_schema"):
+        return python_type.model_json_schema()
+    container = origin or python_type
+    if container in (list, set, frozenset, collections.abc.Sequence, collections.abc.Set):
+        schema: Dict[str, Any] = {"type": "array"}
+        if args:
+            schema["items"] = _json_schema(args[0], seen)
+        if container in (set, frozenset, collections.abc.Set):
+            schema["uniqueItems"] = True
+        return schema
+    if container is tuple:
+        if len(args) == 2 and args[1] is Ellipsis:
+            return {"type": "array", "items": _json_schema(args[0], seen)}
+        if args:
+            items = [_json_schema(arg, seen) for arg in args]
+            return {"type": "array", "prefixItems": items, "minItems": len(items), "maxItems": len(items)}
+        return {"type": "array"}
+    if container in (dict, collections.abc.Mapping):
+        schema = {"type": "object"}
+        if len(args) == 2:
+            schema["additionalProperties"] = _json_schema(args[1], seen)
+        return schema
+    return {"type": "string"}
+
+
+def _validator(python_type: Any) -> Callable[[Any, str], Any]:
+    """Compiles a function that checks a decoded JSON value against a type annotation and converts it to that type."""
+
+    def fail(value, path, expected):
+        raise ToolArgumentError(f"argument '{path}': expected {expected}, got {value!r}")
+
+    if python_type is Any:
+        return lambda value, path: value
+    if python_type is bool:
+        return lambda value, path: value if isinstance(value, bool) else fail(value, path, "boolean")
+    if python_type is int:
+
+        def check_int(value, path):
+            if isinstance(value, float) and value.is_integer():
+                return int(value)
+            return value if isinstance(value, int) and not isinstance(value, bool) else fail(value, path, "integer")
+
+        return check_int
+    if python_type is float:
+
+        def check_float(value, path):
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                return float(value)
+            return fail(value, path, "number")
+
+        return check_float
+    if python_type is str:
+        return lambda value, path: value if isinstance(value, str) else fail(value, path, "string")
+    if python_type is type(None):
+        return lambda value, path: value if value is None else fail(value, path, "null")
+
+    origin, args = get_origin(python_type), get_args(python_type)
+    if origin is Annotated:
+        return _validator(args[0])
+    if origin is Literal:
+        options = list(args)
+        return lambda value, path: value if value in options else fail(value, path, f"one of {options}")
+    if origin in (Union, UnionType):
+        validators = [_validator(arg) for arg in args]
+
+        def check_union(value, path):
+            for validator in validators:
+                try:
+                    return validator(value, path)
+                except ToolArgumentError:
+                    pass
+            return fail(value, path, " or ".join(str(_json_schema(arg)) for arg in args))
+
+        return check_union
+    if inspect.isclass(python_type) and issubclass(python_type, Enum):
+
+        def check_enum(value, path):
+            try:
+                return python_type(value)
+            except ValueError:
+                return fail(value, path, f"one of {[member.value for member in python_type]}")
+
+        return check_enum
+    if inspect.isclass(python_type) and dataclasses.is_dataclass(python_type):
+        hints = get_type_hints(python_type)
+        fields = {f.name: _validator(hints.get(f.name, Any)) for f in dataclasses.fields(python_type)}
+
+        def check_dataclass(value, path):
+            if isinstance(value, python_type):
+                return value
+            if not isinstance(value, dict):
+                return fail(value, path, f"object {python_type.__name__}")
+            unknown = [name for name in value if name not in fields]
+            if unknown:
+                raise ToolArgumentError(f"argument '{path}': unknown field(s) {', '.join(unknown)}")
+            try:
+                return python_type(
+                    **{name: fields[name](item, f"{path}.{name}") for name, item in value.items()}
+                )
+            except TypeError as e:
+                raise ToolArgumentError(f"argument '{path}': {e}") from e
+
+        return check_dataclass
+    if inspect.isclass(python_type) and hasattr(python_type, "model_validate"):
+
+        def check_model(value, path):
+            try:
+                return python_type.model_validate(value)
+            except ValueError as e:
+                raise ToolArgumentError(f"argument '{path}': {e}") from e
+
+        return check_model
+
+    container = origin or python_type
+    if container in (list, set, frozenset, tuple, collections.abc.Sequence, collections.abc.Set):
+        if container is tuple and args and not (len(args) == 2 and args[1] is Ellipsis):
+            items = [_validator(arg) for arg in args]
+
+            def check_fixed_tuple(value, path):
+                if not isinstance(value, list) or len(value) != len(items):
+                    return fail(value, path, f"array of {len(items)} items")
+                return tuple(item(v, f"{path}[{i}]") for i, (item, v) in enumerate(zip(items, value)))
+
+            return check_fixed_tuple
+        item = _validator(args[0]) if args else _validator(Any)
+        build = {set: set, frozenset: frozenset, tuple: tuple, collections.abc.Set: set}.get(container, list)
+
+        def check_array(value, path):
+            if not isinstance(value, list):
+                return fail(value, path, "array")
+            return build(item(v, f"{path}[{i}]") for i, v in enumerate(value))
+
+        return check_array
+    if container in (dict, collections.abc.Mapping):
+        item = _validator(args[1]) if len(args) == 2 else _validator(Any)
+
+        def check_object(value, path):
+            if not isinstance(value, dict):
+                return fail(value, path, "object")
+            return {key: item(v, f"{path}.{key}") for key, v in value.items()}
+
+        return check_object
+    return lambda value, path: value
+
+
 class Tool[T: Any]():
     """Base class for tools that can auto-document themselves from function docstrings."""
 
@@ -37,51 +277,107 @@ class Tool[T: Any]():
         self,
         func: Optional[Callable[..., T]] = None,
         description: Optional[str] = None,
+        mode: ExecutionMode = "inline",
+        timeout: Optional[float] = None,
+        max_concurrency: Optional[int] = None,
+        cache: Union[bool, float, ToolCache, None] = None,
     ):
+        """Creates a tool from a function.
+
+        Args:
+            func (Callable[..., T]): The function the tool runs.
+            description (str): Overrides the docstring of func as description.
+            mode (ExecutionMode): Where func runs: "inline" on the caller's thread, "thread" on the shared
+                thread pool, "process" on the shared process pool (func must be defined at module level) or
+                "async" on the shared event loop (func must be a coroutine function). Coroutine functions
+                default to "async".
+            timeout (float): Seconds after which a call raises ToolTimeoutError and is cancelled. Not
+                supported inline.
+            max_concurrency (int): Maximum number of calls of this tool running at once, further calls wait.
+            cache (Union[bool, float, ToolCache]): Caches results by argument. True marks the tool as pure,
+                a number caches results for that many seconds, a ToolCache allows persistence and
+                invalidation stamps such as file_stamp("path").
+        """
         self.func = func
         self._description = (
             description or func and inspect.getdoc(func) or "No description available"
         )
         self._input_type = inspect.signature(func).parameters if func else None
 
+        if mode not in EXECUTION_MODES:
+            raise ValueError(f"Unknown execution mode {mode!r}, expected one of {EXECUTION_MODES}")
+        if func and inspect.iscoroutinefunction(func) and mode == "inline":
+            mode = "async"
+        if mode == "async" and func and not inspect.iscoroutinefunction(func):
+            raise ValueError("Execution mode 'async' needs a coroutine function")
+        if timeout is not None and mode == "inline":
+            raise ValueError("A timeout needs execution mode 'thread', 'process' or 'async'")
+        self.mode = mode
+        self.timeout = timeout
+        self._reference = function_reference(func) if func and mode == "process" else None
+        self._semaphore = threading.BoundedSemaphore(max_concurrency) if max_concurrency else None
+        if cache is True:
+            cache = ToolCache()
+        elif cache is False:
+            cache = None
+        elif isinstance(cache, (int, float)):
+            cache = ToolCache(ttl=cache)
+        self.cache: Optional[ToolCache] = cache
+
         if func:
             wraps(func)(self)
 
     def get_openai_description(self) -> Dict[str, Any]:
         """
         Generate an OpenAI-compatible function description from the tool's function.
+
+        The description is computed once and cached until the function or description changes,
+        callers must not modify the returned dict.
         """
         if not self.func:
             raise ValueError("No function provided to generate description from")
 
-        # Get function signature
-        sig = inspect.signature(self.func)
+        key = (self.func, getattr(self.func, "__code__", None), self._description)
+        cached = getattr(self, "_schema_cache", None)
+        if cached is None or cached[0] != key:
+            cached = (key, *self._build_openai_description())
+            self._schema_cache = cached
+        return cached[1]
 
-        # Get type hints
-        type_hints = get_type_hints(self.func)
+    def _build_openai_description(self) -> tuple[Dict[str, Any], Dict[str, Callable[[Any], Any]]]:
+        """Builds the OpenAI description and the argument validators of the tool's function."""
+        sig = inspect.signature(self.func)
+        try:
+            type_hints = get_type_hints(self.func)
+        except Exception:
+            type_hints = {}
+        param_docs = _parse_param_docs(self.func.__doc__ or "")
 
-        # Build parameters object
         properties = {}
         required = []
-
+        validators = {}
         for param_name, param in sig.parameters.items():
-            # Skip self parameter for methods
-            if param_name == "self":
+            # Skip self parameter for methods and variadic parameters
+            if param_name == "self" or param.kind in (
+                inspect.Parameter.VAR_POSITIONAL,
+                inspect.Parameter.VAR_KEYWORD,
+            ):
                 continue
 
-            param_type = type_hints.get(param_name, Any)
-            param_info = {
-                "type": self._get_json_type(param_type),
-                "description": self._get_param_description(param_name),
+            param_type = type_hints.get(param_name, param.annotation)
+            # unannotated parameters are described as strings to the model but accept any value
+            annotated = param_type is not inspect.Parameter.empty
+            properties[param_name] = {
+                **_json_schema(param_type if annotated else str),
+                "description": param_docs.get(param_name, f"Parameter: {param_name}"),
             }
+            validators[param_name] = _validator(param_type if annotated else Any)
 
             # Handle default values
             if param.default == inspect.Parameter.empty:
                 required.append(param_name)
 
-            properties[param_name] = param_info
-
-        return {
+        description = {
             "type": "function",
             "function": {
                 "name": self.func.__name__,
@@ -93,35 +389,43 @@ class Tool[T: Any]():
                 },
             },
         }
+        return description, validators
+
+    def validate_arguments(self, arguments: Dict[str, Any]) -> Dict[str, Any]:
+        """Checks the arguments of a tool call against the function signature and converts them to the annotated types.
+
+        Args:
+            arguments (Dict[str, Any]): The decoded JSON arguments of the call.
+
+        Raises:
+            ToolArgumentError: If an argument is unknown, missing or does not match its type.
+
+        Returns:
+            Dict[str, Any]: The arguments, with enums, dataclasses, tuples and sets constructed.
+        """
+        description = self.get_openai_description()
+        validators = self._schema_cache[2]
+        required = description["function"]["parameters"]["required"]
+        missing = [name for name in required if name not in arguments]
+        if missing:
+            raise ToolArgumentError(f"missing required argument(s): {', '.join(missing)}")
+        unknown = [name for name in arguments if name not in validators]
+        if unknown:
+            raise ToolArgumentError(
+                f"unknown argument(s): {', '.join(unknown)}, expected: {', '.join(validators)}"
+            )
+        return {name: validators[name](value, name) for name, value in arguments.items()}
 
     def _get_json_type(self, python_type: type) -> str:
         """Convert Python type to JSON schema type."""
-        type_map = {
-            str: "string",
-            int: "integer",
-            float: "number",
-            bool: "boolean",
-            list: "array",
-            dict: "object",
-        }
-        return type_map.get(python_type, "string")
+        return _json_schema(python_type).get("type", "string")
 
     def _get_param_description(self, param_name: str) -> str:
         """
         Extract parameter description from the function's docstring.
         Returns a default description if none is found.
         """
-        if not self.func.__doc__:
-            return f"Parameter: {param_name}"
-
-        # Look for parameter description in docstring
-        doc_lines = self.func.__doc__.split("\n")
-        for i, line in enumerate(doc_lines):
-            if param_name in line and ":" in line:
-                # Extract description after the colon
-                return line.split(":", 1)[1].strip()
-
-        return f"Parameter: {param_name}"
+        return _parse_param_docs(self.func.__doc__ or "").get(param_name, f"Parameter: {param_name}")
 
     def __call__(self, *args, **kwargs) -> Response[T]:
         return self.run(*args, **kwargs)
@@ -130,9 +434,9 @@ class Tool[T: Any]():
     def description(self) -> str:
         return self._description
     @classmethod
-    def from_function(cls, func) -> "Tool":
+    def from_function(cls, func, **options) -> "Tool":
         """Create a tool directly from a function, using its docstring as description."""
-        return cls(func)
+        return cls(func, **options)
 
     def run(self, *args, **kwargs) -> Response[T]:
         """Main execution method that handles pre/post processing"""
@@ -151,15 +455,122 @@ class Tool[T: Any]():
         """Core execution logic - should be overridden by subclasses if not using func"""
         if self.func is None:
             raise NotImplementedError("Either provide a function or override execute()")
+        if self.mode == "inline" and self._semaphore is None:
+            call = lambda: self.func(*args, **kwargs)
         else:
-            return lambda: self.func(*args, **kwargs)
+            call = lambda: self.wait(self.submit(*args, **kwargs))
+        if self.cache is None:
+            return call
+
+        def cached_call():
+            arguments = self._bind_arguments(args, kwargs)
+            hit, value = self.cache.get(self.cache_name, arguments)
+            if not hit:
+                value = call()
+                self.cache.put(self.cache_name, arguments, value)
+            return value
+
+        return cached_call
+
+    def _bind_arguments(self, args: tuple, kwargs: dict) -> Dict[str, Any]:
+        """The arguments of a call by parameter name, with defaults applied."""
+        bound = inspect.signature(self.func).bind(*args, **kwargs)
+        bound.apply_defaults()
+        return dict(bound.arguments)
+
+    def cache_stats(self) -> Dict[str, float]:
+        """The hits, misses and hit rate of the tool's cache."""
+        if self.cache is None:
+            return {"hits": 0, "misses": 0, "hit_rate": 0.0}
+        return self.cache.stats().get(self.cache_name, {"hits": 0, "misses": 0, "hit_rate": 0.0})
+
+    @property
+    def cache_name(self) -> str:
+        """The name the tool's results are cached under, qualified so that equally named functions do not share entries."""
+        return f"{getattr(self.func, '__module__', None)}.{getattr(self.func, '__qualname__', self.func.__name__)}"
+
+    def submit(self, *args, **kwargs) -> Future:
+        """Starts a call of func in the tool's execution mode without waiting for it.
+
+        Blocks while max_concurrency calls are running. The future can be cancelled with cancel().
 
+        Returns:
+            Future: The future of the result.
+        """
+        if self.func is None:
+            raise NotImplementedError("Only tools with a function can be submitted")
+        if self._semaphore:
+            self._semaphore.acquire()
+        try:
+            future = self._start(args, kwargs)
+        except BaseException:
+            if self._semaphore:
+                self._semaphore.release()
+            raise
+        if self._semaphore:
+            future.add_done_callback(lambda _: self._semaphore.release())
+        return future
+
+    def _start(self, args: tuple, kwargs: dict) -> Future:
+        if self.mode == "thread":
+            return thread_pool().submit(self.func, *args, **kwargs)
+        if self.mode == "process":
+            if self.timeout is not None:
+                # a call that times out is killed, which must not break the calls sharing its worker
+                return submit_isolated(call_by_reference, self._reference, args, kwargs)
+            return process_pool().submit(call_by_reference, self._reference, args, kwargs)
+        if self.mode == "async":
+            return run_coroutine(self.func(*args, **kwargs), self.timeout)
+        future: Future = Future()
+        try:
+            future.set_result(self.func(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def wait(self, future: Future) -> T:
+        """Waits for the result of a submitted call, cancelling it if it exceeds the tool's timeout.
+
+        Raises:
+            ToolTimeoutError: If the call did not finish within timeout seconds.
+        """
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            if future.done() and not isinstance(future.exception(), TimeoutError):
+                raise
+            self.cancel(future)
+            raise ToolTimeoutError(
+                f"Tool {self.func.__name__} did not finish within {self.timeout} seconds"
+            ) from None
+
+    def cancel(self, future: Future) -> None:
+        """Cancels a submitted call.
+
+        Calls that did not start yet are dropped and coroutines are cancelled. A running process mode
+        call of a tool with a timeout is stopped by killing its worker process. Other running calls cannot
+        be interrupted and keep their max_concurrency slot until they return.
+        """
+        if not future.cancel() and not future.done() and self.mode == "process":
+            kill_isolated(future)
+
+    async def acall(self, *args, **kwargs) -> T:
+        """Runs the tool from a coroutine without blocking its event loop."""
+        return await asyncio.to_thread(self.execute(*args, **kwargs))
 
 
 # Decorator syntax for instant tool creation
 def as_tool[
     T: function
-](func: Optional[T] = None, description: Optional[str] = None) -> Tool:
+](
+    func: Optional[T] = None,
+    description: Optional[str] = None,
+    *,
+    mode: ExecutionMode = "inline",
+    timeout: Optional[float] = None,
+    max_concurrency: Optional[int] = None,
+    cache: Union[bool, float, ToolCache, None] = None,
+) -> Tool:
     """
     Decorator to convert a function into a Tool.
     Can be used with or without parameters:
@@ -169,10 +580,25 @@ def as_tool[
 
     @as_tool(description="Custom description")
     def my_func(): ...
+
+    @as_tool(mode="process", timeout=30, max_concurrency=2)
+    def analyze(path: str): ...
+
+    @as_tool(cache=ToolCache(stamp=file_stamp("path"), cache_dir=".tool_cache"))
+    def summarize(path: str): ...
+
+    See Tool for the execution modes and cache options.
     """
 
     def decorator(f) -> Tool:
-        return Tool(f, description)
+        return Tool(
+            f,
+            description,
+            mode=mode,
+            timeout=timeout,
+            max_concurrency=max_concurrency,
+            cache=cache,
+        )
 
     if func is None:
         return decorator  # type: ignore
@@ -219,7 +645,7 @@ def read_file(path: str) -> str:
         return f.read()
 
 
-file_tool = Tool.from_function(read_file)
+file_tool = Tool.from_function(read_file, cache=ToolCache(stamp=file_stamp("path")))
 
 
 # Example showing how to override docstring with custom description
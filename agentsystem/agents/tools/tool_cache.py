@@ -0,0 +1,215 @@
+"""
+Result cache for tools whose result only depends on their arguments.
+
+Calls are keyed by the tool name (the module and qualified name of its function, see Tool.cache_name)
+and its normalized arguments (bound to the signature with defaults applied). Entries are evicted
+least recently used, can expire after a TTL, can be validated with a stamp such as the mtime of a
+file argument, and can be pickled to disk to survive the process.
+"""
+
+import dataclasses
+import hashlib
+import json
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from enum import Enum
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+
+def _normalize(value: Any) -> Any:
+    """Converts an argument to a JSON serializable value that is equal for equal arguments."""
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    if isinstance(value, Enum):
+        return _normalize(value.value)
+    if isinstance(value, Path):
+        return str(value)
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return {field.name: _normalize(getattr(value, field.name)) for field in dataclasses.fields(value)}
+    if isinstance(value, dict):
+        return {str(key): _normalize(item) for key, item in value.items()}
+    if isinstance(value, (set, frozenset)):
+        return sorted((_normalize(item) for item in value), key=repr)
+    if isinstance(value, (list, tuple)):
+        return [_normalize(item) for item in value]
+    return repr(value)
+
+
+def file_stamp(*param_names: str) -> Callable[[dict], Any]:
+    """Creates a stamp function for ToolCache that invalidates entries when the files named by the given parameters change.
+
+    Args:
+        *param_names (str): Parameters holding file paths.
+
+    Returns:
+        Callable[[dict], Any]: Returns the (mtime, size) of every file, None for missing files.
+    """
+
+    def stamp(arguments: dict) -> Any:
+        stamps = []
+        for name in param_names:
+            try:
+                stat = os.stat(arguments[name])
+                stamps.append((stat.st_mtime_ns, stat.st_size))
+            except (OSError, KeyError, TypeError):
+                stamps.append(None)
+        return tuple(stamps)
+
+    return stamp
+
+
+class ToolCache:
+    """
+    Bounded LRU cache of tool results.
+
+    An entry is reused while it is younger than ttl and stamp(arguments) is unchanged. With a cache_dir,
+    entries are also pickled to disk under their key, results that cannot be pickled are only kept in memory.
+    Hits and misses are counted per tool name.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 256,
+        ttl: Optional[float] = None,
+        cache_dir=None,
+        stamp: Optional[Callable[[dict], Any]] = None,
+    ):
+        """Creates an empty cache.
+
+        Args:
+            max_entries (int): Entries kept in memory. Defaults to 256.
+            ttl (Optional[float]): Seconds an entry stays valid. Defaults to forever, for pure tools.
+            cache_dir (Optional[Path]): Directory to persist entries in. Defaults to memory only.
+            stamp (Optional[Callable[[dict], Any]]): Computes a validation stamp from the bound arguments,
+                e.g. file_stamp("path"). Entries whose stamp changed are recomputed.
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.stamp = stamp
+        self._entries: OrderedDict = OrderedDict()
+        self._stats: dict[str, list[int]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def prefix(name: str) -> str:
+        """The start of the keys of every call of the tool name, tool names are not file name safe."""
+        return hashlib.blake2b(name.encode(), digest_size=8).hexdigest() + "-"
+
+    @classmethod
+    def key(cls, name: str, arguments: dict) -> str:
+        """The cache key of a call of the tool name with the given bound arguments."""
+        normalized = json.dumps([name, _normalize(arguments)], sort_keys=True)
+        return cls.prefix(name) + hashlib.blake2b(normalized.encode(), digest_size=16).hexdigest()
+
+    def _valid(self, entry, stamp) -> bool:
+        _, entry_stamp, created = entry
+        return entry_stamp == stamp and (self.ttl is None or time.time() - created < self.ttl)
+
+    def _count(self, name: str, hit: bool) -> None:
+        counts = self._stats.setdefault(name, [0, 0])
+        counts[0 if hit else 1] += 1
+
+    def get(self, name: str, arguments: dict) -> tuple[bool, Any]:
+        """Looks up a call.
+
+        Returns:
+            tuple[bool, Any]: Whether the call was cached and the cached result.
+        """
+        key = self.key(name, arguments)
+        stamp = self.stamp(arguments) if self.stamp else None
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            entry = self.load_from_disk(key)
+        with self._lock:
+            hit = entry is not None and self._valid(entry, stamp)
+            self._count(name, hit)
+            if not hit:
+                self._entries.pop(key, None)
+                return False, None
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            self._evict()
+        return True, entry[0]
+
+    def put(self, name: str, arguments: dict, value: Any) -> None:
+        key = self.key(name, arguments)
+        entry = (value, self.stamp(arguments) if self.stamp else None, time.time())
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            self._evict()
+        self.save_to_disk(key, entry)
+
+    def _evict(self) -> None:
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, name: Optional[str] = None, arguments: Optional[dict] = None) -> None:
+        """Drops cached calls, in memory and on disk.
+
+        Args:
+            name (Optional[str]): The tool whose entries are dropped. Defaults to every tool.
+            arguments (Optional[dict]): Drops only the call of name with these bound arguments.
+
+        Raises:
+            ValueError: If arguments are given without a tool name.
+        """
+        if arguments is not None:
+            if name is None:
+                raise ValueError("Invalidating a single call needs the tool name")
+            keys = [self.key(name, arguments)]
+            with self._lock:
+                self._entries.pop(keys[0], None)
+        else:
+            prefix = self.prefix(name) if name is not None else ""
+            with self._lock:
+                keys = [key for key in self._entries if key.startswith(prefix)]
+                for key in keys:
+                    del self._entries[key]
+            if self.cache_dir and self.cache_dir.exists():
+                keys = [path.stem for path in self.cache_dir.glob(f"{prefix}*.pkl")]
+        if self.cache_dir:
+            for key in keys:
+                (self.cache_dir / f"{key}.pkl").unlink(missing_ok=True)
+
+    def hit_rate(self, name: Optional[str] = None) -> float:
+        """The share of lookups that were hits, for one tool or all tools."""
+        counts = [self._stats.get(name, [0, 0])] if name else list(self._stats.values())
+        hits = sum(c[0] for c in counts)
+        total = hits + sum(c[1] for c in counts)
+        return hits / total if total else 0.0
+
+    def stats(self) -> dict[str, dict[str, float]]:
+        """The hits, misses and hit rate of every tool that used the cache."""
+        return {
+            name: {"hits": hits, "misses": misses, "hit_rate": self.hit_rate(name)}
+            for name, (hits, misses) in self._stats.items()
+        }
+
+    def load_from_disk(self, key: str):
+        if not self.cache_dir:
+            return None
+        try:
+            with open(self.cache_dir / f"{key}.pkl", "rb") as f:
+                return pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+            return None
+
+    def save_to_disk(self, key: str, entry) -> None:
+        if not self.cache_dir:
+            return
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp = self.cache_dir / f"{key}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            tmp.unlink(missing_ok=True)
+            return
+        os.replace(tmp, self.cache_dir / f"{key}.pkl")
@@ -0,0 +1,133 @@
+"""
+Selects the tools relevant to the current turn, so that large tool registries do not fill the prompt.
+
+Tool descriptions are embedded once (re-embedded only when a description changes) and ranked by
+cosine similarity to the recent conversation. Tools used recently and pinned tools are always part
+of the selection, so a multi-step tool loop keeps the tools it is working with.
+"""
+
+import hashlib
+from typing import Iterable, Sequence
+
+import numpy as np
+
+from agentsystem.util import tokenize_code
+
+STOP_WORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "given", "how", "i", "if", "in",
+    "is", "it", "me", "my", "of", "on", "or", "please", "the", "this", "to", "what", "which", "with",
+}
+
+
+class HashingEmbedding:
+    """
+    Dependency free bag-of-words embedding for tool selection.
+
+    Code-aware tokens are hashed into `dimensions` buckets with log-scaled counts. Exposes the two
+    methods of a llama_index embedding model that ToolSelector uses, so a real embedding model can
+    be swapped in.
+    """
+
+    def __init__(self, dimensions: int = 1024):
+        self.dimensions = dimensions
+
+    def _embed(self, text: str) -> list[float]:
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for token in tokenize_code(text):
+            if token not in STOP_WORDS:
+                digest = hashlib.blake2b(token.encode(), digest_size=8).digest()
+                vector[int.from_bytes(digest, "little") % self.dimensions] += 1.0
+        return np.log1p(vector).tolist()
+
+    def get_text_embedding_batch(self, texts: list[str], **kwargs) -> list[list[float]]:
+        return [self._embed(text) for text in texts]
+
+    def get_query_embedding(self, query: str) -> list[float]:
+        return self._embed(query)
+
+
+def tool_text(description: dict) -> str:
+    """The text embedded for an OpenAI tool description: name, description and parameter descriptions."""
+    function = description.get("function", description)
+    parameters = function.get("parameters", {}).get("properties", {})
+    lines = [function.get("name", ""), function.get("description", "")]
+    lines += [f"{name}: {schema.get('description', '')}" for name, schema in parameters.items()]
+    return "\n".join(lines)
+
+
+class ToolSelector:
+    """Picks the top_k tools most similar to a query, plus recently used and pinned tools."""
+
+    def __init__(
+        self,
+        embed_model=None,
+        top_k: int = 8,
+        recent: int = 3,
+        always: Iterable[str] = (),
+    ):
+        """Creates a selector.
+
+        Args:
+            embed_model (Optional[BaseEmbedding]): Embeds tool texts and queries, anything with
+                get_text_embedding_batch and get_query_embedding. Defaults to HashingEmbedding.
+            top_k (int): Number of tools selected by similarity. Defaults to 8.
+            recent (int): Number of most recently used tools that are always selected. Defaults to 3.
+            always (Iterable[str]): Names of tools that are always selected.
+        """
+        self.embed_model = embed_model or HashingEmbedding()
+        self.top_k = top_k
+        self.recent = recent
+        self.always = set(always)
+        self._names: list[str] = []
+        self._digests: dict[str, str] = {}
+        self._vectors = np.zeros((0, 0), dtype=np.float32)
+
+    def index(self, tools: dict[str, str]) -> None:
+        """Embeds the {name: text} tools whose text is new or changed, and drops tools that are gone."""
+        digests = {name: hashlib.blake2b(text.encode(), digest_size=16).hexdigest() for name, text in tools.items()}
+        if digests == self._digests:
+            return
+        changed = [name for name, digest in digests.items() if self._digests.get(name) != digest]
+        new_vectors = {}
+        if changed:
+            embedded = self.embed_model.get_text_embedding_batch([tools[name] for name in changed])
+            new_vectors = dict(zip(changed, np.asarray(embedded, dtype=np.float32)))
+        old_rows = {name: row for row, name in enumerate(self._names)}
+        self._names = list(tools)
+        self._digests = digests
+        if not self._names:
+            self._vectors = np.zeros((0, 0), dtype=np.float32)
+            return
+        vectors = np.stack(
+            [new_vectors[name] if name in new_vectors else self._vectors[old_rows[name]] for name in self._names]
+        )
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        self._vectors = vectors / np.where(norms == 0, 1, norms)
+
+    def rank(self, query: str) -> list[tuple[str, float]]:
+        """All indexed tools with their similarity to query, most similar first."""
+        if not self._names:
+            return []
+        query_vector = np.asarray(self.embed_model.get_query_embedding(query), dtype=np.float32)
+        norm = np.linalg.norm(query_vector)
+        scores = self._vectors @ (query_vector / norm if norm else query_vector)
+        order = np.argsort(-scores, kind="stable")
+        return [(self._names[i], float(scores[i])) for i in order]
+
+    def select(self, tools: dict[str, str], query: str, used: Sequence[str] = ()) -> list[str]:
+        """Selects the tools for a turn.
+
+        Args:
+            tools (dict[str, str]): The {name: text} of all available tools, see tool_text.
+            query (str): The recent conversation to match the tools against.
+            used (Sequence[str]): Names of the tools called so far, oldest first.
+
+        Returns:
+            list[str]: The selected tool names, in the order of tools.
+        """
+        self.index(tools)
+        selected = {name for name in self.always if name in tools}
+        recent = [name for name in dict.fromkeys(reversed(used)) if name in tools][: self.recent]
+        selected.update(recent)
+        selected.update(name for name, _ in self.rank(query)[: self.top_k])
+        return [name for name in tools if name in selected]
@@ -0,0 +1,106 @@
+"""
+Voters that aggregate the answers of several samples of the same prompt (self-consistency).
+
+Answers are grouped by a hashable key of the parsed output. MajorityVoter gives every sample one
+vote, LogprobVoter weights a sample by the probability of its completion, exp(mean token logprob),
+when the backend returned logprobs.
+"""
+
+import math
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional
+
+
+def hashable(value: Any) -> Any:
+    """A hashable key for a parsed output, equal for equal lists, dicts and sets."""
+    if isinstance(value, (list, tuple)):
+        return tuple(hashable(item) for item in value)
+    if isinstance(value, dict):
+        return tuple(sorted(((hashable(k), hashable(v)) for k, v in value.items()), key=repr))
+    if isinstance(value, (set, frozenset)):
+        return frozenset(hashable(item) for item in value)
+    try:
+        hash(value)
+        return value
+    except TypeError:
+        return repr(value)
+
+
+@dataclass
+class Vote:
+    """The outcome of a multi-sample run."""
+
+    answer: Any
+    share: float
+    samples: list = field(default_factory=list)
+    errors: list[BaseException] = field(default_factory=list)
+    # samples that never started, and samples that were running once the vote was decided and are not counted
+    cancelled: int = 0
+    discarded: int = 0
+
+    @property
+    def stopped_early(self) -> bool:
+        return self.cancelled + self.discarded > 0
+
+
+class MajorityVoter:
+    """One vote per sample, the most frequent answer wins. Ties go to the answer that was seen first."""
+
+    max_weight = 1.0
+
+    def __init__(self, key: Optional[Callable[[Any], Any]] = None):
+        """Creates an empty voter.
+
+        Args:
+            key (Optional[Callable[[Any], Any]]): Maps an answer to what is compared, e.g. str.strip. Defaults to the answer itself.
+        """
+        self.key = key
+        self.scores: dict[Any, float] = {}
+        self.answers: dict[Any, Any] = {}
+
+    def weight(self, answer: Any, logprob: Optional[float]) -> float:
+        return 1.0
+
+    def add(self, answer: Any, logprob: Optional[float] = None) -> None:
+        """Counts the answer of one sample, logprob is the mean token logprob of its completion if known."""
+        key = hashable(self.key(answer) if self.key else answer)
+        self.answers.setdefault(key, answer)
+        self.scores[key] = self.scores.get(key, 0.0) + self.weight(answer, logprob)
+
+    def leader(self) -> tuple[Any, float, float]:
+        """The leading answer, its weight and the weight of the runner-up."""
+        if not self.scores:
+            return None, 0.0, 0.0
+        ranked = sorted(self.scores.items(), key=lambda item: -item[1])
+        runner_up = ranked[1][1] if len(ranked) > 1 else 0.0
+        return self.answers[ranked[0][0]], ranked[0][1], runner_up
+
+    def share(self) -> float:
+        """The leader's share of all weight counted so far."""
+        total = sum(self.scores.values())
+        return self.leader()[1] / total if total else 0.0
+
+    def decided(self, remaining: int, consensus: Optional[float] = None, samples: int = 0) -> bool:
+        """Whether outstanding samples can be cancelled.
+
+        Args:
+            remaining (int): Number of samples that have not been counted yet.
+            consensus (Optional[float]): Stop once the leader holds this share of the weight of all samples.
+                Defaults to stopping once the remaining samples can no longer change the winner.
+            samples (int): Total number of samples.
+        """
+        _, lead, runner_up = self.leader()
+        if consensus is not None and lead >= consensus * samples * self.max_weight:
+            return True
+        return lead > 0 and lead - runner_up > remaining * self.max_weight
+
+
+class LogprobVoter(MajorityVoter):
+    """Weights every sample by exp(mean token logprob), samples without logprobs get `default` weight."""
+
+    def __init__(self, key: Optional[Callable[[Any], Any]] = None, default: float = 0.5):
+        super().__init__(key)
+        self.default = default
+
+    def weight(self, answer: Any, logprob: Optional[float]) -> float:
+        return self.default if logprob is None else math.exp(min(logprob, 0.0))
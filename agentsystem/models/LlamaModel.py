@@ -3,11 +3,183 @@ An implementation of the Model class that uses the llama_cpp library to
 generate responses based on the given prompt and other parameters.
 """
 
+import functools
 import threading
-from agentsystem.models.Model import ChatModel
+from dataclasses import dataclass, field
+from collections import OrderedDict
+from typing import Any, Literal, Optional
+
+import numpy as np
+from agentsystem.models.Model import BatchResult, ChatModel
 from tqdm import tqdm
 from agentsystem.agents.agents import Model
-from llama_cpp import Llama, StoppingCriteriaList
+from llama_cpp import Llama, LlamaGrammar, StoppingCriteriaList
+from llama_cpp.llama_speculative import LlamaDraftModel, LlamaPromptLookupDecoding
+
+
+class GGUFDraftModel(LlamaDraftModel):
+    """
+    Drafts tokens greedily with a small GGUF model that shares the vocabulary of the main model.
+
+    The draft model keeps its KV cache between calls and only evaluates the tokens after the prefix
+    it has in common with the main model's tokens.
+    """
+
+    def __init__(self, model_path: str, num_pred_tokens: int = 10, **model_kwargs):
+        self.model = Llama(model_path=model_path, **{"n_ctx": 4096, "verbose": False, **model_kwargs})
+        self.num_pred_tokens = num_pred_tokens
+
+    def __call__(self, input_ids, /, **kwargs):
+        draft = self.model
+        if len(input_ids) + self.num_pred_tokens > draft.n_ctx():
+            return np.array([], dtype=np.intc)
+        # at least one token is evaluated, so that the logits of the last input token are current
+        limit = min(draft.n_tokens, len(input_ids) - 1)
+        mismatches = np.flatnonzero(draft.input_ids[:limit] != input_ids[:limit])
+        draft.n_tokens = int(mismatches[0]) if len(mismatches) else limit
+        draft.eval(input_ids[draft.n_tokens :].tolist())
+        tokens = []
+        for _ in range(self.num_pred_tokens):
+            token = int(np.argmax(draft.scores[draft.n_tokens - 1]))
+            if token == draft.token_eos():
+                break
+            tokens.append(token)
+            draft.eval([token])
+        return np.array(tokens, dtype=np.intc)
+
+
+# Runtime LoRA functions of llama_cpp, by their current and their older name
+LORA_FUNCTIONS = {
+    "init": ("llama_adapter_lora_init", "llama_lora_adapter_init"),
+    "set": ("llama_set_adapter_lora", "llama_lora_adapter_set"),
+    "clear": ("llama_clear_adapter_lora", "llama_lora_adapter_clear"),
+    "free": ("llama_adapter_lora_free", "llama_lora_adapter_free"),
+}
+
+
+def _lora_function(operation: str):
+    import llama_cpp
+
+    for name in LORA_FUNCTIONS[operation]:
+        function = getattr(llama_cpp, name, None)
+        if function is not None:
+            return function
+    raise NotImplementedError(f"This llama_cpp version cannot {operation} LoRA adapters at runtime")
+
+
+class LoraAdapters:
+    """
+    LoRA adapters over the weights of one Llama, switched per request instead of loading a Llama per adapter.
+
+    Adapters are registered by name and loaded on first activation. Up to max_loaded adapters stay
+    loaded, the least recently used inactive one is freed beyond that. Activating another adapter
+    clears the KV cache, as it was computed with other weights.
+    """
+
+    def __init__(self, llama: Llama, max_loaded: int = 8):
+        self.llama = llama
+        self.max_loaded = max_loaded
+        self.registered: dict[str, tuple[str, float]] = {}
+        self.active: Optional[str] = None
+        self.switches = 0
+        self._loaded: "OrderedDict[str, Any]" = OrderedDict()
+
+    def add(self, name: str, path: str, scale: float = 1.0) -> None:
+        self.registered[name] = (path, scale)
+
+    def activate(self, name: Optional[str]) -> None:
+        """Makes name the only active adapter, None runs the base model.
+
+        Raises:
+            ValueError: If no adapter is registered as name.
+        """
+        if name == self.active:
+            return
+        if name is not None and name not in self.registered:
+            raise ValueError(f"No LoRA adapter registered as {name}, known: {', '.join(self.registered)}")
+        context = self._handle("_ctx")
+        _lora_function("clear")(context)
+        self.active = None
+        if name is not None:
+            path, scale = self.registered[name]
+            _lora_function("set")(context, self._load(path), scale)
+        self.llama.reset()
+        self.active = name
+        self.switches += 1
+
+    def _handle(self, wrapper: str):
+        """The C handle inside the llama_cpp wrapper llama.<wrapper>, the high level API has no LoRA switching.
+
+        Raises:
+            NotImplementedError: If this llama_cpp version stores its handles differently.
+        """
+        handle = getattr(getattr(self.llama, wrapper, None), "ctx" if wrapper == "_ctx" else "model", None)
+        if handle is None:
+            raise NotImplementedError(
+                f"This llama_cpp version has no {wrapper} handle on Llama, LoRA adapters cannot be switched at runtime"
+            )
+        return handle
+
+    def _load(self, path: str):
+        if path in self._loaded:
+            self._loaded.move_to_end(path)
+            return self._loaded[path]
+        adapter = _lora_function("init")(self._handle("_model"), path.encode("utf-8"))
+        if not adapter:
+            raise RuntimeError(f"Could not load the LoRA adapter {path}")
+        self._loaded[path] = adapter
+        active_path = self.registered[self.active][0] if self.active else None
+        for old_path in list(self._loaded)[: max(len(self._loaded) - self.max_loaded, 0)]:
+            if old_path not in (path, active_path):
+                _lora_function("free")(self._loaded.pop(old_path))
+        return adapter
+
+
+@dataclass
+class DraftConfig:
+    """
+    Speculative decoding setup of a LlamaModel. The main model verifies the drafted tokens, so the
+    output is the same as without drafting, only generated faster where drafts are accepted.
+    Verifying needs the logits of every position, so the Llama must be created with logits_all=True,
+    or by LlamaModel.load, which passes the draft model to the Llama.
+
+    Attributes:
+        strategy: "prompt_lookup" drafts the continuation of n-grams found earlier in the prompt and output,
+            which suits agents that echo large parts of their input. "model" drafts with a small GGUF model.
+        num_pred_tokens (int): Tokens drafted per step.
+        max_ngram_size (int): Longest n-gram looked up in the prompt, for prompt_lookup.
+        model_path (Optional[str]): The GGUF of the draft model, for model.
+        model_kwargs (dict): Further arguments of the draft model's Llama, e.g. n_ctx or n_threads.
+    """
+
+    strategy: Literal["prompt_lookup", "model"] = "prompt_lookup"
+    num_pred_tokens: int = 10
+    max_ngram_size: int = 2
+    model_path: Optional[str] = None
+    model_kwargs: dict = field(default_factory=dict)
+
+    def build(self) -> LlamaDraftModel:
+        if self.strategy == "prompt_lookup":
+            return LlamaPromptLookupDecoding(max_ngram_size=self.max_ngram_size, num_pred_tokens=self.num_pred_tokens)
+        if self.strategy == "model":
+            if not self.model_path:
+                raise ValueError("The model draft strategy needs the model_path of a draft GGUF")
+            return GGUFDraftModel(self.model_path, self.num_pred_tokens, **self.model_kwargs)
+        raise ValueError(f"Unknown draft strategy {self.strategy}")
+
+
+def computes_all_logits(llama: Llama) -> bool:
+    """Whether llama keeps the logits of every evaluated position, which verifying drafted tokens reads."""
+    logits_all = getattr(llama, "_logits_all", None)
+    if logits_all is None:
+        logits_all = getattr(getattr(llama, "context_params", None), "logits_all", False)
+    return bool(logits_all)
+
+
+@functools.lru_cache(maxsize=64)
+def compiled_grammar(gbnf: str) -> LlamaGrammar:
+    """Parses a GBNF grammar once, the parsed grammar is reused by every run with the same grammar."""
+    return LlamaGrammar.from_string(gbnf, verbose=False)
 
 
 class LlamaModel(Model):
@@ -24,6 +196,7 @@ class LlamaModel(Model):
 
     model: Llama
     interrupted: bool = False
+    constraint_formats = ("gbnf",)
 
     def format(self, system_message, prompt_message, prefix_message):
         """Formats the given messages into a string that can be passed to the llama model.
@@ -41,19 +214,129 @@ class LlamaModel(Model):
         prompt = f"{instructions}{prefix_message}"
         return prompt
 
+    def constraint_args(self, constraint) -> dict:
+        return {"grammar": compiled_grammar(constraint.value)}
+
+    def __init__(self, model, pure_callback=None, draft: Optional[DraftConfig] = None):
+        """
+        Args:
+            model (Llama): The llama\\_cpp model.
+            pure_callback (Optional[Callable]): Receives the raw completions.
+            draft (Optional[DraftConfig]): Enables speculative decoding, see use_draft.
+        """
+        super().__init__(model, pure_callback)
+        # serializes the batches of this model only, batches of other models run in parallel
+        self._batch_lock = threading.Lock()
+        # held from activating the request's adapter until its generation ended, see _run
+        self._generation_lock = threading.Lock()
+        if draft is not None:
+            self.use_draft(draft)
+
+    @property
+    def adapters(self) -> LoraAdapters:
+        """The LoRA adapters of the model, pick one per request with the lora extra argument."""
+        if "_adapters" not in self.__dict__:
+            self._adapters = LoraAdapters(self.model)
+        return self._adapters
+
+    def add_adapter(self, name: str, path: str, scale: float = 1.0) -> None:
+        """Registers the LoRA adapter at path as name, e.g. Agent(model=model, lora=name) then runs with it.
+
+        Args:
+            name (str): The name requests refer to the adapter by.
+            path (str): The GGUF of the adapter, trained for the base model.
+            scale (float): Strength of the adapter. Defaults to 1.0.
+        """
+        self.adapters.add(name, path, scale)
+
+    def _activate_adapter(self, name: Optional[str]) -> None:
+        if name is None and "_adapters" not in self.__dict__:
+            return
+        self.adapters.activate(name)
+
+    def run_batch_by_adapter(self, requests, **extra_args) -> list[BatchResult]:
+        """Runs requests for different adapters grouped by adapter, so every adapter is activated once.
+
+        The requests of the active adapter run first.
+
+        Args:
+            requests (List[tuple[Optional[str], tuple[str, str, str]]]): The adapter name (None for the base
+                model) and the system, prompt and prefix message of every request.
+            **extra_args: Additional arguments passed to the model for every request.
+
+        Returns:
+            list[BatchResult]: The result of every request, in the order of requests.
+        """
+        groups: dict[Optional[str], list[int]] = {}
+        for index, (adapter, _) in enumerate(requests):
+            groups.setdefault(adapter, []).append(index)
+        active = self.adapters.active if "_adapters" in self.__dict__ else None
+        results: list[BatchResult] = [BatchResult()] * len(requests)
+        for adapter in sorted(groups, key=lambda adapter: adapter != active):
+            indexes = groups[adapter]
+            batch = self.run_batch([requests[i][1] for i in indexes], **{**extra_args, "lora": adapter})
+            for index, result in zip(indexes, batch):
+                results[index] = result
+        return results
+
+    def use_draft(self, draft: Optional[DraftConfig]) -> None:
+        """Enables speculative decoding with the given draft configuration, or disables it with None.
+
+        Raises:
+            ValueError: If the Llama was created without logits_all, its drafted tokens could not be verified.
+        """
+        if draft is not None and not computes_all_logits(self.model):
+            raise ValueError(
+                "Speculative decoding needs a Llama created with logits_all=True, use LlamaModel.load(model_path, draft=...)"
+            )
+        self.model.draft_model = draft.build() if draft is not None else None
+
+    @classmethod
+    def load(cls, model_path: str, draft: Optional[DraftConfig] = None, pure_callback=None, **llama_kwargs):
+        """
+        Loads a GGUF, passing the draft model to the Llama, which then computes the logits drafts are verified with.
+
+        Args:
+            model_path (str): The GGUF of the model.
+            draft (Optional[DraftConfig]): Enables speculative decoding.
+            pure_callback (Optional[Callable]): Receives the raw completions.
+            **llama_kwargs: Further arguments of llama\\_cpp.Llama, e.g. n_ctx.
+        """
+        draft_model = draft.build() if draft is not None else None
+        return cls(Llama(model_path=model_path, draft_model=draft_model, **llama_kwargs), pure_callback)
+
     @classmethod
-    def from_model(cls, model: Llama):
+    def from_model(cls, model: Llama, draft: Optional[DraftConfig] = None):
         """
-        docstring
+        Initializes the class with an existing llama\\_cpp model, optionally drafting tokens as configured by draft.
         """
-        return cls(model)
+        return cls(model, draft=draft)
 
-    def _run(self, prompt, **extra_args):
+    def _run(self, prompt, on_chunk=None, **extra_args):
+        """
+        Activates the request's LoRA adapter and generates the response, holding the model's generation lock
+        until the generation (or stream) ended, so that requests of agents sharing the model cannot switch the
+        adapter or the context under each other.
+
+        Args:
+            prompt (str | List[dict]): The prompt, or the messages for ChatLlamaModel.
+            on_chunk (Optional[Callable[[str], bool]]): Receives the text of every streamed token, streaming stops once it returns True.
+            **extra\\_args: Additional arguments that will be passed directly to the llama model, lora selects the adapter.
+
+        Returns:
+            str: The generated response from the model.
+        """
+        with self._generation_lock:
+            self._activate_adapter(extra_args.get("lora"))
+            return self._complete(prompt, on_chunk, **extra_args)
+
+    def _complete(self, prompt, on_chunk=None, **extra_args):
         """
         Generates a response using the llama model and returns it as a string. If stream is set to true, it generates tokens one by one in real time, otherwise, it generates the whole response at once.
 
         Args:
             prompt (str): The prompt message to pass to the model.
+            on_chunk (Optional[Callable[[str], bool]]): Receives the text of every streamed token, streaming stops once it returns True.
             **extra\\_args: Additional arguments that will be passed directly to the llama model's generate method.
 
         Returns:
@@ -61,14 +344,16 @@ class LlamaModel(Model):
         """
 
         self.interrupted = False
+        self._record_logprobs(None)
         print(prompt)
         if "stream" in extra_args and extra_args["stream"]:
             prompt_message = ""
             for token in tqdm(
                 self._generate_response(prompt, extra_args),
-                total=extra_args["max_tokens"],
+                total=extra_args.get("max_tokens"),
             ):
-                prompt_message += self._extract_prompt_message(token)
+                text = self._extract_prompt_message(token)
+                prompt_message += text
                 if self.pure_callback:
                     token["extras"] = extra_args
                     if "grammar" in token["extras"]:
@@ -78,16 +363,32 @@ class LlamaModel(Model):
                     t.start()
 
                 print(prompt_message)
+                # leaving the loop closes the generator, which ends the generation
+                if self.interrupted or (on_chunk is not None and on_chunk(text)):
+                    break
             return prompt_message
         else:
             tokens = self._generate_response(prompt, extra_args)
             prompt_message = self._extract_prompt_message(tokens)
+            self._record_logprobs((tokens["choices"][0].get("logprobs") or {}).get("token_logprobs"))
             if self.pure_callback:
                 tokens["extras"] = extra_args
                 threading.Thread(target=self.pure_callback, args=(tokens,)).start()
             print(prompt_message)
             return prompt_message
         
+    def _run_streaming(self, prompt, on_chunk, **extra_args):
+        return self._run(prompt, on_chunk=on_chunk, **{**extra_args, "stream": True})
+
+    def _run_batch(self, prompts, max_concurrency: int, **extra_args):
+        """Runs the prompts one after another.
+
+        A llama_cpp Llama holds a single context and the high level API does not expose parallel
+        sequences, so concurrent calls on one model would corrupt each other's state.
+        """
+        with self._batch_lock:
+            return super()._run_batch(prompts, 1, **extra_args)
+
     @staticmethod
     def _extract_prompt_message(tokens):
         tokens['text'] = tokens["choices"][0]["text"]
@@ -113,11 +414,11 @@ class ChatLlamaModel(ChatModel, LlamaModel):
         model (Llama): The llama\\_cpp model used for generating responses.
 
     Methods:
-        _run(messages, **extra\\_args) -> str: Generates a response using the llama model and the llama.cpp create_chat_completion method and returns it as a string.
+        _complete(messages, **extra\\_args) -> str: Generates a response using the llama model and the llama.cpp create_chat_completion method and returns it as a string.
 
     """
 
-    def _run(self, messages, **extra_args):
+    def _complete(self, messages, on_chunk=None, **extra_args):
         """
         Generates a response using the llama model and the llama.cpp create_chat_completion method and returns it as a string.
 
@@ -139,11 +440,14 @@ class ChatLlamaModel(ChatModel, LlamaModel):
         if extra_args["stream"]:
             prompt_message = ""
             for chunk in completion:
-                prompt_message += chunk["choices"][0]["delta"]["content"]
+                text = chunk["choices"][0]["delta"].get("content") or ""
+                prompt_message += text
                 if self.pure_callback:
                     chunk["extras"] = extra_args
                     threading.Thread(target=self.pure_callback, args=(chunk,)).start()
                 print(prompt_message)
+                if self.interrupted or (on_chunk is not None and on_chunk(text)):
+                    break
             return prompt_message
         else:
             prompt_message = completion["choices"][0]["message"]["content"]
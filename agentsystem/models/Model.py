@@ -1,11 +1,28 @@
 from ast import mod
 import os
 import sys
-from typing import Any
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
 
 from openai import AzureOpenAI
 from agentsystem.models.Response import Response
 
+_completion_logprobs = threading.local()
+
+
+@dataclass
+class BatchResult:
+    """The result of one item of a batch run, either a value or the error that item failed with."""
+
+    value: Any = None
+    error: Optional[BaseException] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
 
 class Model:
     """
@@ -16,6 +33,9 @@ class Model:
         run(system\\_message, prompt\\_message, prefix\\_message, **extra\\_args) -> Response[str]: Runs the model with the given parameters and returns a response object containing the result.
     """
 
+    # Constraint formats (see models/grammar/constraints.py) the backend can enforce while generating
+    constraint_formats: tuple[str, ...] = ()
+
     def __init__(self, model, pure_callback=None):
         """
         docstring
@@ -53,6 +73,29 @@ class Model:
         print()
         return Response(lambda: self._run(prompt, **extra_args))
 
+    def stream_run(
+        self, system_message, prompt_message, prefix_message, on_chunk: Callable[[str], bool], **extra_args
+    ) -> "Response":
+        """Runs the model like run, passing every generated chunk of text to on_chunk as it is generated.
+
+        Args:
+            system_message (str): The system message to include in the formatted string.
+            prompt_message (str): The prompt message to include in the formatted string.
+            prefix_message (str): The prefix message to include in the formatted string.
+            on_chunk (Callable[[str], bool]): Receives the chunks, generation stops once it returns True.
+
+        Returns:
+            Response[str]: A response object containing the text generated until the end or the stop.
+        """
+        prompt = self.format(system_message, prompt_message, prefix_message)
+        return Response(lambda: self._run_streaming(prompt, on_chunk, **extra_args))
+
+    def _run_streaming(self, prompt, on_chunk: Callable[[str], bool], **extra_args) -> Any:
+        """Streams the completion to on_chunk. Backends without streaming pass the whole completion as one chunk."""
+        response = self._run(prompt, **extra_args)
+        on_chunk(getattr(response, "content", response) or "")
+        return response
+
     def _run(self, prompt, **extra_args) -> Any:
         """Generates a response using the underlying model implementation and returns it as a string. This method should be implemented by subclasses.
 
@@ -69,6 +112,69 @@ class Model:
         """
         raise NotImplementedError
 
+    def run_batch(
+        self, messages, max_concurrency: int = 8, **extra_args
+    ) -> "list[BatchResult]":
+        """Runs the model on many (system, prompt, prefix) message triples, a failing item does not affect the others.
+
+        Args:
+            messages (List[tuple[str, str, str]]): The system, prompt and prefix message of every item.
+            max_concurrency (int): Maximum number of items generated at once. Defaults to 8.
+            **extra_args: Additional arguments passed to the model for every item.
+
+        Returns:
+            list[BatchResult]: The result of every item, in the order of messages.
+        """
+        prompts = [self.format(*triple) for triple in messages]
+        return self._run_batch(prompts, max_concurrency, **extra_args)
+
+    def _run_batch(self, prompts, max_concurrency: int, **extra_args) -> "list[BatchResult]":
+        """Runs _run for every prompt on up to max_concurrency threads, which suits backends behind HTTP servers
+        that serve parallel requests. Subclasses with a native batch path override this."""
+
+        def run_one(prompt):
+            try:
+                return BatchResult(value=self._run(prompt, **extra_args))
+            except Exception as e:
+                return BatchResult(error=e)
+
+        if max_concurrency <= 1 or len(prompts) <= 1:
+            return [run_one(prompt) for prompt in prompts]
+        with ThreadPoolExecutor(max_workers=min(max_concurrency, len(prompts))) as executor:
+            return list(executor.map(run_one, prompts))
+
+    def identity(self) -> str:
+        """A name of the backend and model that is stable across processes, e.g. to key caches of model outputs."""
+        model = self.model if isinstance(self.model, str) else getattr(self.model, "model_path", "")
+        return f"{type(self).__name__}:{model}"
+
+    def constraint_args(self, constraint) -> dict:
+        """The extra_args that make the backend generate output in the format of constraint.
+
+        Args:
+            constraint (Constraint): A constraint in one of constraint_formats.
+
+        Raises:
+            NotImplementedError: If the backend supports no constraints.
+        """
+        raise NotImplementedError
+
+    def _record_logprobs(self, token_logprobs) -> None:
+        """Stores the mean of the token logprobs of the completion generated on this thread, None if there are none."""
+        values = [value for value in token_logprobs or () if value is not None]
+        logprobs = getattr(_completion_logprobs, "by_model", None)
+        if logprobs is None:
+            logprobs = _completion_logprobs.by_model = {}
+        logprobs[id(self)] = sum(values) / len(values) if values else None
+
+    def last_logprob(self) -> Optional[float]:
+        """The mean token logprob of the last completion this model generated on the calling thread.
+
+        Returns:
+            Optional[float]: None if the backend did not return logprobs, e.g. because they were not requested.
+        """
+        return getattr(_completion_logprobs, "by_model", {}).get(id(self))
+
     def interrupt(self) -> None:
         """Interrupts the current model run, if possible. This method should be implemented by subclasses.
 
@@ -105,6 +211,19 @@ class ChatModel(Model):
         prompt = self.format(messages)
         return Response(lambda: self._run(prompt, **extra_args))
 
+    def run_batch(self, conversations, max_concurrency: int = 8, **extra_args) -> "list[BatchResult]":
+        """Runs the model on many message lists, a failing item does not affect the others.
+
+        Args:
+            conversations (List[List[str]]): The messages of every item.
+            max_concurrency (int): Maximum number of items generated at once. Defaults to 8.
+
+        Returns:
+            list[BatchResult]: The result of every item, in the order of conversations.
+        """
+        prompts = [self.format(messages) for messages in conversations]
+        return self._run_batch(prompts, max_concurrency, **extra_args)
+
 
 class ConsoleInputModel(Model):
     def __init__(self, pure_callback=None):
@@ -9,6 +9,10 @@ class OllamaModel(LlamaModel):
 
     model: str  # Name of the model
     options: ollama.Options = ollama.Options()
+    constraint_formats = ("json_schema",)
+
+    def constraint_args(self, constraint) -> dict:
+        return {"format": constraint.schema}
 
     @classmethod
     def from_model(cls, model: str):
@@ -31,19 +35,28 @@ FROM {model}
         return cls(model_name)
 
     def _generate_response(self, prompt, extra_args):
-        self.options = {**self.options, **extra_args}
-        for key in list(self.options.keys()):
+        # Built per call instead of stored on self, so that batch items running in parallel do not share options
+        options = {**self.options, **extra_args}
+        for key in list(options.keys()):
             if key not in ollama.Options.__annotations__.keys() and key not in [
                 "ignore_eos",
                 "logit_bias",
             ]:
-                self.options.pop(key)
+                options.pop(key)
 
         token = ollama.generate(
-            prompt=prompt, model=self.model, raw=True, stream=True, options=self.options
+            prompt=prompt,
+            model=self.model,
+            raw=True,
+            stream=True,
+            options=options,
+            format=extra_args.get("format", ""),
         )
         return token
 
+    # The Ollama server schedules parallel requests itself (OLLAMA_NUM_PARALLEL), so batches are sent concurrently
+    _run_batch = Model._run_batch
+
     @staticmethod
     def _extract_prompt_message(token):
         token["text"] = token["response"]
@@ -1,9 +1,9 @@
-from typing import Any, Callable
+from typing import Any, Callable, Generic
 
 from annotated_types import T
 
 
-class Response():
+class Response(Generic[T]):
     """Creates a response object with the given resolver function. The resolver function generates the response content when called.
 
         Attributes:
@@ -0,0 +1,81 @@
+"""
+Measures the generation speed of LlamaModel with and without speculative decoding on the refactor templates.
+
+Every template is filled with a source file of this repository, so the expected outputs repeat large
+parts of the prompt. Generation is greedy, so all configurations must produce the same text, the
+benchmark reports whether they did.
+
+Usage:
+    python -m agentsystem.models.benchmark_speculative MODEL.gguf [DRAFT.gguf] [--max-tokens N] [--repeats N]
+"""
+
+import argparse
+import statistics
+import time
+from pathlib import Path
+
+from llama_cpp import Llama
+
+from agentsystem.models.LlamaModel import DraftConfig, LlamaModel
+from agentsystem.templates import refactor_prompt
+
+SOURCE = Path(__file__).parents[1] / "agents" / "voting.py"
+
+
+def refactor_prompts(source: Path = SOURCE) -> dict[str, str]:
+    code = source.read_text()
+    return {
+        "code_splitter_agent": refactor_prompt.code_splitter_agent.format(code=code),
+        "import_resolver_agent": refactor_prompt.import_resolver_agent.format(
+            file_path=f"agentsystem/voting/{source.name}", content=code
+        ),
+    }
+
+
+def measure(model: LlamaModel, prompt: str, max_tokens: int, repeats: int) -> tuple[float, str]:
+    """The median tokens per second of generating a completion of prompt, and the completion."""
+    rates = []
+    text = ""
+    for _ in range(repeats):
+        # the prompt is evaluated again on every run, so no run profits from the KV cache of the previous one
+        model.model.reset()
+        start = time.perf_counter()
+        completion = model.model.create_completion(
+            prompt=model.format("", prompt, ""), max_tokens=max_tokens, temperature=0.0, seed=0
+        )
+        elapsed = time.perf_counter() - start
+        rates.append(completion["usage"]["completion_tokens"] / elapsed)
+        text = completion["choices"][0]["text"]
+    return statistics.median(rates), text
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("model_path")
+    parser.add_argument("draft_model_path", nargs="?")
+    parser.add_argument("--max-tokens", type=int, default=512)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--n-ctx", type=int, default=8192)
+    args = parser.parse_args()
+
+    configurations = {"no draft": None, "prompt lookup": DraftConfig("prompt_lookup")}
+    if args.draft_model_path:
+        configurations["draft model"] = DraftConfig(
+            "model", model_path=args.draft_model_path, model_kwargs={"n_ctx": args.n_ctx}
+        )
+    # drafts are verified with the logits of every position, the baseline computes them as well for a fair comparison
+    model = LlamaModel(Llama(model_path=args.model_path, n_ctx=args.n_ctx, logits_all=True, verbose=False))
+
+    for name, prompt in refactor_prompts().items():
+        baseline_rate = baseline_text = None
+        for configuration, draft in configurations.items():
+            model.use_draft(draft)
+            rate, text = measure(model, prompt, args.max_tokens, args.repeats)
+            if baseline_rate is None:
+                baseline_rate, baseline_text = rate, text
+            same = "same output" if text == baseline_text else "DIFFERENT output"
+            print(f"{name:<22} {configuration:<14} {rate:7.1f} tokens/s  x{rate / baseline_rate:.2f}  {same}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""
+Compiles the regex of a ParsedAgent into a constraint the backend enforces while generating.
+
+llama_cpp models get a GBNF grammar (see README.md) whose output is one or more matches of the
+regex, one per line (patterns that end with a newline already end their line). Ollama and OpenAI get a JSON schema of {"matches": [...]} with the regex as
+pattern of every item. Either way regex.findall on the output gives the same shape of result as
+for free text, so the model no longer has to be re-run when it drifts from the format.
+"""
+
+import functools
+import json
+import re
+from dataclasses import dataclass
+from typing import Any, Literal
+
+try:
+    from re import _constants as sre_constants, _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_constants
+    import sre_parse
+
+ConstraintFormat = Literal["gbnf", "json_schema"]
+
+CATEGORIES = {
+    sre_constants.CATEGORY_DIGIT: ("0-9", False),
+    sre_constants.CATEGORY_NOT_DIGIT: ("0-9", True),
+    sre_constants.CATEGORY_WORD: ("a-zA-Z0-9_", False),
+    sre_constants.CATEGORY_NOT_WORD: ("a-zA-Z0-9_", True),
+    sre_constants.CATEGORY_SPACE: (" \\t\\n\\r\\x0B\\x0C", False),
+    sre_constants.CATEGORY_NOT_SPACE: (" \\t\\n\\r\\x0B\\x0C", True),
+}
+
+
+class UnsupportedConstraint(ValueError):
+    """Raised when a regex uses constructs that have no grammar equivalent, such as lookarounds or backreferences."""
+
+
+@dataclass(frozen=True)
+class Constraint:
+    """A backend native description of the output format, a GBNF grammar or a JSON schema (as JSON)."""
+
+    format: ConstraintFormat
+    value: str
+
+    @property
+    def schema(self) -> dict:
+        return json.loads(self.value)
+
+
+def _char(code: int) -> str:
+    """A code point escaped for GBNF strings and character classes."""
+    char = chr(code)
+    if char.isalnum() or (char.isprintable() and char not in '"\\[]^-' and not char.isspace()) or char == " ":
+        return char
+    return f"\\x{code:02X}" if code < 0x100 else f"\\u{code:04X}" if code < 0x10000 else f"\\U{code:08X}"
+
+
+def _case_variants(low: int, high: int, limit: int = 0x1000) -> list:
+    """The (low, high) runs of the other-case forms of low..high that are outside the range.
+
+    Ranges wider than limit are taken as already closed under case, they are usually written to mean "anything".
+    """
+    if high - low > limit:
+        return []
+    codes = sorted(
+        {
+            ord(variant)
+            for code in range(low, high + 1)
+            for variant in (chr(code).lower(), chr(code).upper())
+            if len(variant) == 1 and not low <= ord(variant) <= high
+        }
+    )
+    runs = []
+    for code in codes:
+        if runs and runs[-1][1] == code - 1:
+            runs[-1][1] = code
+        else:
+            runs.append([code, code])
+    return [tuple(run) for run in runs]
+
+
+class _GrammarBuilder:
+    def __init__(self, flags: int):
+        self.ignore_case = bool(flags & re.IGNORECASE)
+        self.dot_all = bool(flags & re.DOTALL)
+
+    def literal(self, code: int) -> str:
+        char = chr(code)
+        if self.ignore_case and char.lower() != char.upper():
+            return f"[{_char(ord(char.lower()))}{_char(ord(char.upper()))}]"
+        return f'"{_char(code)}"'
+
+    def class_range(self, low: int, high: int) -> str:
+        """The character class body of low..high, plus the other case under IGNORECASE."""
+        runs = [(low, high)] + (_case_variants(low, high) if self.ignore_case else [])
+        return "".join(_char(start) if start == end else f"{_char(start)}-{_char(end)}" for start, end in runs)
+
+    def char_class(self, items) -> str:
+        negate = False
+        parts = []
+        for op, av in items:
+            if op == sre_constants.NEGATE:
+                negate = True
+            elif op == sre_constants.LITERAL:
+                parts.append(self.class_range(av, av))
+            elif op == sre_constants.RANGE:
+                parts.append(self.class_range(*av))
+            elif op == sre_constants.CATEGORY:
+                chars, negated = CATEGORIES[av]
+                if negated:
+                    if len(items) > 1:
+                        raise UnsupportedConstraint(f"negated category {av} inside a character set")
+                    return f"[{'' if negate else '^'}{chars}]"
+                parts.append(chars)
+            else:
+                raise UnsupportedConstraint(f"{op} inside a character set")
+        return f"[{'^' if negate else ''}{''.join(parts)}]"
+
+    def sequence(self, parsed) -> str:
+        return " ".join(filter(None, (self.node(op, av) for op, av in parsed))) or '""'
+
+    def node(self, op, av) -> str:
+        if op == sre_constants.LITERAL:
+            return self.literal(av)
+        if op == sre_constants.NOT_LITERAL:
+            return f"[^{self.class_range(av, av)}]"
+        if op == sre_constants.ANY:
+            return '([^\\n] | "\\n")' if self.dot_all else "[^\\n]"
+        if op == sre_constants.IN:
+            return self.char_class(av)
+        if op == sre_constants.CATEGORY:
+            return self.char_class([(op, av)])
+        if op == sre_constants.AT:
+            if av in (sre_constants.AT_BOUNDARY, sre_constants.AT_NON_BOUNDARY):
+                raise UnsupportedConstraint(f"word boundary {av} depends on the neighbouring characters")
+            # anchors only restrict where a match may start, every generated line is a match
+            return ""
+        if op == sre_constants.SUBPATTERN:
+            return f"({self.sequence(av[-1])})"
+        if op == getattr(sre_constants, "ATOMIC_GROUP", None):
+            return f"({self.sequence(av)})"
+        if op == sre_constants.BRANCH:
+            return "(" + " | ".join(self.sequence(branch) for branch in av[1]) + ")"
+        if op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT, getattr(sre_constants, "POSSESSIVE_REPEAT", None)):
+            low, high, item = av
+            inner = f"({self.sequence(item)})"
+            if high == sre_constants.MAXREPEAT:
+                return inner + {0: "*", 1: "+"}.get(low, f"{{{low},}}")
+            if (low, high) == (0, 1):
+                return inner + "?"
+            return inner + (f"{{{low}}}" if low == high else f"{{{low},{high}}}")
+        raise UnsupportedConstraint(f"{op} has no grammar equivalent")
+
+
+def regex_to_gbnf(pattern: str, flags: int = 0) -> str:
+    """A GBNF grammar for one or more matches of pattern, separated by newlines unless pattern ends with one.
+
+    Raises:
+        UnsupportedConstraint: If the pattern uses lookarounds, word boundaries, backreferences or conditionals.
+    """
+    parsed = sre_parse.parse(pattern, flags)
+    builder = _GrammarBuilder(parsed.state.flags)
+    root = "match+" if _ends_with_newline(parsed) else 'match ("\\n" match)*'
+    return f"root ::= {root}\nmatch ::= {builder.sequence(parsed)}\n"
+
+
+def _ends_with_newline(parsed) -> bool:
+    """Whether every match of the parsed pattern ends with a newline, ignoring trailing anchors."""
+    nodes = [(op, av) for op, av in parsed if op != sre_constants.AT]
+    return bool(nodes) and nodes[-1] == (sre_constants.LITERAL, ord("\n"))
+
+
+def regex_json_schema(pattern: str) -> dict:
+    """A JSON schema of an object holding a non-empty list of strings that match pattern."""
+    return {
+        "type": "object",
+        "properties": {"matches": {"type": "array", "items": {"type": "string", "pattern": pattern}, "minItems": 1}},
+        "required": ["matches"],
+        "additionalProperties": False,
+    }
+
+
+@functools.lru_cache(maxsize=256)
+def regex_constraint(pattern: str, format: ConstraintFormat) -> Constraint:
+    """Compiles pattern into a constraint of the given format, cached per pattern and format.
+
+    Raises:
+        UnsupportedConstraint: If the pattern cannot be expressed in format.
+    """
+    if format == "gbnf":
+        return Constraint(format, regex_to_gbnf(pattern))
+    if format == "json_schema":
+        # validates the pattern, lookarounds are part of the JSON schema pattern dialect
+        re.compile(pattern)
+        return Constraint(format, json.dumps(regex_json_schema(pattern)))
+    raise UnsupportedConstraint(f"unknown constraint format {format}")
+
+
+def parse_constrained(regex: re.Pattern, constraint: "Constraint | None", response: Any) -> list:
+    """Applies regex.findall to a response generated under constraint, or to free text if there is none.
+
+    Args:
+        regex (re.Pattern): The compiled pattern.
+        constraint (Optional[Constraint]): The constraint the response was generated with.
+        response (Any): The model output, a string or a chat message with content.
+
+    Returns:
+        list: The matches, as returned by findall.
+    """
+    text = getattr(response, "content", response) or ""
+    if constraint is not None and constraint.format == "json_schema":
+        try:
+            items = json.loads(text)["matches"]
+        except (ValueError, KeyError, TypeError):
+            return regex.findall(text)
+        return [found for item in items if isinstance(item, str) for found in regex.findall(item)]
+    return regex.findall(text)
@@ -0,0 +1,64 @@
+import json
+import re
+
+import pytest
+
+from agentsystem.models.grammar.constraints import (
+    Constraint,
+    UnsupportedConstraint,
+    parse_constrained,
+    regex_constraint,
+    regex_to_gbnf,
+)
+
+
+def test_regex_to_gbnf_translates_list_items():
+    grammar = regex_to_gbnf(r"\d\. (.*?)[\. ]?\n")
+
+    # the pattern ends every item with a newline, a separator would force blank lines between items
+    assert grammar == (
+        "root ::= match+\n"
+        'match ::= [0-9] "." " " (([^\\n])*) ([. ])? "\\x0A"\n'
+    )
+    assert regex_to_gbnf(r"\w+").startswith('root ::= match ("\\n" match)*\n')
+
+
+def test_regex_to_gbnf_handles_flags_repeats_and_escapes():
+    assert 'match ::= ([yY] [eE] [sS] | [nN] [oO])' in regex_to_gbnf(r"(?i)yes|no")
+    assert "match ::= [A-Z] ([a-zA-Z0-9_\\x2D])+" in regex_to_gbnf(r"[A-Z][\w-]+")
+    assert "(([0-9]){1,3}) \".\" ([0-9]){2,}" in regex_to_gbnf(r"^(\d{1,3})\.\d{2,}$")
+
+
+def test_regex_to_gbnf_rejects_lookarounds():
+    with pytest.raises(UnsupportedConstraint):
+        regex_to_gbnf(r"\w+(?=:)")
+
+
+@pytest.mark.parametrize("pattern", [r"\bcat\b", r"\Bing"])
+def test_regex_to_gbnf_rejects_word_boundaries(pattern):
+    with pytest.raises(UnsupportedConstraint):
+        regex_to_gbnf(pattern)
+
+
+def test_regex_to_gbnf_applies_ignorecase_to_character_sets():
+    assert "match ::= [a-zA-Z] ([0-9_x-zX-Z])+ [^qQ]" in regex_to_gbnf(r"[a-z][\d_x-z]+[^q]", re.IGNORECASE)
+    assert "match ::= [A-Fa-f]" in regex_to_gbnf(r"(?i)[A-F]")
+    assert "match ::= [a-z]" in regex_to_gbnf(r"[a-z]")
+
+
+def test_regex_constraint_is_cached_per_pattern_and_format():
+    gbnf = regex_constraint(r"\d+", "gbnf")
+
+    assert regex_constraint(r"\d+", "gbnf") is gbnf
+    assert regex_constraint(r"\d+", "json_schema").schema["properties"]["matches"]["items"]["pattern"] == r"\d+"
+
+
+def test_parse_constrained_applies_findall_to_json_matches():
+    regex = re.compile(r"(\w+)=(\d+)")
+    constraint = regex_constraint(regex.pattern, "json_schema")
+
+    parsed = parse_constrained(regex, constraint, json.dumps({"matches": ["a=1", "b=2"]}))
+
+    assert parsed == [("a", "1"), ("b", "2")]
+    assert parse_constrained(regex, constraint, "no json, c=3") == [("c", "3")]
+    assert parse_constrained(regex, Constraint("gbnf", ""), "a=1\nb=2") == [("a", "1"), ("b", "2")]
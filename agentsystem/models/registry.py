@@ -0,0 +1,249 @@
+"""
+Process wide registry of local models, so agents share one copy of a GGUF instead of loading their own.
+
+Models are registered by name (or acquired by path) and loaded on first use. Acquiring the same
+path with the same load arguments returns a handle to the same model. Handles are reference
+counted, and when the loaded models exceed the RAM budget the least recently used models that no
+handle holds are unloaded. Load time and resident size of every model are recorded in stats.
+
+LoRA adapters registered for a model are attached to its one loaded copy, so task specializations
+of a base model cost an adapter each instead of a full model load (see LlamaModel.add_adapter).
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+RAM_BUDGET_MB = os.getenv("MODEL_RAM_BUDGET_MB")
+
+
+def resident_bytes() -> int:
+    """The resident set size of this process, 0 where /proc is not available."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def load_llama_model(model_path: str, **kwargs):
+    """Loads a GGUF as LlamaModel, kwargs are passed to llama_cpp.Llama except draft, see LlamaModel.load."""
+    from agentsystem.models.LlamaModel import LlamaModel
+
+    return LlamaModel.load(model_path, **{"verbose": False, **kwargs})
+
+
+@dataclass
+class RegisteredModel:
+    """A model configuration of the registry and, while loaded, the model."""
+
+    name: str
+    model_path: str
+    kwargs: dict
+    model: Any = None
+    refs: int = 0
+    last_used: float = 0.0
+    load_seconds: Optional[float] = None
+    resident_bytes: int = 0
+    loads: int = 0
+    adapters: dict = field(default_factory=dict)
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+
+class ModelHandle:
+    """A counted reference to a registered model. The model is loaded on first access of `model`."""
+
+    def __init__(self, registry: "ModelRegistry", entry: RegisteredModel):
+        self._registry = registry
+        self._entry = entry
+        self.released = False
+
+    @property
+    def name(self) -> str:
+        return self._entry.name
+
+    @property
+    def model(self):
+        """The loaded model, loading it if it is not loaded yet or was evicted."""
+        if self.released:
+            raise RuntimeError(f"The handle of {self.name} was released")
+        return self._registry._use(self._entry)
+
+    def release(self) -> None:
+        """Gives up this reference, the model may be evicted once no handle holds it."""
+        if not self.released:
+            self.released = True
+            self._registry._release(self._entry)
+
+    def __enter__(self) -> "ModelHandle":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.release()
+
+
+class ModelRegistry:
+    """Lazily loaded, shared, reference counted models under a RAM budget."""
+
+    def __init__(
+        self,
+        ram_budget_bytes: Optional[int] = None,
+        loader: Callable[..., Any] = load_llama_model,
+    ):
+        """Creates an empty registry.
+
+        Args:
+            ram_budget_bytes (Optional[int]): Total resident size of the loaded models above which unused
+                models are unloaded. Defaults to no budget.
+            loader (Callable[..., Any]): Loads a model from model_path and keyword arguments. Defaults to LlamaModel.
+        """
+        self.ram_budget_bytes = ram_budget_bytes
+        self.loader = loader
+        self._entries: dict[str, RegisteredModel] = {}
+        self._names: dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(model_path: str, kwargs: dict) -> str:
+        """Models with the same key share one loaded copy."""
+        return json.dumps([os.path.realpath(model_path), kwargs], sort_keys=True, default=repr)
+
+    def register(self, name: str, model_path: str, **kwargs) -> None:
+        """Makes model_path, loaded with kwargs, available as name. Nothing is loaded yet."""
+        with self._lock:
+            self._names[name] = self._entry(name, model_path, kwargs)
+
+    def register_adapter(self, model_name: str, adapter_name: str, adapter_path: str, scale: float = 1.0) -> None:
+        """Adds a LoRA adapter to the registered model model_name, now if it is loaded and on every later load.
+
+        Raises:
+            KeyError: If model_name is not a registered name.
+        """
+        with self._lock:
+            entry = self._entries[self._names[model_name]]
+        with entry.lock:
+            entry.adapters[adapter_name] = (adapter_path, scale)
+            if entry.model is not None:
+                entry.model.add_adapter(adapter_name, adapter_path, scale)
+
+    def _entry(self, name: str, model_path: str, kwargs: dict) -> str:
+        key = self.key(model_path, kwargs)
+        if key not in self._entries:
+            self._entries[key] = RegisteredModel(name, model_path, kwargs)
+        return key
+
+    def acquire(self, name_or_path: str, **kwargs) -> ModelHandle:
+        """A handle to a registered name, or to a model path loaded with kwargs.
+
+        Raises:
+            KeyError: If name_or_path is neither a registered name nor an existing file.
+        """
+        with self._lock:
+            if name_or_path in self._names and not kwargs:
+                key = self._names[name_or_path]
+            elif os.path.exists(name_or_path):
+                key = self._entry(os.path.basename(name_or_path), name_or_path, kwargs)
+            else:
+                raise KeyError(f"{name_or_path} is neither a registered model nor a model file")
+            entry = self._entries[key]
+            entry.refs += 1
+        return ModelHandle(self, entry)
+
+    def _use(self, entry: RegisteredModel):
+        with entry.lock:
+            if entry.model is None:
+                self._load(entry)
+            entry.last_used = time.monotonic()
+            model = entry.model
+        self._evict()
+        return model
+
+    def _load(self, entry: RegisteredModel) -> None:
+        before = resident_bytes()
+        start = time.perf_counter()
+        entry.model = self.loader(entry.model_path, **entry.kwargs)
+        for adapter_name, (adapter_path, scale) in entry.adapters.items():
+            entry.model.add_adapter(adapter_name, adapter_path, scale)
+        entry.load_seconds = time.perf_counter() - start
+        try:
+            file_size = os.path.getsize(entry.model_path)
+        except OSError:
+            file_size = 0
+        # mmapped weights only become resident once they are used, so the file size is the better estimate until then
+        entry.resident_bytes = max(resident_bytes() - before, file_size)
+        entry.loads += 1
+        logger.info(
+            "Loaded %s in %.2fs, %.0f MB resident", entry.name, entry.load_seconds, entry.resident_bytes / 2**20
+        )
+
+    def _release(self, entry: RegisteredModel) -> None:
+        with self._lock:
+            entry.refs = max(entry.refs - 1, 0)
+        self._evict()
+
+    def _evict(self) -> None:
+        if self.ram_budget_bytes is None:
+            return
+        with self._lock:
+            loaded = sorted((e for e in self._entries.values() if e.model is not None), key=lambda e: e.last_used)
+            total = sum(e.resident_bytes for e in loaded)
+            evicted = []
+            for entry in loaded:
+                if total <= self.ram_budget_bytes:
+                    break
+                if entry.refs == 0:
+                    total -= entry.resident_bytes
+                    evicted.append(entry)
+        for entry in evicted:
+            if not self._unload(entry, only_unused=True):
+                total += entry.resident_bytes
+        if total > self.ram_budget_bytes:
+            logger.warning("Models in use take %.0f MB, above the budget", total / 2**20)
+
+    def unload(self, entry: "RegisteredModel | str") -> None:
+        """Unloads a model (by entry or registered name), it is loaded again by the next access of a handle."""
+        if isinstance(entry, str):
+            entry = self._entries[self._names[entry]]
+        self._unload(entry)
+
+    def _unload(self, entry: RegisteredModel, only_unused: bool = False) -> bool:
+        """Unloads entry, with only_unused only if no handle acquired it since it was chosen for eviction."""
+        # acquire counts references under the registry lock and handles load under the entry lock,
+        # holding both means no handle can take the model while it is checked and detached
+        with self._lock, entry.lock:
+            if only_unused and entry.refs:
+                return False
+            model, entry.model = entry.model, None
+        close = getattr(getattr(model, "model", None), "close", None)
+        if callable(close):
+            close()
+        if model is not None:
+            logger.info("Unloaded %s", entry.name)
+        return True
+
+    def stats(self) -> list[dict]:
+        """Name, path, whether loaded, references, load time and resident size of every model."""
+        with self._lock:
+            entries = list(self._entries.values())
+        return [
+            {
+                "name": e.name,
+                "model_path": e.model_path,
+                "loaded": e.model is not None,
+                "refs": e.refs,
+                "loads": e.loads,
+                "load_seconds": e.load_seconds,
+                "resident_bytes": e.resident_bytes,
+                "adapters": list(e.adapters),
+            }
+            for e in entries
+        ]
+
+
+registry = ModelRegistry(int(float(RAM_BUDGET_MB) * 2**20) if RAM_BUDGET_MB else None)
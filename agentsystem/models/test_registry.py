@@ -0,0 +1,129 @@
+import pytest
+
+from agentsystem.models.registry import ModelRegistry
+
+
+class FakeLlama:
+    closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class FakeModel:
+    def __init__(self, model_path, **kwargs):
+        self.model_path = model_path
+        self.kwargs = kwargs
+        self.model = FakeLlama()
+        self.adapters = {}
+
+    def add_adapter(self, name, path, scale=1.0):
+        self.adapters[name] = (path, scale)
+
+
+def gguf(tmp_path, name, megabytes):
+    path = tmp_path / name
+    with open(path, "wb") as f:
+        f.truncate(megabytes * 2**20)
+    return str(path)
+
+
+def test_models_are_loaded_lazily_and_shared(tmp_path):
+    loads = []
+    registry = ModelRegistry(loader=lambda path, **kwargs: loads.append(path) or FakeModel(path, **kwargs))
+    path = gguf(tmp_path, "base.gguf", 1)
+    registry.register("base", path, n_ctx=4096)
+
+    first = registry.acquire("base")
+    second = registry.acquire(path, n_ctx=4096)
+    other = registry.acquire(path, n_ctx=2048)
+    assert loads == []
+
+    assert first.model is second.model
+    assert other.model is not first.model
+    assert loads == [path, path]
+    stats = {(s["name"], s["refs"]) for s in registry.stats()}
+    assert stats == {("base", 2), ("base.gguf", 1)}
+
+
+def test_unused_models_are_evicted_least_recently_used_first(tmp_path):
+    registry = ModelRegistry(ram_budget_bytes=25 * 2**20, loader=FakeModel)
+    for name in "abc":
+        registry.register(name, gguf(tmp_path, f"{name}.gguf", 10))
+
+    a, b = registry.acquire("a"), registry.acquire("b")
+    a_model = a.model
+    b.model
+    a.model
+    a.release()
+    b.release()
+    with registry.acquire("c") as c:
+        c.model
+
+    loaded = {s["name"]: s["loaded"] for s in registry.stats()}
+    assert loaded == {"a": True, "b": False, "c": True}
+    assert not a_model.model.closed
+
+    # models held by a handle are kept even above the budget
+    with registry.acquire("a") as a, registry.acquire("b") as b:
+        a.model
+        b.model
+    stats = {s["name"]: s for s in registry.stats()}
+    assert stats["b"]["loads"] == 2
+    assert stats["b"]["resident_bytes"] >= 10 * 2**20
+    assert stats["b"]["load_seconds"] is not None
+
+
+
+def test_models_acquired_while_being_evicted_are_kept(tmp_path):
+    registry = ModelRegistry(ram_budget_bytes=15 * 2**20, loader=FakeModel)
+    registry.register("a", gguf(tmp_path, "a.gguf", 10))
+    registry.register("b", gguf(tmp_path, "b.gguf", 10))
+    with registry.acquire("a") as a:
+        a_model = a.model
+
+    # another thread acquires "a" after it was chosen for eviction, before it is unloaded
+    handles = []
+    unload = registry._unload
+
+    def acquire_then_unload(entry, **kwargs):
+        handles.append(registry.acquire("a"))
+        return unload(entry, **kwargs)
+
+    registry._unload = acquire_then_unload
+    with registry.acquire("b") as b:
+        b.model
+
+    assert handles[0].model is a_model
+    assert not a_model.model.closed
+
+
+def test_released_handles_and_unknown_models_raise(tmp_path):
+    registry = ModelRegistry(loader=FakeModel)
+    registry.register("a", gguf(tmp_path, "a.gguf", 1))
+    handle = registry.acquire("a")
+    handle.release()
+
+    with pytest.raises(RuntimeError):
+        handle.model
+    with pytest.raises(KeyError):
+        registry.acquire("missing")
+
+
+def test_adapters_are_attached_to_the_shared_model_on_every_load(tmp_path):
+    registry = ModelRegistry(loader=FakeModel)
+    registry.register("base", gguf(tmp_path, "base.gguf", 1))
+    registry.register_adapter("base", "docs", "docs.gguf")
+
+    with registry.acquire("base") as handle:
+        model = handle.model
+        assert model.adapters == {"docs": ("docs.gguf", 1.0)}
+        registry.register_adapter("base", "refactor", "refactor.gguf", scale=0.5)
+        assert model.adapters["refactor"] == ("refactor.gguf", 0.5)
+
+    registry.unload("base")
+    with registry.acquire("base") as handle:
+        assert handle.model is not model
+        assert set(handle.model.adapters) == {"docs", "refactor"}
+    with pytest.raises(KeyError):
+        registry.register_adapter("unknown", "docs", "docs.gguf")
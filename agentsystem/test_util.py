@@ -0,0 +1,159 @@
+from agentsystem.util import get_matched_files_content, iter_matched_files_content, split_by_token_budget
+
+
+def make_tree(tmp_path):
+    (tmp_path / "a.py").write_text("print('a')")
+    (tmp_path / "b.py").write_text("print('b')")
+    (tmp_path / "blob.py").write_bytes(b"\x00\x01binary")
+    (tmp_path / "__pycache__").mkdir()
+    (tmp_path / "__pycache__" / "c.py").write_text("print('c')")
+    (tmp_path / "pkg").mkdir()
+    (tmp_path / "pkg" / "d.py").write_text("x" * 100)
+
+
+def test_get_matched_files_content_skips_binaries_and_ignored_dirs(tmp_path):
+    make_tree(tmp_path)
+
+    content = get_matched_files_content(tmp_path, "**/*.py")
+
+    assert f"{tmp_path / 'a.py'}\n```\nprint('a')\n```\n\n" in content
+    assert "binary" not in content
+    assert "print('c')" not in content
+    assert "x" * 100 in content
+
+
+def test_iter_yields_one_chunk_per_file_and_truncates_large_files(tmp_path):
+    make_tree(tmp_path)
+
+    chunks = list(iter_matched_files_content(tmp_path, "pkg/*.py", max_file_bytes=10))
+
+    assert chunks == [f"{tmp_path / 'pkg' / 'd.py'}\n```\n{'x' * 10}\n... [truncated, 90 more bytes]\n```\n\n"]
+
+
+def test_iter_stops_at_budget(tmp_path):
+    for i in range(20):
+        (tmp_path / f"{i:02}.txt").write_text("y" * 50)
+    first = next(iter_matched_files_content(tmp_path, "*.txt"))
+
+    by_bytes = list(iter_matched_files_content(tmp_path, "*.txt", max_bytes=3 * len(first)))
+    by_tokens = list(
+        iter_matched_files_content(tmp_path, "*.txt", max_tokens=5, token_counter=lambda chunk: 2)
+    )
+
+    assert len(by_bytes) == 3
+    assert len(by_tokens) == 2
+
+
+SOURCE = '''
+class Greeter:
+    """Says hello."""
+
+    greeting = "hello"
+
+    def greet(self, name):
+        """Greets name."""
+        return f"{self.greeting} {name}"
+'''
+
+
+def test_extract_summary_is_cached_until_the_file_changes(tmp_path, monkeypatch):
+    import agentsystem.util as util
+
+    file = tmp_path / "greeter.py"
+    file.write_text(SOURCE)
+    cache = util.ParseCache()
+    parsed = []
+    summarize = util.summarize_source
+    monkeypatch.setattr(util, "summarize_source", lambda s: parsed.append(s) or summarize(s))
+
+    first = util.extract_summary(file, cache=cache)
+    assert util.extract_summary(file, cache=cache) is first
+    file.write_text(SOURCE.replace("hello", "hi"))
+    changed = util.extract_summary(file, cache=cache)
+
+    assert len(parsed) == 2
+    assert first.classes == [
+        ("Greeter", "Says hello.", [("greeting", "'hello'")], [("greet", "Greets name.")])
+    ]
+    assert changed.classes[0][2] == [("greeting", "'hi'")]
+
+
+def test_extract_ast_is_cached_until_the_content_changes(tmp_path, monkeypatch):
+    import os
+
+    import agentsystem.util as util
+
+    file = tmp_path / "greeter.py"
+    file.write_text(SOURCE)
+    cache = util.ParseCache()
+    parsed = []
+    extract = util.extract_source_ast
+    monkeypatch.setattr(util, "extract_source_ast", lambda s: parsed.append(s) or extract(s))
+
+    extractor, tree = util.extract_ast(file, cache=cache)
+    assert util.extract_ast(file, cache=cache)[1] is tree
+    os.utime(file, ns=(0, 0))
+    assert util.extract_ast(file, cache=cache)[1] is tree
+    file.write_text(SOURCE.replace("hello", "hi"))
+    changed, _ = util.extract_ast(file, cache=cache)
+
+    assert len(parsed) == 2
+    assert extractor.classes[0][0] == "Greeter"
+    assert changed.classes[0][2][0][1].value == "hi"
+
+
+def test_parse_cache_is_bounded_and_persists_to_disk(tmp_path):
+    from agentsystem.util import ParseCache, extract_summaries
+
+    files = []
+    for i in range(6):
+        files.append(tmp_path / f"m{i}.py")
+        files[-1].write_text(f"def f{i}():\n    pass\n")
+    cache = ParseCache(max_entries=2, cache_dir=tmp_path / "cache")
+
+    summaries = extract_summaries(files, processes=2, cache=cache)
+    fresh = ParseCache(cache_dir=tmp_path / "cache")
+
+    assert [s.definitions[0].qualified_name for s in summaries.values()] == [f"f{i}" for i in range(6)]
+    assert len(cache._entries) == 2
+    assert fresh.get(files[0]).definitions[0].qualified_name == "f0"
+
+
+CHUNKED_SOURCE = '''import os
+
+
+def small():
+    return 1
+
+
+class Big:
+    """A class that does not fit into one chunk."""
+
+    def first(self):
+        return "first" * 20
+
+    @property
+    def second(self):
+        return "second" * 20
+
+
+def tail():
+    return os.sep
+'''
+
+
+def test_split_by_token_budget_cuts_python_between_statements():
+    chunks = split_by_token_budget(CHUNKED_SOURCE, max_tokens=20)
+
+    assert "".join(chunk.text for chunk in chunks) == CHUNKED_SOURCE
+    assert [(chunk.start_line, chunk.end_line) for chunk in chunks] == [(1, 8), (9, 10), (11, 13), (14, 18), (19, 20)]
+    assert chunks[3].text.lstrip().startswith("@property")
+    assert chunks[2].numbered().splitlines()[0] == "11:     def first(self):"
+
+
+def test_split_by_token_budget_cuts_text_between_paragraphs_and_long_paragraphs_between_lines():
+    text = "one\ntwo\n\nthree\n" + "long line\n" * 6
+
+    chunks = split_by_token_budget(text, max_tokens=6, token_counter=lambda line: len(line.split()))
+
+    assert [chunk.text for chunk in chunks] == ["one\ntwo\n\n", "three\nlong line\nlong line\n", "long line\n" * 3, "long line\n"]
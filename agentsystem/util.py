@@ -1,13 +1,141 @@
 import ast
+import hashlib
+import mmap
+import os
+import pickle
+import re
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
 from pathlib import Path
+from typing import Callable, Iterator, Optional
 
 
-def get_matched_files_content(base_dir, pattern):
+# Directories whose files are never inlined into prompts
+IGNORED_PARTS = {".git", ".hg", ".svn", "__pycache__", "node_modules", ".venv", "venv", ".mypy_cache", ".pytest_cache", ".tox"}
+# Files above this size are read through mmap, so only the inlined prefix is paged in
+MMAP_THRESHOLD = 1 << 20
+
+IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z0-9_]*|\d+")
+CAMEL_CASE_PART = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+")
+
+
+def tokenize_code(text: str) -> list[str]:
+    """Splits text into lowercase tokens, identifiers additionally into their snake_case and camelCase parts.
+
+    Example:
+        >>> tokenize_code("getHTTPResponse(max_len)")
+        ['gethttpresponse', 'get', 'http', 'response', 'max_len', 'max', 'len']
+    """
+    tokens = []
+    for identifier in IDENTIFIER.findall(text):
+        tokens.append(identifier.lower())
+        parts = [
+            part.lower()
+            for word in identifier.split("_")
+            for part in CAMEL_CASE_PART.findall(word)
+        ]
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+
+@dataclass
+class TextChunk:
+    """Lines start_line to end_line (1-based, inclusive) of a text."""
+
+    start_line: int
+    end_line: int
+    text: str
+
+    def numbered(self) -> str:
+        """The lines prefixed with their line number in the whole text, as in document_prompt."""
+        return "\n".join(
+            f"{number}: {line}" for number, line in enumerate(self.text.splitlines(), start=self.start_line)
+        )
+
+
+def _python_boundaries(source: str, line_tokens: list[int], max_tokens: int) -> Optional[set[int]]:
+    """The 0-based lines where a top-level node starts, or a nested one inside nodes larger than max_tokens."""
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError):
+        return None
+    boundaries = set()
+
+    def add(nodes):
+        for node in nodes:
+            start = min([node.lineno] + [decorator.lineno for decorator in getattr(node, "decorator_list", [])]) - 1
+            end = node.end_lineno or node.lineno
+            boundaries.update((start, end))
+            if sum(line_tokens[start:end]) > max_tokens:
+                for field in ("body", "orelse", "handlers", "finalbody"):
+                    children = getattr(node, field, None)
+                    if isinstance(children, list):
+                        add(child for child in children if isinstance(child, ast.stmt | ast.ExceptHandler))
+
+    add(tree.body)
+    return boundaries
+
+
+def split_by_token_budget(
+    text: str,
+    max_tokens: int,
+    token_counter: Callable[[str], int] = lambda text: len(text) // 4,
+) -> list[TextChunk]:
+    """Splits text into chunks of at most max_tokens, cutting on structural boundaries.
+
+    Python sources are cut between statements, descending into classes and functions that do not fit
+    into one chunk, other text between paragraphs. Segments without a boundary that are larger than
+    max_tokens are cut between lines, a single line is never cut.
+
+    Args:
+        text (str): The text.
+        max_tokens (int): Token budget of a chunk.
+        token_counter (Callable[[str], int]): Counts the tokens of a line. Defaults to a 4 characters per token estimate.
+
+    Returns:
+        list[TextChunk]: The chunks in order, covering every line of text.
+    """
+    lines = text.splitlines(keepends=True)
+    if not lines:
+        return []
+    # blank lines are free, so they never end up in a chunk of their own
+    line_tokens = [max(token_counter(line), 1) if line.strip() else 0 for line in lines]
+    boundaries = _python_boundaries(text, line_tokens, max_tokens)
+    if boundaries is None:
+        boundaries = {i for i in range(1, len(lines)) if not lines[i - 1].strip() and lines[i].strip()}
+    cuts = sorted({0, len(lines)} | {i for i in boundaries if 0 < i < len(lines)})
+
+    chunks: list[tuple[int, int]] = []
+    start = end = tokens = 0
+    for segment_start, segment_end in zip(cuts, cuts[1:]):
+        segment_tokens = sum(line_tokens[segment_start:segment_end])
+        if tokens and tokens + segment_tokens > max_tokens:
+            chunks.append((start, end))
+            start, tokens = segment_start, 0
+        if segment_tokens > max_tokens:
+            for line in range(segment_start, segment_end):
+                if tokens and tokens + line_tokens[line] > max_tokens:
+                    chunks.append((start, line))
+                    start, tokens = line, 0
+                tokens += line_tokens[line]
+        else:
+            tokens += segment_tokens
+        end = segment_end
+    chunks.append((start, end))
+    return [TextChunk(start + 1, end, "".join(lines[start:end])) for start, end in chunks]
+
+
+def get_matched_files_content(base_dir, pattern, **limits):
     """Returns the content of all files in base_dir that match pattern as a single string with each file's content separated by triple backticks.
 
     Args:
         base_dir (Path): The directory to search for matching files.
         pattern (str): A glob-style path pattern to use for searching for files.
+        **limits: max_bytes, max_tokens, max_file_bytes and the other options of iter_matched_files_content.
 
     Returns:
         str: The content of all matched files separated by triple backticks.
@@ -19,12 +147,89 @@ def get_matched_files_content(base_dir, pattern):
     print(content)
     ```
     """
-    files = get_matched_files(base_dir, pattern)
-    content = ""
-    for file in files:
-        with open(file, 'r') as f:
-            content += f"{file}\n```\n{f.read()}\n```\n\n"
-    return content
+    return "".join(iter_matched_files_content(base_dir, pattern, **limits))
+
+
+def iter_matched_files_content(
+    base_dir,
+    pattern,
+    max_bytes: Optional[int] = None,
+    max_tokens: Optional[int] = None,
+    token_counter: Callable[[str], int] = lambda text: len(text) // 4,
+    max_file_bytes: int = 256 * 1024,
+    ignored_parts=IGNORED_PARTS,
+    workers: int = 8,
+) -> Iterator[str]:
+    """Yields the content of the files in base_dir that match pattern, one chunk per file, formatted as in get_matched_files_content.
+
+    Files are read ahead in a thread pool and yielded in glob order. Binary files and files below an ignored
+    directory are skipped, files larger than max_file_bytes are cut off with a note. Iteration stops before
+    the chunk that would exceed max_bytes or max_tokens.
+
+    Args:
+        base_dir (Path): The directory to search for matching files.
+        pattern (str): A glob-style path pattern to use for searching for files.
+        max_bytes (Optional[int]): Budget for the UTF-8 size of all yielded chunks. Defaults to no limit.
+        max_tokens (Optional[int]): Budget for the tokens of all yielded chunks. Defaults to no limit.
+        token_counter (Callable[[str], int]): Counts the tokens of a chunk. Defaults to a 4 characters per token estimate.
+        max_file_bytes (int): How much of a single file is inlined. Defaults to 256 KiB.
+        ignored_parts (set[str]): Directory names whose files are skipped.
+        workers (int): Number of reader threads. Defaults to 8.
+
+    Yields:
+        str: The path and the fenced content of one file.
+    """
+    files = (
+        file
+        for file in get_matched_files(base_dir, pattern)
+        if not ignored_parts.intersection(file.parts) and file.is_file()
+    )
+    used_bytes = used_tokens = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        try:
+            while True:
+                # Keep a bounded number of reads in flight so memory does not grow with the directory size
+                while len(pending) < 2 * workers:
+                    file = next(files, None)
+                    if file is None:
+                        break
+                    pending.append((file, executor.submit(_read_text_file, file, max_file_bytes)))
+                if not pending:
+                    return
+                file, future = pending.popleft()
+                content = future.result()
+                if content is None:
+                    continue
+                chunk = f"{file}\n```\n{content}\n```\n\n"
+                used_bytes += len(chunk.encode("utf-8"))
+                if max_tokens is not None:
+                    used_tokens += token_counter(chunk)
+                if (max_bytes is not None and used_bytes > max_bytes) or (
+                    max_tokens is not None and used_tokens > max_tokens
+                ):
+                    return
+                yield chunk
+        finally:
+            for _, future in pending:
+                future.cancel()
+
+
+def _read_text_file(file: Path, max_file_bytes: int) -> Optional[str]:
+    """Reads at most max_file_bytes of file as text, None for binary files."""
+    size = file.stat().st_size
+    with open(file, "rb") as f:
+        if size > MMAP_THRESHOLD:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                data = mapped[:max_file_bytes]
+        else:
+            data = f.read(max_file_bytes)
+    if b"\0" in data[:8192]:
+        return None
+    text = data.decode("utf-8", errors="replace")
+    if size > max_file_bytes:
+        text += f"\n... [truncated, {size - max_file_bytes} more bytes]"
+    return text
 
 
 def get_matched_files(base_dir, pattern):
@@ -32,9 +237,82 @@ def get_matched_files(base_dir, pattern):
     return files
 
 
+@contextmanager
+def file_lock(path):
+    """Holds an exclusive, cross-process lock on the given lock file for the duration of the with block.
+
+    Args:
+        path (Path): The lock file. It is created if it does not exist.
+    """
+    with open(path, "a+b") as handle:
+        if os.name == "nt":
+            import msvcrt
+
+            handle.seek(0)
+            msvcrt.locking(handle.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                handle.seek(0)
+                msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+
+            fcntl.flock(handle, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+@dataclass
+class Definition:
+    """A class, method, function or attribute found by ClassExtractor, with the 1-based line span including decorators."""
+
+    qualified_name: str
+    kind: str
+    start_line: int
+    end_line: int
+    docstring: Optional[str] = None
+    signature: Optional[str] = None
+
+
 class ClassExtractor(ast.NodeVisitor):
     def __init__(self):
         self.classes = []
+        self.definitions: list[Definition] = []
+        self._scope: list[ast.AST] = []
+
+    def _add_definition(self, node, kind, name=None, signature=None):
+        qualified_name = ".".join([parent.name for parent in self._scope] + [name or node.name])
+        start_line = min([node.lineno] + [d.lineno for d in getattr(node, "decorator_list", [])])
+        docstring = None if kind == "attribute" else ast.get_docstring(node)
+        self.definitions.append(
+            Definition(qualified_name, kind, start_line, node.end_lineno, docstring, signature)
+        )
+
+    def visit_Assign(self, node):
+        # Only module and class level assignments are attributes, assignments in functions are locals
+        if self._scope and not isinstance(self._scope[-1], ast.ClassDef):
+            return
+        targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+        for target in targets:
+            if isinstance(target, ast.Name):
+                self._add_definition(node, "attribute", target.id, ast.unparse(node).split("\n")[0])
+
+    visit_AnnAssign = visit_Assign
+
+    def visit_FunctionDef(self, node):
+        in_class = bool(self._scope) and isinstance(self._scope[-1], ast.ClassDef)
+        prefix = "async def" if isinstance(node, ast.AsyncFunctionDef) else "def"
+        returns = f" -> {ast.unparse(node.returns)}" if node.returns else ""
+        signature = f"{prefix} {node.name}({ast.unparse(node.args)}){returns}"
+        self._add_definition(node, "method" if in_class else "function", signature=signature)
+        self._scope.append(node)
+        self.generic_visit(node)
+        self._scope.pop()
+
+    visit_AsyncFunctionDef = visit_FunctionDef
 
     def visit_ClassDef(self, node):
         # Get the class name
@@ -45,7 +323,7 @@ class ClassExtractor(ast.NodeVisitor):
         attributes = []
         methods = []
         for statement in node.body:
-            if isinstance(statement, ast.Assign):
+            if isinstance(statement, ast.Assign) and isinstance(statement.targets[0], ast.Name):
                 # Get the attribute name and value
                 attr_name = statement.targets[0].id
                 attr_value = statement.value
@@ -57,8 +335,12 @@ class ClassExtractor(ast.NodeVisitor):
                 methods.append((method_name, method_docstring))
         # Store the class information
         self.classes.append((name, docstring, attributes, methods))
+        bases = ", ".join(ast.unparse(base) for base in node.bases + node.keywords)
+        self._add_definition(node, "class", signature=f"class {name}({bases})" if bases else f"class {name}")
         # Continue visiting the child nodes
+        self._scope.append(node)
         self.generic_visit(node)
+        self._scope.pop()
 
 
 #question = "What is the purpose of this class? How could it be improved or extended?"
@@ -66,7 +348,7 @@ class ClassExtractor(ast.NodeVisitor):
 
 def python_code_prompt_gen(file, question):
     # Parse the source code
-    extractor = extract_ast(file)
+    extractor = extract_summary(file)
 
     # Print the extracted classes and their docstrings
     # for name, docstring, attributes, methods in extractor.classes:
@@ -82,8 +364,20 @@ def python_code_prompt_gen(file, question):
     # Print the prompt
     return prompts
 
-def extract_ast(file):
-    source = open(file).read()
+
+def python_code_prompts(files, question, processes: Optional[int] = None):
+    """Like python_code_prompt_gen for many files, parsing the files that are not cached in parallel.
+
+    Returns:
+        dict[Path, list[str]]: The prompts of every file.
+    """
+    return {
+        file: list(prompt_from_source(summary, question))
+        for file, summary in extract_summaries(files, processes=processes).items()
+    }
+
+
+def extract_source_ast(source):
     tree = ast.parse(source)
 
     # Create an instance of the class extractor
@@ -94,6 +388,162 @@ def extract_ast(file):
     return extractor, tree
 
 
+@dataclass
+class ModuleSummary:
+    """What ClassExtractor found in a module, without AST nodes so it is cheap to pickle and cache.
+
+    `classes` has the shape of ClassExtractor.classes, with attribute values as source strings.
+    """
+
+    classes: list
+    definitions: list[Definition]
+
+
+def summarize_source(source) -> ModuleSummary:
+    extractor, _ = extract_source_ast(source)
+    classes = [
+        (name, docstring, [(attr, ast.unparse(value)) for attr, value in attributes], methods)
+        for name, docstring, attributes, methods in extractor.classes
+    ]
+    return ModuleSummary(classes, extractor.definitions)
+
+
+def _read_stamped(file):
+    """Returns the (mtime, size) stamp, content hash and content of file."""
+    stat = os.stat(file)
+    with open(file, "rb") as f:
+        data = f.read()
+    return (stat.st_mtime_ns, stat.st_size), hashlib.blake2b(data, digest_size=16).hexdigest(), data
+
+
+def _summarize_file(file):
+    """Reads and summarizes file, returning the stat stamp and content hash the summary belongs to."""
+    stamp, digest, data = _read_stamped(file)
+    return stamp, digest, summarize_source(data)
+
+
+class ParseCache:
+    """
+    Bounded LRU cache of module summaries keyed by path.
+
+    An entry is reused while the file's mtime and size are unchanged. Otherwise the file is re-read and only
+    re-parsed if its content hash changed. With a cache_dir, summaries are also pickled to disk under their
+    content hash, so they survive the process and are shared between paths with identical content.
+    The full ASTs handed out by get_ast are kept in memory only, in a second LRU of the same size.
+    """
+
+    def __init__(self, max_entries: int = 1024, cache_dir=None):
+        self.max_entries = max_entries
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self._entries: OrderedDict = OrderedDict()
+        self._asts: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, file) -> Optional[ModuleSummary]:
+        """Returns the cached summary of file if its content did not change since, else None."""
+        key = Path(file).resolve()
+        stat = key.stat()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] == (stat.st_mtime_ns, stat.st_size):
+                self._entries.move_to_end(key)
+                return entry[2]
+        if entry or self.cache_dir:
+            stamp, digest, _ = _read_stamped(key)
+            summary = entry[2] if entry and digest == entry[1] else self.load_from_disk(digest)
+            if summary is not None:
+                self.put(key, stamp, digest, summary)
+                return summary
+        return None
+
+    def put(self, file, stamp, digest, summary: ModuleSummary) -> None:
+        self._store(self._entries, Path(file).resolve(), (stamp, digest, summary))
+
+    def get_ast(self, file):
+        """Returns the (ClassExtractor, ast.Module) of file, re-parsing only when its content hash changed."""
+        key = Path(file).resolve()
+        stat = key.stat()
+        with self._lock:
+            entry = self._asts.get(key)
+            if entry and entry[0] == (stat.st_mtime_ns, stat.st_size):
+                self._asts.move_to_end(key)
+                return entry[2]
+        stamp, digest, data = _read_stamped(key)
+        parsed = entry[2] if entry and digest == entry[1] else extract_source_ast(data)
+        self._store(self._asts, key, (stamp, digest, parsed))
+        return parsed
+
+    def _store(self, entries: OrderedDict, key, entry) -> None:
+        with self._lock:
+            entries[key] = entry
+            entries.move_to_end(key)
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+
+    def load_from_disk(self, digest) -> Optional[ModuleSummary]:
+        if not self.cache_dir:
+            return None
+        try:
+            with open(self.cache_dir / f"{digest}.pkl", "rb") as f:
+                return pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+
+    def save_to_disk(self, digest, summary: ModuleSummary) -> None:
+        if not self.cache_dir:
+            return
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp = self.cache_dir / f"{digest}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump(summary, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self.cache_dir / f"{digest}.pkl")
+
+
+PARSE_CACHE = ParseCache()
+
+
+def extract_summary(file, cache: ParseCache = PARSE_CACHE) -> ModuleSummary:
+    """Returns the summary of a Python file, parsing it only if it changed since the last call."""
+    return extract_summaries([file], cache=cache)[file]
+
+
+def extract_ast(file, cache: ParseCache = PARSE_CACHE):
+    """Returns the ClassExtractor and AST of a Python file, parsing it only if it changed since the last call.
+
+    The result is shared with other callers of the same cache and must not be modified.
+    """
+    return cache.get_ast(file)
+
+
+def extract_summaries(
+    files, processes: Optional[int] = None, cache: ParseCache = PARSE_CACHE
+) -> dict:
+    """Summarizes many Python files, parsing the files that are not cached across a process pool.
+
+    Args:
+        files (Iterable[Path]): The Python files.
+        processes (Optional[int]): Number of worker processes. Defaults to the CPU count, a handful of misses are parsed in-process.
+        cache (ParseCache): The cache to use. Defaults to the process wide PARSE_CACHE.
+
+    Returns:
+        dict[Path, ModuleSummary]: The summary of every file, keyed as given.
+    """
+    files = list(files)
+    summaries = {file: cache.get(file) for file in files}
+    misses = [file for file, summary in summaries.items() if summary is None]
+    if len(misses) > 4 and processes != 1:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            results = executor.map(_summarize_file, misses, chunksize=8)
+            parsed = list(zip(misses, results))
+    else:
+        parsed = [(file, _summarize_file(file)) for file in misses]
+    for file, (stamp, digest, summary) in parsed:
+        cache.put(file, stamp, digest, summary)
+        cache.save_to_disk(digest, summary)
+        summaries[file] = summary
+    return summaries
+
+
 def prompt_from_source(extractor, question):
     for name, docstring, attributes, methods in extractor.classes:
         prompt = ""